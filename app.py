@@ -3,23 +3,127 @@ AI Text Generation Studio
 Generates different types of text content using Groq API
 """
 
+import os  # For finding the CSS file next to this script
+import threading  # For warming up connections in the background
+import time  # For the rerun timer
+import re  # For checking the history key read from the cookie
+import secrets  # For creating history keys that can't be guessed
 import streamlit as st  # Import Streamlit library
-from utils.api_handler import generate_text  # Import text generation function
-from config.settings import CONTENT_TYPES, TONE_OPTIONS, LENGTH_OPTIONS  # Import settings
-from utils.text_processor import count_words  # Import word counting function
+import streamlit.components.v1 as components  # For setting the history cookie in the browser
+from utils.api_handler import generate_text, generate_versions, stream_text, warm_up, metrics, get_traffic_stats  # Import text generation functions
+from utils.resilience import GenerationError  # Import failed stream error
+from config.settings import CONTENT_TYPES, TONE_OPTIONS, LENGTH_OPTIONS, HISTORY_BACKEND, HISTORY_PAGE_SIZE, METRICS_PORT, VERSION_SIMILARITY_THRESHOLD, LONGFORM_CONTENT_TYPES, WARM_UP_ON_START, SPECULATIVE_DEBOUNCE_SECONDS, EXPORT_SERVER_SAVE, HISTORY_RETENTION_DAYS, HISTORY_COOKIE_NAME  # Import settings
+from utils.text_processor import analyze_text  # Import text statistics function
+from utils.history_store import HistoryStore, SessionHistory  # Import history storage
+from utils.metrics import start_metrics_server  # Import Prometheus exporter
+from utils.file_exporter import EXPORT_FORMATS, DOWNLOAD_FORMATS, DownloadCache, ExportTooLargeError, build_export, export_filename, record_metadata, save_export_async  # Import history export and downloads
+from utils.similarity import pairwise_similarity  # Import version comparison
+from utils.longform import uses_longform, generate_long_text, section_heading  # Import outline-based generation
+from utils.speculation import Speculator  # Import background generation before the click
+
+# Start time of this run, used by the rerun timer at the bottom of the page
+run_started = time.perf_counter()
+
+
+@st.cache_resource
+def read_css():
+    """Reads the CSS file once per server process, every rerun reuses the text"""
+    # Relative to this file, so the app also works when started from another folder
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "style.css"), encoding="utf-8") as f:
+        return f.read()
 
 
 def load_css():
     """Loads CSS file and applies it to Streamlit"""
-    with open("assets/style.css") as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+    st.markdown(f"<style>{read_css()}</style>", unsafe_allow_html=True)
 
 
-# Initialize session state - runs when app first opens
-# If there's no list named history in session_state, create one
-# This list will store all generated texts
-if 'history' not in st.session_state:
-    st.session_state.history = []  # Start with empty list
+def format_ms(value):
+    """Formats milliseconds for the performance panel, or a dash if nothing was measured"""
+    return "–" if value is None else f"{value:.0f} ms"
+
+
+def show_rerun_time(label, started):
+    """
+    Shows how long a rerun took, only while the performance panel is on
+
+    Args:
+        label (str): Which part of the page was rerun
+        started (float): time.perf_counter() at the start of the rerun
+    """
+    if st.session_state.get('show_performance'):
+        st.caption(f"⏱️ {label} rerun: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+@st.cache_resource
+def get_history_store():
+    """Opens the history database once and shares it between all sessions"""
+    return HistoryStore()
+
+
+def history_key():
+    """
+    Returns the secret key of this browser's saved history
+
+    Anyone with the key can read and clear the history, so it is kept in a
+    cookie of this browser and never in the page URL, which gets shared.
+    A browser without a valid cookie gets a new random key.
+
+    Returns:
+        str: 32 hex characters
+    """
+    key = st.context.cookies.get(HISTORY_COOKIE_NAME, "")
+    if re.fullmatch(r"[0-9a-f]{32}", key):
+        return key
+    return secrets.token_hex(16)
+
+
+def remember_history_key(key):
+    """
+    Saves the history key in a browser cookie, so reloading the page keeps the same history
+
+    Streamlit can read cookies but not set them, so a tiny script sets it
+    on the page. The cookie lasts as long as the texts are kept.
+
+    Args:
+        key (str): Key from history_key(), only hex characters
+    """
+    max_age = (HISTORY_RETENTION_DAYS or 365) * 24 * 60 * 60
+    components.html(
+        f"<script>parent.document.cookie = '{HISTORY_COOKIE_NAME}={key}; "
+        f"max-age={max_age}; path=/; SameSite=Strict';</script>",
+        height=0
+    )
+
+
+@st.cache_resource
+def get_download_cache():
+    """Creates the download file cache once and shares it between all sessions"""
+    return DownloadCache()
+
+
+@st.cache_resource
+def start_metrics_exporter():
+    """Starts the /metrics endpoint once per server process, if a port is configured"""
+    if METRICS_PORT is None:
+        return None
+    return start_metrics_server(metrics, METRICS_PORT)
+
+
+@st.cache_resource
+def start_warm_up():
+    """
+    Opens the provider connections once per server process
+
+    Runs in the background, so the first page load doesn't wait for it.
+    The first generation then finds a connection already open.
+    """
+    if not WARM_UP_ON_START:
+        return None
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
 
 # Page configuration - this should always be at the top
 st.set_page_config(
@@ -28,6 +132,43 @@ st.set_page_config(
     layout="wide"  # Page width should be wide
 )
 
+# History is saved in a database so it survives page reloads
+# With the "memory" backend each session keeps a size-limited history of its own
+if HISTORY_BACKEND == "memory":
+    if 'history' not in st.session_state:
+        st.session_state.history = SessionHistory()
+    history = st.session_state.history
+else:
+    history = get_history_store()
+
+# Prometheus endpoint for generation metrics (off unless METRICS_PORT is set)
+start_metrics_exporter()
+
+# Connect to the providers before anyone clicks generate
+start_warm_up()
+
+# Initialize session id - runs when app first opens
+# The id is the secret history key of this browser, kept in a cookie so reloading keeps the same history
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = history_key()
+    remember_history_key(st.session_state.session_id)
+    # Older versions put the key in the URL, remove it so the link can be shared safely
+    if "session" in st.query_params:
+        del st.query_params["session"]
+
+# Background generation of this session, see the "Start early" checkbox
+if 'speculator' not in st.session_state:
+    st.session_state.speculator = Speculator(generate_text)
+
+# Downloads the user asked for, widget key -> file format
+# Other download buttons don't carry their file, see lazy_download
+if 'prepared_downloads' not in st.session_state:
+    st.session_state.prepared_downloads = {}
+
+# Initialize history page number, 0 is the newest page
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
+
 # Load CSS file
 load_css()
 
@@ -40,260 +181,695 @@ st.markdown("Create professional text content using Groq AI")
 # Horizontal line - for visual separation
 st.divider()
 
-# Get topic input from user
-# text_area creates multi-line text box
-user_prompt = st.text_area(
-    label="What topic would you like to generate text about?",
-    placeholder="Example: Write a blog post about artificial intelligence...",
-    height=100
-)
+# ============================================================================
+# PAGE SECTIONS
+# ============================================================================
+# Each section is a fragment: a widget inside a fragment reruns only that
+# fragment instead of the whole script. Typing a topic doesn't rebuild the
+# history cards, and paging through history doesn't touch the generator.
+# Actions that change another section call st.rerun() to refresh the page.
+
+
+def prepare_download(key, format_key):
+    """Remembers that the user wants a download, the file is built when the section is drawn again"""
+    st.session_state.prepared_downloads[key] = st.session_state[format_key]
+
+
+def forget_download(key):
+    """Goes back to the prepare button once the file was downloaded"""
+    st.session_state.prepared_downloads.pop(key, None)
+
+
+def lazy_download(key, text, file_base, metadata=None, format_key=None):
+    """
+    Download control whose file is only built when the user asks for it
+
+    A download_button hands its whole file to the server's media store on
+    every rerun, so a page of history cards would store every text again
+    and again. Here the page only has a small button. The file is built, or
+    taken from the shared download cache, after the button is clicked.
+
+    Args:
+        key (str): Unique widget key of this control
+        text (str): Text to download
+        file_base (str): File name without extension
+        metadata (dict): Settings put into Markdown and JSON files
+        format_key (str): Key of a format selectbox shared by several controls,
+                          None shows a selectbox of this control's own
+    """
+    download_format = st.session_state.prepared_downloads.get(key)
+    if download_format is None:
+        if format_key is None:
+            format_key = f"{key}_format"
+            st.selectbox("Download format", list(DOWNLOAD_FORMATS.keys()), key=format_key,
+                         label_visibility="collapsed")
+        st.button("📦 Prepare download", key=f"{key}_prepare", on_click=prepare_download,
+                  args=(key, format_key), use_container_width=True)
+        return
+
+    extension, mime = DOWNLOAD_FORMATS[download_format]
+    st.download_button(
+        label=f"💾 Download {download_format}",
+        data=get_download_cache().get(text, download_format, metadata),
+        file_name=f"{file_base}.{extension}",
+        mime=mime,
+        key=f"{key}_download",
+        on_click=forget_download,
+        args=(key,),
+        use_container_width=True
+    )
 
-# Selectbox creates dropdown menu
-# User selects text type
-content_type = st.selectbox(
-    label="Select Content Type",
-    options=list(CONTENT_TYPES.keys())  # Convert dictionary keys to list
-)
 
-# Show description of selected type
-st.info(f"📝 {CONTENT_TYPES[content_type]}")
+def render_results(results):
+    """
+    Shows the texts of the last generation
+
+    Args:
+        results (dict): content_type, length range, {version number: text},
+                        {version number: failed GenerationResult} and
+                        {version number: similarity} of reused texts
+    """
+    min_words, max_words = results['length']
+    texts = results['texts']
+    errors = results['errors']
+    numbers = sorted([*texts, *errors])
+
+    if len(numbers) == 1:
+        st.markdown("### 📝 Generated Text:")
+
+    # Warn when versions are almost the same, they don't give the user a real choice
+    if results.get('similar'):
+        pairs = ", ".join(f"{first} & {second} ({score:.0%})" for first, second, score in results['similar'])
+        st.warning(
+            f"⚠️ Some versions are almost the same: {pairs}. "
+            "Try 🔄 Fresh variation or another tone for more different versions."
+        )
+
+    # Multiple versions are shown side by side
+    # columns function determines how many columns we want
+    cols = st.columns(len(numbers))
+    for col, number in zip(cols, numbers):
+        with col:
+            if len(numbers) > 1:
+                # Version heading, shows which version it is
+                st.markdown(f"#### 📄 Version {number}")
+
+            # Failed versions only show why, there is nothing to count or download
+            if number in errors:
+                show_failure(errors[number])
+                continue
+
+            # Show generated text
+            generated_text = texts[number]
+            st.write(generated_text)
+            if number in results.get('reused', {}):
+                show_reuse(results['reused'][number])
+
+            # Calculate and show word count
+            # analyze_text remembers results, so reruns don't count again
+            word_count = analyze_text(generated_text)['words']
+            st.metric(
+                label="📊 Word Count",
+                value=f"{word_count} words",
+                delta=f"Target: {min_words}-{max_words}"
+            )
 
-# Tone selection with radio buttons
-# horizontal=True arranges buttons horizontally
-tone = st.radio(
-    label="Select Tone",
-    options=list(TONE_OPTIONS.keys()),
-    horizontal=True
-)
+            # Separate download for each version
+            # Version number added to filename to avoid confusion
+            lazy_download(
+                f"result_{number}",
+                generated_text,
+                f"{results['content_type'].replace(' ', '_')}_" + ("text" if len(numbers) == 1 else f"v{number}"),
+                {'content_type': results['content_type'], 'version': number}
+            )
 
-# Show description of selected tone
-st.caption(f"💬 {TONE_OPTIONS[tone]}")
 
-# Length selection with select slider
-length_choice = st.select_slider(
-    label="Text Length",
-    options=list(LENGTH_OPTIONS.keys())
-)
+def show_failure(result):
+    """
+    Shows why a generation failed
+
+    Args:
+        result (GenerationResult): Failed result
+    """
+    st.error(f"❌ {result.error}")
+    if result.retryable:
+        st.caption("This looks temporary, try again in a moment.")
+
+
+def show_reuse(similarity):
+    """
+    Says that a text was written for an almost identical earlier prompt
+
+    Args:
+        similarity (float): Similarity of the two prompts (0-1)
+    """
+    st.caption(f"♻️ Reused the text of an almost identical earlier prompt ({similarity:.0%} similar). "
+               "Tick \"Fresh variation\" to write a new one.")
+
+
+@st.fragment(run_every=SPECULATIVE_DEBOUNCE_SECONDS / 3)
+def speculation_timer():
+    """
+    Starts the early text once the inputs have settled and shows its progress
+
+    Reruns on a timer while "Start early" is on. A tick that arrives after
+    the checkbox was turned off does nothing.
+    """
+    if not st.session_state.get('speculate'):
+        return
+    speculator = st.session_state.speculator
+    if speculator.ready():
+        speculator.start()
+
+    state = speculator.state()
+    if state == Speculator.RUNNING:
+        st.caption("⚡ Preparing the text in the background...")
+    elif state == Speculator.READY:
+        st.caption("⚡ Text is ready, click Generate to see it")
+
+
+@st.fragment
+def generation_section():
+    """Inputs, the generate button and the generated texts"""
+    started = time.perf_counter()
+
+    # Get topic input from user
+    # text_area creates multi-line text box
+    user_prompt = st.text_area(
+        label="What topic would you like to generate text about?",
+        placeholder="Example: Write a blog post about artificial intelligence...",
+        height=100
+    )
 
-# Show word range of selected length
-min_words, max_words = LENGTH_OPTIONS[length_choice]  # Get values from tuple
-st.caption(f"📏 Approximately {min_words}-{max_words} words")
-
-# How many versions to generate?
-# number_input is used for number entry
-# min_value and max_value set minimum and maximum values
-# value is the default value
-num_versions = st.number_input(
-    label="How many different versions to generate?",
-    min_value=1,
-    max_value=3,
-    value=1,
-    help="Increase to see different variations on the same topic"
-)
+    # Selectbox creates dropdown menu
+    # User selects text type
+    content_type = st.selectbox(
+        label="Select Content Type",
+        options=list(CONTENT_TYPES.keys())  # Convert dictionary keys to list
+    )
 
-# Add spacing
-st.write("")
+    # Show description of selected type
+    st.info(f"📝 {CONTENT_TYPES[content_type]}")
 
-# Create button
-# primary type makes button blue and highlighted
-generate_button = st.button(
-    label="🚀 Generate Text",
-    type="primary",
-    use_container_width=True  # Button should span page width
-)
+    # Tone selection with radio buttons
+    # horizontal=True arranges buttons horizontally
+    tone = st.radio(
+        label="Select Tone",
+        options=list(TONE_OPTIONS.keys()),
+        horizontal=True
+    )
+
+    # Show description of selected tone
+    st.caption(f"💬 {TONE_OPTIONS[tone]}")
+
+    # Length selection with select slider
+    length_choice = st.select_slider(
+        label="Text Length",
+        options=list(LENGTH_OPTIONS.keys())
+    )
 
-# Control what happens when button is clicked
-if generate_button:
-    # Check if user entered text
-    if not user_prompt:
-        st.warning("⚠️ Please enter a topic!")  # Yellow warning message
-    else:
-        # Show success message
-        st.success(f"✅ Generating {num_versions} different version(s)...")
-
-        # If multiple versions requested, create columns
-        # Columns create side-by-side boxes, each version appears in its own column
-        if num_versions > 1:
-            # columns function determines how many columns we want
-            # Creates num_versions columns, so 2 versions = 2 columns
-            cols = st.columns(num_versions)
-
-        # Start loop for each version
-        # range(num_versions) generates numbers from 0 to num_versions
-        # For example if num_versions=3, i values will be 0, 1, 2
-        for i in range(num_versions):
-            # Generate each version separately
-            # Loading indicator shows user which version is being generated
-            with st.spinner(f"✨ Generating version {i + 1}..."):
-                # Call API and generate text
-                # A new API call is made in each loop
+    # Show word range of selected length
+    min_words, max_words = LENGTH_OPTIONS[length_choice]  # Get values from tuple
+    st.caption(f"📏 Approximately {min_words}-{max_words} words")
+
+    # How many versions to generate?
+    # number_input is used for number entry
+    # min_value and max_value set minimum and maximum values
+    # value is the default value
+    num_versions = st.number_input(
+        label="How many different versions to generate?",
+        min_value=1,
+        max_value=3,
+        value=1,
+        help="Increase to see different variations on the same topic"
+    )
+
+    # Cached results are reused for identical requests
+    # This checkbox asks the AI for a brand new text instead
+    fresh_variation = st.checkbox(
+        label="🔄 Fresh variation",
+        value=False,
+        help="Skip saved results and generate a new text even if the same request was made before"
+    )
+
+    # Long blog posts and stories can be planned first and written section by section
+    # The sections are generated at the same time, so the text is ready much sooner
+    longform = False
+    if uses_longform(content_type, LENGTH_OPTIONS[length_choice]):
+        longform = st.checkbox(
+            label="📑 Write from an outline",
+            value=True,
+            help="Plan the text first, then write its sections in parallel. Used when generating 1 version"
+        )
+
+    # Start generating in the background once the inputs stop changing
+    # Clicking the button then shows the text right away or soon after
+    speculate = st.checkbox(
+        label="⚡ Start early",
+        value=False,
+        key="speculate",
+        help="Generate the text in the background while you choose, so it is ready sooner. "
+             "Used when generating 1 version without an outline"
+    )
+
+    # Request that the button would send, None when it can't be generated early
+    # Arguments are in generate_text order, so the speculator can call it directly
+    request = (
+        user_prompt,  # Topic entered by user
+        CONTENT_TYPES[content_type],  # Description of selected type
+        TONE_OPTIONS[tone],  # Description of selected tone
+        LENGTH_OPTIONS[length_choice],  # Min-max values of selected length
+        not fresh_variation  # Skip cache when user wants a new variation
+    )
+    speculator = st.session_state.speculator
+    can_speculate = speculate and user_prompt and num_versions == 1 and not longform
+    speculator.update(request if can_speculate else None)
+    if speculate:
+        speculation_timer()
+
+    # Add spacing
+    st.write("")
+
+    # Create button
+    # primary type makes button blue and highlighted
+    generate_button = st.button(
+        label="🚀 Generate Text",
+        type="primary",
+        use_container_width=True  # Button should span page width
+    )
+
+    # Control what happens when button is clicked
+    if generate_button:
+        # Check if user entered text
+        if not user_prompt:
+            st.warning("⚠️ Please enter a topic!")  # Yellow warning message
+        else:
+            # Show success message
+            st.success(f"✅ Generating {num_versions} different version(s)...")
+            texts = {}  # Version number -> generated text
+            errors = {}  # Version number -> failed GenerationResult
+            reused = {}  # Version number -> similarity, for texts of an almost identical earlier prompt
+
+            if num_versions == 1 and longform:
+                # Outline first, then every section is shown as soon as it is written
+                st.markdown("### 📝 Generated Text:")
+                headings = LONGFORM_CONTENT_TYPES[content_type]
+                status = st.empty()
+                status.info("🗂️ Planning sections...")
+                placeholders = []
+
+                events = generate_long_text(
+                    user_prompt,
+                    CONTENT_TYPES[content_type],
+                    TONE_OPTIONS[tone],
+                    LENGTH_OPTIONS[length_choice],
+                    use_cache=not fresh_variation,
+                    headings=headings
+                )
+                for event in events:
+                    if event[0] == "outline":
+                        _, title, plans = event
+                        status.empty()
+                        if headings and title:
+                            st.markdown(f"#### {title}")
+                        # One loading message per planned section
+                        for plan in plans:
+                            placeholder = st.empty()
+                            placeholder.info(f"✨ Writing: {section_heading(plan)}...")
+                            placeholders.append(placeholder)
+                    elif event[0] == "section":
+                        _, i, section_text = event
+                        with placeholders[i].container():
+                            if headings:
+                                st.markdown(f"##### {section_heading(plans[i])}")
+                            st.write(section_text)
+                    else:
+                        # "done" carries the result of the whole text
+                        result = event[1]
+                        if result.ok:
+                            texts[1] = result.text
+                        else:
+                            errors[1] = result
+            elif num_versions == 1:
+                st.markdown("### 📝 Generated Text:")
+
+                # Take over the text started in the background, if it was for these inputs
+                early = speculator.adopt(request)
+                if early is not None:
+                    with st.spinner("⚡ Finishing the text started early..."):
+                        result = early.result()
+                    if result.ok:
+                        texts[1] = result.text
+                        st.write(result.text)
+                        if result.similarity is not None:
+                            reused[1] = result.similarity
+
+                # Single version is streamed
+                # Words appear on the page while the text is still being generated
+                # A failed early text is tried again here too
+                if 1 not in texts:
+                    # write_stream shows each piece as it arrives and returns the full text at the end
+                    def remember_reuse(similarity):
+                        reused[1] = similarity
+
+                    try:
+                        texts[1] = st.write_stream(stream_text(*request[:4], use_cache=request[4], on_reuse=remember_reuse))
+                    except GenerationError as e:
+                        # Text stopped before it was finished, the part shown so far is dropped
+                        errors[1] = e.result
+            else:
+                # Put a placeholder into each column
+                # Placeholder shows a loading message until that version's result arrives
+                cols = st.columns(num_versions)
+                placeholders = []
+                for i in range(num_versions):
+                    placeholder = cols[i].empty()
+                    placeholder.info(f"✨ Generating version {i + 1}...")
+                    placeholders.append(placeholder)
+
+                # Send all version requests at once
+                # Each result is shown as soon as it arrives, not in version order
                 # Each version will be slightly different due to temperature
-                generated_text = generate_text(
+                versions = generate_versions(
                     user_prompt,  # Topic entered by user
                     CONTENT_TYPES[content_type],  # Description of selected type
                     TONE_OPTIONS[tone],  # Description of selected tone
-                    LENGTH_OPTIONS[length_choice]  # Min-max values of selected length
+                    LENGTH_OPTIONS[length_choice],  # Min-max values of selected length
+                    num_versions,
+                    use_cache=not fresh_variation  # Skip cache when user wants a new variation
                 )
-
-            # If multiple versions, show each version in its own column
-            # If single version, show in normal flow
-            if num_versions > 1:
-                # cols[i] selects the i-th column
-                # Everything inside with block appears in that column
-                with cols[i]:
-                    # Add generated text to history
-                    # Save each text as dictionary so we know what settings were used
-                    st.session_state.history.append({
-                        'prompt': user_prompt,  # Topic written by user
-                        'content_type': content_type,  # Text type
-                        'tone': tone,  # Tone
-                        'length': length_choice,  # Length
-                        'text': generated_text,  # Generated text
-                        'version': i + 1  # Which version
-                    })
-
-                    # Version heading, shows which version it is
-                    st.markdown(f"#### 📄 Version {i + 1}")
-                    # Show generated text
-                    st.write(generated_text)
-
-                    # Calculate and show word count
-                    word_count = count_words(generated_text)
-                    st.metric(
-                        label="📊 Word Count",
-                        value=f"{word_count} words",
-                        delta=f"Target: {min_words}-{max_words}"
-                    )
-
-                    # Separate download button for each version
-                    # Version number added to filename to avoid confusion
-                    st.download_button(
-                        label="💾 Download",
-                        data=generated_text,
-                        file_name=f"{content_type.replace(' ', '_')}_v{i + 1}.txt",
-                        mime="text/plain",
-                        use_container_width=True
-                    )
-            else:
-                # Add to history for single version
-                st.session_state.history.append({
-                    'prompt': user_prompt,
-                    'content_type': content_type,
-                    'tone': tone,
-                    'length': length_choice,
-                    'text': generated_text,
-                    'version': 1  # Single version
+                for i, result in versions:
+                    # Replace loading message with the result
+                    with placeholders[i].container():
+                        st.markdown(f"#### 📄 Version {i + 1}")
+                        if result.ok:
+                            texts[i + 1] = result.text
+                            st.write(result.text)
+                            if result.similarity is not None:
+                                reused[i + 1] = result.similarity
+                        else:
+                            errors[i + 1] = result
+                            show_failure(result)
+
+            # Add generated texts to history, failed versions are not saved
+            # Save each text as dictionary so we know what settings were used
+            for number, generated_text in sorted(texts.items()):
+                history.add(st.session_state.session_id, {
+                    'prompt': user_prompt,  # Topic written by user
+                    'content_type': content_type,  # Text type
+                    'tone': tone,  # Tone
+                    'length': length_choice,  # Length
+                    'text': generated_text,  # Generated text
+                    'version': number  # Which version
                 })
 
-                # For single version, show in old layout
-                st.markdown("### 📝 Generated Text:")
-                st.write(generated_text)
-
-                # Calculate and show word count
-                word_count = count_words(generated_text)
-                st.metric(
-                    label="📊 Word Count",
-                    value=f"{word_count} words",
-                    delta=f"Target: {min_words}-{max_words}"
-                )
+            # Compare the generated versions with each other
+            numbers = sorted(texts)
+            similar = [
+                (numbers[a], numbers[b], score)
+                for a, b, score in pairwise_similarity([texts[n] for n in numbers], VERSION_SIMILARITY_THRESHOLD)
+            ]
 
-                # Download button
-                st.download_button(
-                    label="💾 Download Text (TXT)",
-                    data=generated_text,
-                    file_name=f"{content_type.replace(' ', '_')}_text.txt",
-                    mime="text/plain",
-                    use_container_width=True
-                )
+            # Downloads prepared for the previous texts don't belong to the new ones
+            for key in [key for key in st.session_state.prepared_downloads if key.startswith("result_")]:
+                del st.session_state.prepared_downloads[key]
 
-# ============================================================================
-# SIDEBAR - TEXT HISTORY PANEL
-# ============================================================================
+            # Keep the results, so later reruns of this section still show them
+            st.session_state.last_results = {
+                'content_type': content_type,
+                'length': (min_words, max_words),
+                'texts': texts,
+                'errors': errors,
+                'reused': reused,
+                'similar': similar
+            }
+            # Rerun the whole page so the history sidebar shows the new texts
+            st.rerun()
 
-# Sidebar title and description
-# sidebar creates panel that opens on left side
-st.sidebar.title("📚 Text History")
-st.sidebar.markdown("All your generated texts are stored here")
+    elif 'last_results' in st.session_state:
+        render_results(st.session_state.last_results)
+
+    show_rerun_time("Generator", started)
+
+
+def go_to_page(step):
+    """Moves the history list one page back (-1) or forward (+1)"""
+    st.session_state.history_page += step
+
+
+def clear_history():
+    """Deletes every text of this session"""
+    history.clear(st.session_state.session_id)
+    st.session_state.history_page = 0
+    # Prepared downloads of the deleted texts aren't needed anymore
+    for key in [key for key in st.session_state.prepared_downloads if key.startswith("download_")]:
+        del st.session_state.prepared_downloads[key]
+
+
+@st.fragment
+def history_panel():
+    """Sidebar list of saved texts with filters, paging and export"""
+    started = time.perf_counter()
+
+    # Sidebar title and description
+    # This function is called inside "with st.sidebar", so st.* goes to the sidebar
+    st.title("📚 Text History")
+    st.markdown("All your generated texts are stored here")
+
+    # Count all texts of this session, only a number is read from the database
+    total_count = history.count(st.session_state.session_id)
+
+    # If there are no texts in history, show informative message
+    if total_count == 0:
+        st.info("You haven't generated any texts yet. Generated texts will appear here.")
+        show_rerun_time("History", started)
+        return
 
-# If there are no texts in history, show informative message
-# len function gives list length, 0 means list is empty
-if len(st.session_state.history) == 0:
-    st.sidebar.info("You haven't generated any texts yet. Generated texts will appear here.")
-else:
     # Show how many texts are in history
     # This shows user how much content they've generated
-    st.sidebar.success(f"Total {len(st.session_state.history)} text(s) generated")
+    st.success(f"Total {total_count} text(s) generated")
 
     # Add clear button
     # This button is for clearing all history
-    if st.sidebar.button("🗑️ Clear History", use_container_width=True):
-        # Empty history list
-        # clear function deletes all elements from list
-        st.session_state.history.clear()
-        # Refresh page so change is immediately visible
-        # rerun function reloads the page
-        st.rerun()
-
-    st.sidebar.divider()  # Add horizontal line for visual separation
-
-    # Create card for each text in history
-    # enumerate function provides both index and element
-    # reversed reverses history so most recently generated appears at top
-    for idx, item in enumerate(reversed(st.session_state.history)):
+    # on_click runs before this section is drawn again, so the list is already empty
+    st.button("🗑️ Clear History", on_click=clear_history, use_container_width=True)
+
+    # Show how much server memory this session's history uses
+    if HISTORY_BACKEND == "memory":
+        footprint = history.footprint()
+        st.caption(
+            f"💾 {footprint['bytes'] / 1024:.1f} KB of {footprint['cap_bytes'] / 1024:.0f} KB used"
+            + (f", {footprint['evicted']} oldest text(s) removed" if footprint['evicted'] else "")
+        )
+
+    st.divider()  # Add horizontal line for visual separation
+
+    # Filters and search
+    # Empty selection means "all"
+    search = st.text_input("🔍 Search", placeholder="Words in topic or text", key="history_search")
+    filter_type = st.selectbox("Type", ["All"] + list(CONTENT_TYPES.keys()), key="history_type")
+    filter_tone = st.selectbox("Tone", ["All"] + list(TONE_OPTIONS.keys()), key="history_tone")
+
+    filters = {
+        'content_type': None if filter_type == "All" else filter_type,
+        'tone': None if filter_tone == "All" else filter_tone,
+        'search': search
+    }
+
+    # Work out how many pages there are
+    # Page number is kept inside the valid range when filters shrink the result
+    matching_count = history.count(st.session_state.session_id, **filters)
+    page_count = max(1, (matching_count + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE)
+    st.session_state.history_page = min(st.session_state.history_page, page_count - 1)
+
+    # Previous / next page buttons
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    prev_col.button("◀", disabled=st.session_state.history_page == 0, key="history_prev",
+                    on_click=go_to_page, args=(-1,))
+    page_col.caption(f"Page {st.session_state.history_page + 1} of {page_count}")
+    next_col.button("▶", disabled=st.session_state.history_page >= page_count - 1, key="history_next",
+                    on_click=go_to_page, args=(1,))
+
+    if matching_count == 0:
+        st.caption("No texts match these filters.")
+
+    # One format choice for all history downloads keeps the cards small
+    st.selectbox("Download format", list(DOWNLOAD_FORMATS.keys()), key="history_download_format")
+
+    # Load only the texts on the current page, newest first
+    page_items = history.page(
+        st.session_state.session_id,
+        offset=st.session_state.history_page * HISTORY_PAGE_SIZE,
+        limit=HISTORY_PAGE_SIZE,
+        **filters
+    )
+
+    # Create card for each text on this page
+    for item in page_items:
         # Show each text in an expander
         # expander creates clickable, expandable/collapsible boxes
         # Show first 30 characters of prompt in title so user knows what it is
-        with st.sidebar.expander(
-            f"📄 {item['prompt'][:30]}..." if len(item['prompt']) > 30 else f"📄 {item['prompt']}",
+        with st.expander(
+            f"📄 {item.prompt[:30]}..." if len(item.prompt) > 30 else f"📄 {item.prompt}",
             expanded=False  # Initially closed, opens when user clicks
         ):
             # Show text information
             # caption creates small gray text, ideal for metadata
-            st.caption(f"**Type:** {item['content_type']}")
-            st.caption(f"**Tone:** {item['tone']}")
-            st.caption(f"**Length:** {item['length']}")
-            st.caption(f"**Version:** {item['version']}")
+            st.caption(f"**Type:** {item.content_type}")
+            st.caption(f"**Tone:** {item.tone}")
+            st.caption(f"**Length:** {item.length}")
+            st.caption(f"**Version:** {item.version}")
 
             # Small spacing
             st.write("")
 
+            # Read text once, compressed texts are unpacked on every read
+            item_text = item.text
+
             # Show text but in truncated form
             # Showing long texts scrolls sidebar too much, first 150 characters sufficient
-            preview = item['text'][:150] + "..." if len(item['text']) > 150 else item['text']
+            preview = item_text[:150] + "..." if len(item_text) > 150 else item_text
             st.text_area(
                 label="Text Preview",
                 value=preview,
                 height=100,
                 disabled=True,  # disabled=True makes text non-editable, read-only
-                key=f"preview_{idx}"  # Each text_area must have unique key
+                key=f"preview_{item.id}"  # Each text_area must have unique key
             )
 
             # View full text button
             # When user clicks, full text will appear on main page
-            if st.button(f"👁️ View Full Text", key=f"view_{idx}", use_container_width=True):
+            if st.button(f"👁️ View Full Text", key=f"view_{item.id}", use_container_width=True):
                 # Create variable named selected_text in session_state
                 # This variable holds which text to display
                 st.session_state.selected_text = item
-                st.rerun()  # Refresh page so it appears on main page
-
-            # Download button
-            # Provide download option for each history text too
-            st.download_button(
-                label="💾 Download",
-                data=item['text'],
-                file_name=f"{item['content_type'].replace(' ', '_')}_v{item['version']}.txt",
-                mime="text/plain",
-                key=f"download_{idx}",  # Each button must have unique key
-                use_container_width=True
+                # The viewer is outside this section, so the whole page is refreshed
+                st.rerun()
+
+            # Download option for each history text too
+            # The file is only built after "Prepare download" is clicked
+            lazy_download(
+                f"download_{item.id}",  # Each control must have unique key
+                item_text,
+                f"{item.content_type.replace(' ', '_')}_v{item.version}",
+                record_metadata(item),
+                format_key="history_download_format"
             )
 
-# ============================================================================
-# SHOW SELECTED TEXT ON MAIN PAGE
-# ============================================================================
+    # Export the whole history, or only the texts matching the filters
+    # Like single downloads, the file is only built after the user asks for it
+    with st.expander("📦 Export History", expanded=False):
+        export_format = st.selectbox("Format", list(EXPORT_FORMATS.keys()), key="export_format")
+        only_matching = st.checkbox("Only texts matching the filters", key="export_filtered")
+
+        # The export is only built in the run where the button was clicked and isn't kept in the session,
+        # so the next rerun, e.g. after a download or a filter change, frees its memory again
+        if st.button("📦 Prepare export", key="export_prepare", use_container_width=True):
+            records = history.iter_records(st.session_state.session_id, **(filters if only_matching else {}))
+            try:
+                st.download_button(
+                    label=f"💾 Download {export_format} export",
+                    data=build_export(records, export_format),
+                    file_name=export_filename(export_format),
+                    mime=EXPORT_FORMATS[export_format][2],
+                    key="export_download_button",
+                    use_container_width=True
+                )
+            except ExportTooLargeError as e:
+                st.error(f"{e}, tick \"Only texts matching the filters\" to export less.")
+
+        # Saving on the server is off unless EXPORT_SERVER_SAVE is set
+        # The file is written in the background, and old exports are deleted afterwards
+        if EXPORT_SERVER_SAVE:
+            if st.button("🗄️ Save export on server", key="export_start", use_container_width=True):
+                records = history.iter_records(st.session_state.session_id, **(filters if only_matching else {}))
+                st.session_state.export_future = save_export_async(records, export_format)
+
+            # Show the state of the last export of this session
+            export_future = st.session_state.get('export_future')
+            if export_future is not None:
+                if not export_future.done():
+                    st.info("⏳ Export is being written...")
+                elif export_future.exception() is not None:
+                    st.error(f"Export failed: {export_future.exception()}")
+                else:
+                    st.success(f"Saved to {export_future.result()}")
+
+    show_rerun_time("History", started)
+
+
+def performance_panel():
+    """
+    Optional sidebar panel with timings of generation calls on this server
+
+    Not a fragment: turning it on reruns the whole page, so every section
+    shows its rerun time.
+    """
+    st.divider()
+    if not st.toggle("⚡ Performance panel", key="show_performance"):
+        return
+
+    summary = metrics.summary()
+    traffic = get_traffic_stats()
+
+    if summary['calls'] == 0:
+        st.caption("No generation calls yet.")
+        return
+
+    quantiles = summary['quantiles']
+    st.caption(
+        f"**Calls:** {summary['calls']} · **Errors:** {summary['errors']} · "
+        f"**Retries:** {summary['retries']} · **Cache hits:** {summary['cache_hits']}"
+    )
+    # p50 is the typical call, p95 shows the slow tail
+    for label, name in [("Total", "total_ms"), ("First byte", "ttfb_ms"),
+                        ("First token", "ttft_ms"), ("Connect", "connect_ms")]:
+        st.caption(
+            f"**{label}:** p50 {format_ms(quantiles[name]['p50'])} · p95 {format_ms(quantiles[name]['p95'])}"
+        )
+
+    limiter = traffic['rate_limiter']
+    st.caption(
+        f"**Rate limit queue:** {limiter['queue_depth']} waiting · "
+        f"average wait {limiter['average_wait_seconds'] * 1000:.0f} ms"
+    )
+
+    # Health of every provider, requests go to the fastest healthy one
+    # 🔴 open circuit: requests skip the provider, 🟡 half-open: one probe request is testing it
+    circuit_icons = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}
+    for name, provider in traffic['providers'].items():
+        st.caption(
+            f"**{name}:** {circuit_icons[provider['circuit']]} · "
+            f"p50 {format_ms(provider['full_p50_ms'])} · "
+            f"errors {provider['error_rate'] * 100:.0f}%"
+        )
+
+    # Most recent calls, newest first
+    # A markdown table is enough here and doesn't need the dataframe machinery
+    rows = ["| ms | provider | cache | status | retries | tokens |", "|---:|---|---|---|---:|---:|"]
+    for call in reversed(summary['recent'][-10:]):
+        rows.append(
+            f"| {call['total_ms']:.0f} | {call.get('provider') or '–'} | {call['cache']} | {call['status']} | "
+            f"{call['retries']} | {call.get('completion_tokens') or '–'} |"
+        )
+    st.markdown("\n".join(rows))
+
+
+def close_selected_text():
+    """Hides the selected text viewer"""
+    # del command completely removes a variable
+    del st.session_state.selected_text
+
+
+@st.fragment
+def selected_text_viewer():
+    """Full view of a text picked from history"""
+    # If selected_text exists in session_state, means user wants to view a text
+    if 'selected_text' not in st.session_state:
+        return
+    started = time.perf_counter()
+    selected = st.session_state.selected_text
 
-# If user selected text from history, show it on main page
-# If selected_text exists in session_state, means user wants to view a text
-if 'selected_text' in st.session_state:
     # Show selected text on main page
     st.divider()  # Line for visual separation
     st.subheader("📖 Selected Text")
@@ -302,32 +878,57 @@ if 'selected_text' in st.session_state:
     # Create three columns, information appears side by side
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.caption(f"**Type:** {st.session_state.selected_text['content_type']}")
+        st.caption(f"**Type:** {selected.content_type}")
     with col2:
-        st.caption(f"**Tone:** {st.session_state.selected_text['tone']}")
+        st.caption(f"**Tone:** {selected.tone}")
     with col3:
-        st.caption(f"**Length:** {st.session_state.selected_text['length']}")
+        st.caption(f"**Length:** {selected.length}")
 
     # Show full text
-    st.write(st.session_state.selected_text['text'])
-
-    # Word count
-    word_count = count_words(st.session_state.selected_text['text'])
-    st.metric(label="📊 Word Count", value=f"{word_count} words")
+    # Read once, compressed texts are unpacked on every read
+    selected_text = selected.text
+    st.write(selected_text)
+
+    # Word count and other statistics
+    # analyze_text remembers results, so reruns don't analyze the same text again
+    stats = analyze_text(selected_text)
+    st.metric(label="📊 Word Count", value=f"{stats['words']} words")
+    st.caption(
+        f"{stats['sentences']} sentences · {stats['paragraphs']} paragraphs · "
+        f"readability {stats['readability']}"
+    )
 
-    # Download button
-    st.download_button(
-        label="💾 Download This Text",
-        data=st.session_state.selected_text['text'],
-        file_name=f"{st.session_state.selected_text['content_type'].replace(' ', '_')}_selected.txt",
-        mime="text/plain",
-        use_container_width=True
+    # Download, built only when asked for like the history downloads
+    lazy_download(
+        f"selected_{selected.id}",
+        selected_text,
+        f"{selected.content_type.replace(' ', '_')}_selected",
+        record_metadata(selected)
     )
 
     # Close button
     # User saw text, may want to close it
-    if st.button("❌ Close", type="secondary"):
-        # Delete selected_text variable from session_state
-        # del command completely removes a variable
-        del st.session_state.selected_text
-        st.rerun()  # Refresh page
\ No newline at end of file
+    # on_click removes the text before this section is drawn again
+    st.button("❌ Close", type="secondary", on_click=close_selected_text)
+
+    show_rerun_time("Viewer", started)
+
+
+# ============================================================================
+# PAGE LAYOUT
+# ============================================================================
+
+generation_section()
+
+# Sidebar sections
+# sidebar creates panel that opens on left side
+with st.sidebar:
+    history_panel()
+    performance_panel()
+
+# If user selected text from history, show it on main page
+selected_text_viewer()
+
+# Time of the whole script run, fragment reruns show their own times
+with st.sidebar:
+    show_rerun_time("Full page", run_started)
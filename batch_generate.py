@@ -0,0 +1,229 @@
+"""
+Batch Text Generation
+Generates many texts from a JSONL file without the Streamlit interface
+
+Each input line is a JSON object like:
+    {"id": "p1", "prompt": "Wireless earbuds", "content_type": "Product Description",
+     "tone": "Friendly", "length": "Short"}
+
+Usage:
+    python batch_generate.py prompts.jsonl results.jsonl --workers 8
+
+Results are appended to the output file as soon as each row finishes.
+If the run stops, starting the same command again skips finished rows.
+"""
+
+import argparse  # For command line arguments
+import json  # For reading and writing JSONL
+import os
+import sys
+import time  # For throughput calculation
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED  # For bounded concurrency
+from config.settings import CONTENT_TYPES, TONE_OPTIONS, LENGTH_OPTIONS, BATCH_WORKERS
+from utils.api_handler import generate_text
+from utils.text_processor import count_words
+
+
+def read_rows(input_path):
+    """
+    Reads prompt rows from a JSONL file
+
+    A line that isn't a JSON object doesn't stop the batch. It becomes a
+    row with an "invalid_line" message, which is written to the output as
+    an invalid row.
+
+    Args:
+        input_path (str): Input file path
+
+    Yields:
+        dict: One row with an "id" key, line number is used if id is missing
+    """
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue  # Skip empty lines
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"id": line_number, "invalid_line": f"Line {line_number} is not valid JSON: {e.msg}"}
+                continue
+            if not isinstance(row, dict):
+                yield {"id": line_number, "invalid_line": f"Line {line_number} is not a JSON object"}
+                continue
+            row.setdefault("id", line_number)
+            yield row
+
+
+def load_finished_ids(output_path):
+    """
+    Finds rows that were already completed in a previous run
+
+    The output file itself is the checkpoint. A crash can leave a half
+    written last line, so lines that aren't valid JSON are ignored.
+
+    Args:
+        output_path (str): Output file path
+
+    Returns:
+        set: ids of rows that don't need to run again
+    """
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Failed rows are tried again, invalid rows would fail the same way again
+            if result.get("status") in ("ok", "invalid"):
+                finished.add(str(result["id"]))
+            else:
+                finished.discard(str(result["id"]))
+    return finished
+
+
+def process_row(row, use_cache):
+    """
+    Generates text for one row
+
+    Args:
+        row (dict): Input row
+        use_cache (bool): Whether cached results can be used
+
+    Returns:
+        dict: Output row with text and status
+    """
+    # Line of the input file that couldn't be read
+    if "invalid_line" in row:
+        return {"id": row["id"], "status": "invalid", "error": row["invalid_line"]}
+
+    # Fill missing options with the first choice, same as the app's defaults
+    content_type = row.get("content_type", next(iter(CONTENT_TYPES)))
+    tone = row.get("tone", next(iter(TONE_OPTIONS)))
+    length = row.get("length", next(iter(LENGTH_OPTIONS)))
+
+    result = {
+        "id": row["id"],
+        "prompt": row.get("prompt", ""),
+        "content_type": content_type,
+        "tone": tone,
+        "length": length
+    }
+
+    # Check row before spending an API call on it
+    if not result["prompt"]:
+        return {**result, "status": "invalid", "error": "Missing prompt"}
+    if content_type not in CONTENT_TYPES:
+        return {**result, "status": "invalid", "error": f"Unknown content type: {content_type}"}
+    if tone not in TONE_OPTIONS:
+        return {**result, "status": "invalid", "error": f"Unknown tone: {tone}"}
+    if length not in LENGTH_OPTIONS:
+        return {**result, "status": "invalid", "error": f"Unknown length: {length}"}
+
+    generation = generate_text(
+        result["prompt"],
+        CONTENT_TYPES[content_type],
+        TONE_OPTIONS[tone],
+        LENGTH_OPTIONS[length],
+        use_cache=use_cache
+    )
+
+    if not generation.ok:
+        # retryable tells whether the row is likely to work on the next run
+        return {**result, "status": "error", "error": generation.error, "retryable": generation.retryable}
+    result = {**result, "status": "ok", "text": generation.text, "word_count": count_words(generation.text)}
+    if generation.similarity is not None:
+        # Text was written for an almost identical earlier prompt, not for this row
+        result["reused_similarity"] = generation.similarity
+    return result
+
+
+def run_batch(input_path, output_path, workers=BATCH_WORKERS, use_cache=True):
+    """
+    Runs every unfinished row with bounded concurrency
+
+    Only a limited number of rows are in flight at once, so memory stays
+    small even for very large input files.
+
+    Args:
+        input_path (str): Input JSONL file
+        output_path (str): Output JSONL file, results are appended
+        workers (int): Number of requests sent at the same time
+        use_cache (bool): Whether cached results can be used
+
+    Returns:
+        dict: Number of ok, error and invalid rows in this run
+    """
+    finished = load_finished_ids(output_path)
+    counts = {"ok": 0, "error": 0, "invalid": 0}
+    started = time.time()
+
+    # If the last run crashed in the middle of a line, start on a new line
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+        if needs_newline:
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    rows = (row for row in read_rows(input_path) if str(row["id"]) not in finished)
+
+    with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+
+        def write_done(done):
+            """Writes finished results and prints progress"""
+            for future in done:
+                result = future.result()
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                counts[result["status"]] += 1
+            output.flush()  # Each finished row is saved right away
+
+            total = sum(counts.values())
+            minutes = (time.time() - started) / 60
+            rate = total / minutes if minutes > 0 else 0
+            print(f"\r{total} rows done ({counts['error']} errors), {rate:.1f} rows/min",
+                  end="", file=sys.stderr)
+
+        for row in rows:
+            # Keep at most two rows per worker waiting, so input is read lazily
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write_done(done)
+            pending.add(executor.submit(process_row, row, use_cache))
+
+        # Wait for the last rows
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            write_done(done)
+
+    print(file=sys.stderr)
+    return counts
+
+
+def main():
+    """Reads command line arguments and starts the batch"""
+    parser = argparse.ArgumentParser(description="Generate texts for every row of a JSONL file")
+    parser.add_argument("input", help="JSONL file with prompt, content_type, tone and length")
+    parser.add_argument("output", help="JSONL file where results are appended")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="Number of requests sent at the same time")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Generate fresh texts even for requests that were cached before")
+    args = parser.parse_args()
+
+    counts = run_batch(args.input, args.output, workers=args.workers, use_cache=not args.no_cache)
+    print(f"Finished: {counts['ok']} ok, {counts['error']} errors, {counts['invalid']} invalid")
+
+    # Non-zero exit code tells scripts that some rows failed and can be retried
+    if counts["error"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Generation Benchmark
+Measures generate_text and stream_text against a local mock Groq server
+
+No real API quota is used. Results are saved as JSON so two versions of
+the code can be compared.
+
+Usage:
+    python benchmark.py --requests 60 --concurrency 6 --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+"""
+
+import argparse  # For command line arguments
+import asyncio  # For the async call mode
+import json  # For saving results
+import os
+import platform
+import subprocess  # For reading the current git commit
+import sys
+import time  # For measuring latency
+from concurrent.futures import ThreadPoolExecutor  # For the threaded call mode
+from datetime import datetime
+from utils.mock_server import MockGroqServer
+from utils.resilience import GenerationError
+
+MODES = ("sequential", "threaded", "async")
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of a list of numbers
+
+    Args:
+        values (list): Measured values
+        percent (float): Percentile between 0 and 100
+
+    Returns:
+        float: Percentile value, or None for an empty list
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, round(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def use_mock_provider(api, url, rate_limited):
+    """
+    Sends every generation of api_handler to the mock server only
+
+    The live registry may hold real providers, e.g. xAI when XAI_API_KEY
+    is set, so it is replaced instead of changed.
+
+    Args:
+        api (module): utils.api_handler
+        url (str): Chat completions endpoint of the mock server
+        rate_limited (bool): Whether requests wait for the app's rate limiter
+    """
+    from utils.providers import Provider, ProviderRegistry
+
+    mock_client = api.GroqClient(
+        api_url=url, api_key=None,
+        rate_limiter=api.rate_limiter if rate_limited else None
+    )
+    api.provider_registry = ProviderRegistry([Provider("mock", mock_client)])
+    api.client = mock_client
+
+
+def use_fresh_caches(api):
+    """
+    Gives api_handler empty in-memory caches for the run
+
+    Results are stored even with use_cache=False, so without this the
+    mock texts would push real answers out of the on-disk cache.
+
+    Args:
+        api (module): utils.api_handler
+    """
+    from utils.response_cache import ResponseCache
+    from utils.similarity import NearDuplicateIndex
+
+    api.response_cache = ResponseCache(db_path=None)
+    api.prompt_index = NearDuplicateIndex()
+
+
+def one_call(api, index, stream):
+    """
+    Runs one generation and measures it
+
+    Args:
+        api (module): utils.api_handler
+        index (int): Request number, makes every prompt unique so nothing is cached or coalesced
+        stream (bool): Whether to use stream_text instead of generate_text
+
+    Returns:
+        dict: latency, time to first token (seconds) and whether it failed
+    """
+    args = (f"Benchmark prompt {index}", "Blog Post", "Professional", (300, 500))
+    started = time.perf_counter()
+
+    if stream:
+        first_token = None
+        failed = False
+        try:
+            for _ in api.stream_text(*args, use_cache=False):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+        except api.GenerationError:
+            failed = True
+    else:
+        failed = not api.generate_text(*args, use_cache=False).ok
+        first_token = None  # Whole text arrives at once
+
+    latency = time.perf_counter() - started
+    return {
+        "latency": latency,
+        "ttft": first_token if first_token is not None else latency,
+        "error": failed
+    }
+
+
+async def one_call_async(generator, index, stream):
+    """
+    Runs one generation on the event loop and measures it, see one_call
+
+    Args:
+        generator (AsyncGenerator): Async generation client of utils.async_api
+        index (int): Request number, makes every prompt unique so nothing is cached or coalesced
+        stream (bool): Whether to use stream_text instead of generate_text
+
+    Returns:
+        dict: latency, time to first token (seconds) and whether it failed
+    """
+    args = (f"Benchmark prompt {index}", "Blog Post", "Professional", (300, 500))
+    started = time.perf_counter()
+
+    if stream:
+        first_token = None
+        failed = False
+        try:
+            async for _ in generator.stream_text(*args, use_cache=False):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+        except GenerationError:
+            failed = True
+    else:
+        failed = not (await generator.generate_text(*args, use_cache=False)).ok
+        first_token = None
+
+    latency = time.perf_counter() - started
+    return {
+        "latency": latency,
+        "ttft": first_token if first_token is not None else latency,
+        "error": failed
+    }
+
+
+def run_mode(api, mode, requests, concurrency, stream):
+    """
+    Runs all requests in one call mode
+
+    Args:
+        api (module): utils.api_handler
+        mode (str): "sequential", "threaded" or "async"
+        requests (int): Number of requests
+        concurrency (int): Requests running at the same time (ignored for sequential)
+        stream (bool): Whether to stream
+
+    Returns:
+        tuple: (list of call measurements, wall time in seconds)
+    """
+    started = time.perf_counter()
+
+    if mode == "sequential":
+        calls = [one_call(api, i, stream) for i in range(requests)]
+
+    elif mode == "threaded":
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            calls = list(executor.map(lambda i: one_call(api, i, stream), range(requests)))
+
+    else:
+        # Same code path as service.py: AsyncGenerator with an async HTTP client,
+        # all calls run on one event loop without a thread each
+        # Imported here, so the other modes also run without httpx installed
+        from utils.async_api import AsyncGenerator
+
+        async def run_all():
+            generator = AsyncGenerator(api.provider_registry, max_connections=concurrency)
+            limit = asyncio.Semaphore(concurrency)
+
+            async def limited(i):
+                async with limit:
+                    return await one_call_async(generator, i, stream)
+
+            try:
+                return await asyncio.gather(*(limited(i) for i in range(requests)))
+            finally:
+                await generator.aclose()
+
+        calls = asyncio.run(run_all())
+
+    return calls, time.perf_counter() - started
+
+
+def summarize(calls, wall_time):
+    """
+    Turns call measurements into summary numbers
+
+    Args:
+        calls (list): Measurements from one_call
+        wall_time (float): Total time for the mode in seconds
+
+    Returns:
+        dict: Latency and time-to-first-token percentiles in ms, throughput and error count
+    """
+    latencies = [call["latency"] * 1000 for call in calls]
+    ttfts = [call["ttft"] * 1000 for call in calls]
+    return {
+        "requests": len(calls),
+        "errors": sum(1 for call in calls if call["error"]),
+        "wall_seconds": round(wall_time, 3),
+        "throughput_rps": round(len(calls) / wall_time, 3) if wall_time else None,
+        "latency_ms": {f"p{p}": round(percentile(latencies, p), 1) for p in (50, 95, 99)},
+        "ttft_ms": {f"p{p}": round(percentile(ttfts, p), 1) for p in (50, 95, 99)}
+    }
+
+
+def git_commit():
+    """Returns the current git commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    """
+    Prints how the current results differ from a saved run
+
+    Args:
+        current (dict): Results of this run
+        baseline_path (str): JSON file of an earlier run
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    for mode, result in current["results"].items():
+        old = baseline["results"].get(mode)
+        if old is None:
+            continue
+        rows = [(f"latency {p}", result["latency_ms"][p], old["latency_ms"][p]) for p in ("p50", "p95", "p99")]
+        rows.append(("ttft p50", result["ttft_ms"]["p50"], old["ttft_ms"]["p50"]))
+        rows.append(("throughput rps", result["throughput_rps"], old["throughput_rps"]))
+        for name, new_value, old_value in rows:
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            print(f"  {mode:<10} {name:<15} {old_value:>10} -> {new_value:>10} ({change:+.1f}%)")
+
+
+def main():
+    """Starts the mock server, runs every mode and saves the results"""
+    parser = argparse.ArgumentParser(description="Benchmark text generation against a local mock API")
+    parser.add_argument("--requests", type=int, default=60, help="Requests per mode")
+    parser.add_argument("--concurrency", type=int, default=6, help="Parallel requests in threaded and async modes")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma separated: sequential,threaded,async")
+    parser.add_argument("--stream", action="store_true", help="Use stream_text and measure time to first token")
+    parser.add_argument("--latency-ms", type=float, default=300, help="Median mock time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="Spread of mock latency")
+    parser.add_argument("--tokens-per-second", type=float, default=500, help="Mock generation speed")
+    parser.add_argument("--completion-tokens", type=int, default=300, help="Tokens in each mock answer")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Share of requests answered with 5xx")
+    parser.add_argument("--with-rate-limit", action="store_true", help="Keep the app's rate limiter enabled")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the mock server")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to save results")
+    parser.add_argument("--compare", help="Earlier results file to compare with")
+    args = parser.parse_args()
+
+    server = MockGroqServer(
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        error_rate_429=args.error_429, error_rate_5xx=args.error_5xx, retry_after=0, seed=args.seed
+    ).start()
+
+    import utils.api_handler as api
+
+    # Without --with-rate-limit the client itself is measured, not the wait for the provider's limits
+    use_mock_provider(api, server.url, args.with_rate_limit)
+    use_fresh_caches(api)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "config": config
+        },
+        "results": {}
+    }
+
+    try:
+        for mode in args.modes.split(","):
+            mode = mode.strip()
+            if mode not in MODES:
+                parser.error(f"Unknown mode: {mode}")
+            calls, wall_time = run_mode(api, mode, args.requests, args.concurrency, args.stream)
+            summary = summarize(calls, wall_time)
+            results["results"][mode] = summary
+            print(f"{mode:<10} p50 {summary['latency_ms']['p50']:>8} ms  "
+                  f"p95 {summary['latency_ms']['p95']:>8} ms  p99 {summary['latency_ms']['p99']:>8} ms  "
+                  f"ttft p50 {summary['ttft_ms']['p50']:>8} ms  "
+                  f"{summary['throughput_rps']:>7} req/s  {summary['errors']} errors")
+    finally:
+        server.stop()
+
+    results["meta"]["server_counts"] = server.counts
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
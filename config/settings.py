@@ -3,6 +3,8 @@ Project configuration settings
 This file contains content types, tones, and other constant values
 """
 
+import os  # For settings that can be overridden with environment variables
+
 # Groq API settings
 XAI_API_BASE = "https://api.x.ai/v1"
 XAI_MODEL = "grok-beta"
@@ -30,4 +32,145 @@ LENGTH_OPTIONS = {
     "Short": (100, 200),
     "Medium": (300, 500),
     "Long": (600, 1000)
-}
\ No newline at end of file
+}
+
+# Maximum number of API requests sent at the same time
+# Multiple versions are generated in parallel up to this limit
+MAX_PARALLEL_REQUESTS = 3
+
+# HTTP client settings for API requests
+# Connections are kept open and reused between requests
+HTTP_POOL_SIZE = 10  # Maximum number of kept-alive connections
+HTTP_CONNECT_TIMEOUT = 5  # Seconds to wait while connecting
+HTTP_READ_TIMEOUT = 30  # Seconds to wait for the response
+HTTP_MAX_RETRIES = 3  # How many times a failed request is tried again
+HTTP_BACKOFF_BASE = 0.5  # First retry delay in seconds, doubled on each try
+HTTP_BACKOFF_MAX = 20  # Longest allowed retry delay in seconds
+REQUEST_DEADLINE_SECONDS = 60  # Total time budget of one request, retries, failover and all versions included
+
+# Provider settings
+# Every OpenAI-compatible chat completions API can be a provider
+# A provider is used when its API key is set, "local" when LOCAL_API_URL is set
+# Requests go to the fastest healthy provider and fail over to the next one
+PROVIDERS = {
+    "groq": {
+        "api_url": "https://api.groq.com/openai/v1/chat/completions",
+        "url_env": "GROQ_API_URL",  # Environment variable that overrides api_url
+        "key_env": "GROQ_API_KEY",  # Environment variable holding the API key
+        "model": "llama-3.1-8b-instant",
+        "rate_limited": True  # Uses the RATE_LIMIT_* settings below
+    },
+    "xai": {
+        "api_url": f"{XAI_API_BASE}/chat/completions",
+        "url_env": "XAI_API_URL",
+        "key_env": "XAI_API_KEY",
+        "model": XAI_MODEL,
+        "rate_limited": True
+    },
+    "local": {
+        "api_url": "http://127.0.0.1:8080/v1/chat/completions",
+        "url_env": "LOCAL_API_URL",
+        "key_env": None,  # Local servers usually don't need a key
+        "model": "local-model",
+        "rate_limited": False
+    }
+}
+PROVIDER_LATENCY_WINDOW = 50  # Recent calls used for latency and error rate
+PROVIDER_FAILURE_LIMIT = 3  # Failures in a row before a provider's circuit opens and requests fail fast
+PROVIDER_COOLDOWN_SECONDS = 30  # How long an open circuit waits before letting one probe request through
+HEDGE_REQUESTS = False  # Send a backup request to another provider when the first is slower than its p95, used if the first fails
+HEDGE_MIN_SAMPLES = 10  # Calls needed before a provider's p95 is trusted for hedging
+
+# Rate limit settings
+# Shared by all users of one server, match these to your Groq account limits
+RATE_LIMIT_REQUESTS_PER_MINUTE = 30  # Requests per minute
+RATE_LIMIT_TOKENS_PER_MINUTE = 30000  # Estimated prompt + completion tokens per minute
+
+# Response cache settings
+# Identical requests are answered from the cache instead of calling the API again
+CACHE_DB_PATH = ".cache/responses.sqlite3"  # On-disk cache file, None keeps cache in memory only
+CACHE_MEMORY_SIZE = 256  # Maximum number of results kept in memory
+CACHE_DISK_SIZE = 5000  # Maximum number of results kept on disk
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # Results expire after one week
+
+# Near-duplicate settings
+# Prompts that are almost the same as an earlier one can reuse its cached result
+# Off by default: a reused text was written for another prompt, and a small change
+# like a model number (X100 vs X200) can change what the text must say
+# When on, prompts must share almost all of their words (a reworded adjective in a
+# sentence-long prompt is fine, a new topic is not), prompts with different numbers
+# never match, and the app says when a text was reused
+NEAR_DUPLICATE_REUSE = False  # True also reuses results of near-identical prompts
+SIMILARITY_NUM_PERM = 64  # MinHash signature length
+SIMILARITY_BANDS = 16  # LSH bands, 64 / 16 = 4 rows per band
+SIMILARITY_THRESHOLD = 0.8  # Minimum share of words (0-1) two prompts must have in common for reusing a result
+SIMILARITY_INDEX_SIZE = 5000  # Maximum number of prompts kept in the index
+VERSION_SIMILARITY_THRESHOLD = 0.6  # Versions at least this similar (0-1) are flagged
+
+# Long-form settings
+# Long texts are written from an outline, with the sections generated in parallel
+LONGFORM_CONTENT_TYPES = {  # Content types that use long-form mode -> whether sections get headings
+    "Blog Post": True,
+    "Creative Writing": False
+}
+LONGFORM_MIN_WORDS = 600  # Lengths whose maximum is at least this many words use long-form mode
+LONGFORM_SECTIONS = 4  # Number of sections in the outline
+LONGFORM_MAX_PARALLEL = 4  # Sections generated at the same time
+
+# Warm-up and speculative generation settings (app.py)
+WARM_UP_ON_START = True  # Open a connection to every provider when the app starts
+SPECULATIVE_DEBOUNCE_SECONDS = 1.5  # Inputs must stay the same this long before a text is generated early
+SPECULATIVE_MAX_WORKERS = 4  # Texts generated early at the same time, shared by all sessions
+
+# Generation service settings (service.py)
+SERVICE_HOST = "127.0.0.1"  # Address the service listens on
+SERVICE_PORT = 8500  # Port the service listens on
+SERVICE_MAX_CONCURRENCY = 64  # Generations running at the same time
+SERVICE_POOL_SIZE = 32  # Open connections per provider, extra requests wait for a free one
+SERVICE_MAX_QUEUE = 256  # Requests allowed to wait for a free slot, more are answered with 503
+SERVICE_CLIENT_CONCURRENCY = 8  # Requests one client may have running or waiting, more get 429
+SERVICE_TRUSTED_PROXIES = ()  # Proxy addresses whose X-Client-Id header is trusted, e.g. ("10.0.0.5",); others are limited by their address
+SERVICE_DRAIN_SECONDS = 30  # How long shutdown waits for running generations
+
+# Batch generation settings
+BATCH_WORKERS = 8  # Number of requests sent at the same time by batch_generate.py
+
+# History settings
+# "sqlite" saves history to disk, "memory" keeps it only in the browser session
+# Both can be changed with environment variables of the same name, e.g. for load tests
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "data/history.sqlite3")  # Database file for saved texts
+# Saved texts older than this are deleted, 0 keeps them forever
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "30"))
+# Browser cookie with the secret key of a browser's saved history
+# The key is never put in the page URL, so sharing a link doesn't share the history
+HISTORY_COOKIE_NAME = "ai_text_studio_history"
+HISTORY_PAGE_SIZE = 10  # Number of texts shown on one sidebar page
+HISTORY_MEMORY_CAP_BYTES = 2 * 1024 * 1024  # Memory limit per session for the "memory" backend
+HISTORY_COMPRESS_MIN_BYTES = 2048  # Texts at least this long are compressed in memory
+
+# Export settings
+# Exports are downloaded by the user; saving them on the server is optional
+EXPORT_SERVER_SAVE = False  # True also offers saving exports in EXPORT_DIR on the server
+EXPORT_DIR = "exports"  # Folder for history exports saved on the server
+EXPORT_KEEP_FILES = 20  # Only the newest saved exports are kept, older ones are deleted
+EXPORT_MAX_AGE_SECONDS = 24 * 60 * 60  # Saved exports are deleted after one day
+EXPORT_MAX_BYTES = 50 * 1024 * 1024  # Larger exports saved on the server are refused, the filters can export less
+EXPORT_DOWNLOAD_MAX_BYTES = 8 * 1024 * 1024  # Larger export downloads are refused, they are held in memory until the next rerun
+EXPORT_CHUNK_SIZE = 64 * 1024  # Bytes written or streamed at a time
+DOWNLOAD_CACHE_MAX_BYTES = 16 * 1024 * 1024  # Prepared single-text downloads kept for reuse, shared by all sessions
+
+# Text analysis settings
+ANALYSIS_CACHE_SIZE = 1024  # Number of analysis results remembered
+ANALYSIS_PARALLEL_THRESHOLD = 200  # Batches at least this big use a process pool
+
+# Token budget settings
+# max_tokens is calculated from the maximum word count of the selected length
+TOKENS_PER_WORD = 1.35  # Average tokens per English word
+TOKEN_BUDGET_HEADROOM = 1.25  # Extra room so the model can finish its last sentence
+TOKEN_BUDGET_SLACK = 64  # Fixed extra tokens for headings and formatting
+LENGTH_OVERRUN_FACTOR = 1.2  # Streaming stops once text is this many times longer than the maximum
+
+# Metrics settings
+METRICS_PORT = None  # Port for the Prometheus /metrics endpoint, e.g. 9100; None turns it off
+METRICS_HOST = "127.0.0.1"  # Address the endpoint listens on; it has no password, so "0.0.0.0" opens it to every network
@@ -0,0 +1,398 @@
+"""
+Load Test
+Drives many simulated users through app.py at the same time against a local mock Groq server
+
+Every simulated user is an AppTest session running the real script: it
+generates texts, pages through and searches its history, opens a full
+text and clears its history. Sessions run in threads of one process, so
+they share the API client, caches and history database the way the
+sessions of one Streamlit server do.
+
+The test is repeated for every number of sessions and every history
+size, and reports rerun latency, memory per session and the point where
+the server stops keeping up.
+
+Usage:
+    python load_test.py --sessions 1,2,4,8,16 --history 0,200
+    python load_test.py --backend memory --output load_memory.json
+"""
+
+import argparse  # For command line arguments
+import gc  # For cleaning up before memory measurements
+import json  # For saving results
+import os
+import platform
+import sys
+import tempfile  # For the throwaway history database
+import threading  # For starting all sessions at the same moment
+import time  # For measuring reruns
+import tracemalloc  # For measuring memory per session
+import uuid  # For unique session ids
+from concurrent.futures import ThreadPoolExecutor  # One thread per simulated user
+from contextlib import contextmanager
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+from streamlit import runtime
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, local_script_runner
+from streamlit.testing.v1.util import patch_config_options
+from benchmark import percentile, git_commit, use_fresh_caches, use_mock_provider
+from utils.mock_server import MockGroqServer
+
+# The app is run from its file, wherever the load test is started from
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+GENERATE_LABEL = "🚀 Generate Text"
+CLEAR_LABEL = "🗑️ Clear History"
+
+# Words for the texts put into history before a session starts
+FILLER = ("the quick brown fox jumps over a lazy dog while writers plan every "
+          "section of their long blog post about wireless headphones and coffee").split()
+
+
+@contextmanager
+def shared_runtime():
+    """
+    Lets AppTest sessions run at the same time
+
+    AppTest puts a stand-in Streamlit runtime and its test setting in place
+    before each run and removes them afterwards, so one session finishing
+    would pull them away from another that is still running. It also
+    compiles the script again on every run, and compiling in many threads
+    at once can fail on Python 3.11. While this context is open, every
+    session sees one runtime and one compiled script, like on a real
+    server.
+    """
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    script_cache = ScriptCache()
+    with patch.object(runtime, "get_instance", lambda: shared), \
+            patch.object(runtime, "exists", lambda: True), \
+            patch.object(local_script_runner, "ScriptCache", lambda: script_cache), \
+            patch_config_options({"global.appTest": True}):
+        yield shared
+
+
+def prefill_history(history_store, session_id, count):
+    """
+    Puts texts into a session's history before the session starts
+
+    Args:
+        history_store (object): HistoryStore or SessionHistory
+        session_id (str): Session the texts belong to
+        count (int): Number of texts
+    """
+    for i in range(count):
+        words = [FILLER[(i + j) % len(FILLER)] for j in range(300)]
+        history_store.add(session_id, {
+            'prompt': f"Saved topic {i}",
+            'content_type': "Blog Post",
+            'tone': "Professional",
+            'length': "Medium",
+            'text': " ".join(words),
+            'version': 1
+        })
+
+
+def find_button(at, label=None, key_prefix=None):
+    """Returns the first enabled button with the label or key prefix, or None"""
+    for button in at.button:
+        if button.disabled:
+            continue
+        if label is not None and button.label == label:
+            return button
+        if key_prefix is not None and (button.key or "").startswith(key_prefix):
+            return button
+    return None
+
+
+def run_session(index, history_size, args, store, start_gate=None, clear=True):
+    """
+    Runs one simulated user through the app
+
+    Args:
+        index (int): Session number, makes every prompt unique so nothing is cached
+        history_size (int): Texts in the session's history before it starts
+        args (argparse.Namespace): Command line settings
+        store (HistoryStore): Shared history database, None for the "memory" backend
+        start_gate (threading.Barrier): Waited for after setup, so sessions start together
+        clear (bool): Whether the session clears its history at the end
+
+    Returns:
+        tuple: (list of rerun measurements, the AppTest session)
+    """
+    # Imported here, the settings must see the environment set in main() first
+    from utils.history_store import SessionHistory
+
+    session_id = f"load-{uuid.uuid4().hex[:12]}"
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    # The app normally reads this from a browser cookie
+    at.session_state["session_id"] = session_id
+
+    # Old texts go where the app will look for them
+    if store is None:
+        history = SessionHistory()
+        prefill_history(history, session_id, history_size)
+        at.session_state["history"] = history
+    else:
+        prefill_history(store, session_id, history_size)
+
+    reruns = []
+
+    def rerun(step, element=None):
+        """Runs the script once, after an optional widget change, and measures it"""
+        started = time.perf_counter()
+        (element or at).run()
+        reruns.append({
+            "step": step,
+            "ms": (time.perf_counter() - started) * 1000,
+            "ok": not at.exception,
+            "started": started
+        })
+
+    if start_gate is not None:
+        start_gate.wait()
+
+    rerun("open")
+    for n in range(args.generations):
+        at.text_area[0].input(f"Load test topic {index} {n} {session_id}")
+        rerun("generate", find_button(at, label=GENERATE_LABEL).click())
+
+    # Browse the history: next page, a search, then one full text
+    next_page = find_button(at, key_prefix="history_next")
+    if next_page is not None:
+        rerun("page", next_page.click())
+    rerun("search", at.text_input(key="history_search").input("topic"))
+    view = find_button(at, key_prefix="view_")
+    if view is not None:
+        rerun("view", view.click())
+
+    if clear:
+        rerun("clear", find_button(at, label=CLEAR_LABEL).click())
+    return reruns, at
+
+
+def percentiles(values):
+    """Returns the p50, p95 and p99 of a list in ms, None for an empty list"""
+    return {f"p{p}": None if not values else round(percentile(values, p), 1) for p in (50, 95, 99)}
+
+
+def summarize_level(sessions, history_size, reruns):
+    """
+    Turns the reruns of one concurrency level into summary numbers
+
+    Args:
+        sessions (int): Sessions that ran at the same time
+        history_size (int): Texts in each session's history at the start
+        reruns (list): Measurements from run_session
+
+    Returns:
+        dict: Latency percentiles in ms, throughput and error count
+    """
+    # Generation reruns wait for the API, the others show how fast the page itself is
+    page_ms = [r["ms"] for r in reruns if r["step"] != "generate"]
+    generate_ms = [r["ms"] for r in reruns if r["step"] == "generate"]
+    wall_time = max(r["started"] + r["ms"] / 1000 for r in reruns) - min(r["started"] for r in reruns)
+    steps = sorted({r["step"] for r in reruns})
+    return {
+        "sessions": sessions,
+        "history": history_size,
+        "reruns": len(reruns),
+        "errors": sum(1 for r in reruns if not r["ok"]),
+        "wall_seconds": round(wall_time, 3),
+        "reruns_per_second": round(len(reruns) / wall_time, 2) if wall_time else None,
+        "page_ms": percentiles(page_ms),
+        "generate_ms": percentiles(generate_ms),
+        "step_p50_ms": {
+            step: round(percentile([r["ms"] for r in reruns if r["step"] == step], 50), 1)
+            for step in steps
+        }
+    }
+
+
+def run_level(sessions, history_size, args, store):
+    """
+    Runs the given number of sessions at the same time
+
+    Returns:
+        dict: Summary from summarize_level
+    """
+    start_gate = threading.Barrier(sessions)
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(
+            lambda i: run_session(i, history_size, args, store, start_gate)[0], range(sessions)
+        ))
+    return summarize_level(sessions, history_size, [r for reruns in results for r in reruns])
+
+
+def measure_memory(history_size, args, store):
+    """
+    Measures the server memory that open sessions use
+
+    Sessions are opened one after another with tracemalloc running and
+    stay open afterwards, like idle browser tabs. Growth of the traced
+    memory divided by the number of sessions is the memory per session.
+    It includes AppTest's copy of every page, so it is on the high side
+    of what a real server keeps.
+
+    Returns:
+        dict: Kilobytes per session and peak kilobytes while the sessions ran
+    """
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    # Keep the sessions referenced until the measurement is taken
+    open_sessions = [
+        run_session(i, history_size, args, store, clear=False)[1]
+        for i in range(args.memory_sessions)
+    ]
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "history": history_size,
+        "sessions": len(open_sessions),
+        "kb_per_session": round((current - baseline) / len(open_sessions) / 1024, 1),
+        "peak_kb": round((peak - baseline) / 1024, 1)
+    }
+
+
+def find_saturation(levels, slo_ms, min_gain):
+    """
+    Finds the first number of sessions the server can't keep up with
+
+    A level is saturated when its p95 page rerun is slower than slo_ms,
+    or when adding sessions raised throughput by less than min_gain.
+
+    Args:
+        levels (list): Summaries of one history size, fewest sessions first
+        slo_ms (float): Slowest acceptable p95 page rerun in milliseconds
+        min_gain (float): Smallest throughput gain that counts as scaling, e.g. 0.1 for 10%
+
+    Returns:
+        dict: sessions and reason, or None if every level kept up
+    """
+    previous = None
+    for level in levels:
+        if level["page_ms"]["p95"] > slo_ms:
+            return {"sessions": level["sessions"], "reason": f"p95 page rerun above {slo_ms:g} ms"}
+        if previous is not None and previous["reruns_per_second"]:
+            gain = level["reruns_per_second"] / previous["reruns_per_second"] - 1
+            if gain < min_gain:
+                return {"sessions": level["sessions"], "reason": f"throughput grew only {gain * 100:.0f}%"}
+        previous = level
+    return None
+
+
+def parse_counts(text):
+    """Turns "1,2,4" into [1, 2, 4]"""
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def main():
+    """Starts the mock server, runs every level and saves the results"""
+    parser = argparse.ArgumentParser(description="Load test app.py with simulated sessions against a mock API")
+    parser.add_argument("--sessions", default="1,2,4,8", help="Comma separated numbers of sessions run at once")
+    parser.add_argument("--history", default="0,100", help="Comma separated history sizes per session")
+    parser.add_argument("--generations", type=int, default=2, help="Texts each session generates")
+    parser.add_argument("--backend", choices=("sqlite", "memory"), default="sqlite", help="History backend")
+    parser.add_argument("--history-db", help="History database file, a temporary file by default")
+    parser.add_argument("--memory-sessions", type=int, default=10,
+                        help="Sessions opened for the memory measurement, 0 skips it")
+    parser.add_argument("--slo-ms", type=float, default=1000, help="Slowest acceptable p95 page rerun")
+    parser.add_argument("--min-gain", type=float, default=0.1,
+                        help="Throughput gain below which more sessions count as saturated")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds one rerun may take")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Median mock time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="Spread of mock latency")
+    parser.add_argument("--tokens-per-second", type=float, default=2000, help="Mock generation speed")
+    parser.add_argument("--completion-tokens", type=int, default=300, help="Tokens in each mock answer")
+    parser.add_argument("--with-rate-limit", action="store_true", help="Keep the app's rate limiter enabled")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the mock server")
+    parser.add_argument("--output", default="load_test_results.json", help="Where to save results")
+    args = parser.parse_args()
+
+    server = MockGroqServer(
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        seed=args.seed
+    ).start()
+
+    # Settings are read when the modules are imported, so set them first
+    # The load test never writes into the real history database
+    temp_dir = tempfile.TemporaryDirectory(prefix="load_test_")
+    os.environ["HISTORY_BACKEND"] = args.backend
+    os.environ["HISTORY_DB_PATH"] = args.history_db or os.path.join(temp_dir.name, "history.sqlite3")
+    import utils.api_handler as api
+    from utils.history_store import HistoryStore
+
+    # Without --with-rate-limit the app is measured, not the wait for the provider's limits
+    use_mock_provider(api, server.url, args.with_rate_limit)
+    # Mock texts never reach the real response cache
+    use_fresh_caches(api)
+
+    # Sessions of the sqlite backend share one database, like on a server
+    store = HistoryStore(os.environ["HISTORY_DB_PATH"]) if args.backend == "sqlite" else None
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": config
+        },
+        "levels": [],
+        "memory": [],
+        "saturation": {}
+    }
+
+    try:
+        with shared_runtime():
+            # One warm-up session, so imports and caches don't count as load
+            run_session(0, 0, args, store)
+
+            for history_size in parse_counts(args.history):
+                levels = []
+                for sessions in parse_counts(args.sessions):
+                    level = run_level(sessions, history_size, args, store)
+                    levels.append(level)
+                    print(f"history {history_size:>5}  sessions {sessions:>3}  "
+                          f"page p50 {level['page_ms']['p50']:>7} ms  p95 {level['page_ms']['p95']:>7} ms  "
+                          f"generate p50 {level['generate_ms']['p50']:>7} ms  "
+                          f"{level['reruns_per_second']:>7} reruns/s  {level['errors']} errors")
+                results["levels"].extend(levels)
+
+                saturation = find_saturation(levels, args.slo_ms, args.min_gain)
+                results["saturation"][str(history_size)] = saturation
+                if saturation is None:
+                    print(f"history {history_size:>5}  no saturation up to {levels[-1]['sessions']} sessions")
+                else:
+                    print(f"history {history_size:>5}  saturated at {saturation['sessions']} sessions: "
+                          f"{saturation['reason']}")
+
+                if args.memory_sessions > 0:
+                    memory = measure_memory(history_size, args, store)
+                    results["memory"].append(memory)
+                    print(f"history {history_size:>5}  memory {memory['kb_per_session']:>9} KB per session")
+    finally:
+        server.stop()
+        temp_dir.cleanup()
+
+    results["meta"]["server_counts"] = server.counts
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
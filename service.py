@@ -0,0 +1,499 @@
+"""
+Text Generation Service
+Serves text generation over HTTP for other systems, with streaming
+
+Runs on one asyncio event loop, so hundreds of requests can wait on the
+API at the same time without a thread each. Requests past the queue limit
+get 503, clients past their own limit get 429. On Ctrl+C or SIGTERM the
+service stops accepting requests and finishes the running ones first.
+
+Usage:
+    python service.py --port 8500
+
+Endpoints:
+    POST /v1/generate         {"prompt": "...", "content_type": "Blog Post", "tone": "Professional", "length": "Short",
+                               "timeout": 30}
+    POST /v1/generate/stream  Same body, answers with server-sent events
+    GET  /healthz             Queue and drain state
+    GET  /metrics             Prometheus metrics
+"""
+
+import argparse  # For command line arguments
+import asyncio  # For the event loop, server and limits
+import json  # For request and response bodies
+import math
+import signal  # For graceful shutdown
+from config.settings import (
+    CONTENT_TYPES,
+    TONE_OPTIONS,
+    LENGTH_OPTIONS,
+    SERVICE_HOST,
+    SERVICE_PORT,
+    SERVICE_MAX_CONCURRENCY,
+    SERVICE_MAX_QUEUE,
+    SERVICE_CLIENT_CONCURRENCY,
+    SERVICE_TRUSTED_PROXIES,
+    SERVICE_DRAIN_SECONDS,
+    REQUEST_DEADLINE_SECONDS
+)
+from utils.api_handler import metrics
+from utils.async_api import AsyncGenerator
+from utils.resilience import Deadline, GenerationError
+
+MAX_BODY_BYTES = 1024 * 1024  # Larger request bodies are refused with 413
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    411: "Length Required", 413: "Payload Too Large", 429: "Too Many Requests", 502: "Bad Gateway",
+    503: "Service Unavailable", 504: "Gateway Timeout"
+}
+
+
+class HTTPError(Exception):
+    """Ends a request with an error status and a JSON message"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def parse_generation_request(body):
+    """
+    Reads and checks the JSON body of a generation request
+
+    Missing options use the first choice, the same defaults as the app.
+    The optional "timeout" is the request's time budget in seconds, waiting
+    in the queue included, and can't be longer than REQUEST_DEADLINE_SECONDS.
+
+    Args:
+        body (bytes): Request body
+
+    Returns:
+        dict: Arguments for AsyncGenerator.generate_text
+
+    Raises:
+        HTTPError: 400 if the body is not valid
+    """
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Body must be JSON")
+    if not isinstance(request, dict):
+        raise HTTPError(400, "Body must be a JSON object")
+
+    prompt = request.get("prompt")
+    content_type = request.get("content_type", next(iter(CONTENT_TYPES)))
+    tone = request.get("tone", next(iter(TONE_OPTIONS)))
+    length = request.get("length", next(iter(LENGTH_OPTIONS)))
+
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise HTTPError(400, "Missing prompt")
+    if content_type not in CONTENT_TYPES:
+        raise HTTPError(400, f"Unknown content type: {content_type}")
+    if tone not in TONE_OPTIONS:
+        raise HTTPError(400, f"Unknown tone: {tone}")
+    if length not in LENGTH_OPTIONS:
+        raise HTTPError(400, f"Unknown length: {length}")
+
+    timeout = request.get("timeout", REQUEST_DEADLINE_SECONDS)
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+        raise HTTPError(400, "timeout must be a positive number of seconds")
+
+    return {
+        "prompt": prompt,
+        "content_type": CONTENT_TYPES[content_type],
+        "tone": TONE_OPTIONS[tone],
+        "length": LENGTH_OPTIONS[length],
+        "use_cache": bool(request.get("use_cache", True)),
+        # The clock starts now, so time spent in the queue counts too
+        "deadline": Deadline(min(timeout, REQUEST_DEADLINE_SECONDS))
+    }
+
+
+async def read_request(reader):
+    """
+    Reads one HTTP/1.1 request from a connection
+
+    Args:
+        reader (asyncio.StreamReader): Connection to read from
+
+    Returns:
+        tuple: (method, path, headers with lowercase names, body), or None when the client hung up
+
+    Raises:
+        HTTPError: 400 for a malformed request, 411 for a chunked body, 413 for a body over MAX_BODY_BYTES
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(400, "Headers too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, path, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Bad request line")
+
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    # Chunked bodies aren't decoded, their chunks would be read as the next request
+    # The connection is closed, so nothing of the unread body is left behind
+    if "transfer-encoding" in headers:
+        raise HTTPError(411, "Transfer-Encoding isn't supported, send Content-Length", {"Connection": "close"})
+
+    # A length that isn't a plain number would make readexactly fail or read the wrong amount
+    length = headers.get("content-length") or "0"
+    if not (length.isascii() and length.isdigit()):
+        raise HTTPError(400, "Bad Content-Length")
+    length = int(length)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?", 1)[0], headers, body
+
+
+def client_identity(peer, headers, trusted_proxies=SERVICE_TRUSTED_PROXIES):
+    """
+    Returns the id a request counts against for the per-client limit
+
+    Any caller could send a new X-Client-Id with every request, so the
+    header is only used when it comes from a trusted proxy, which sets it
+    for the systems behind it. Everyone else is known by their address.
+
+    Args:
+        peer (tuple): (address, port) of the connection, None if unknown
+        headers (dict): Request headers with lowercase names
+        trusted_proxies (iterable): Addresses whose X-Client-Id is used
+
+    Returns:
+        str: Client id
+    """
+    address = peer[0] if peer else "unknown"
+    client_id = headers.get("x-client-id")
+    if client_id and address in trusted_proxies:
+        return f"{address}/{client_id}"
+    return address
+
+
+class GenerationService:
+    """
+    HTTP front end for AsyncGenerator with admission control
+
+    A request is admitted if the total of running and waiting requests is
+    under max_concurrency + max_queue and its client is under its own
+    limit. Admitted requests wait for one of max_concurrency slots.
+    """
+
+    def __init__(self, generator, max_concurrency=SERVICE_MAX_CONCURRENCY, max_queue=SERVICE_MAX_QUEUE,
+                 client_limit=SERVICE_CLIENT_CONCURRENCY):
+        """
+        Creates the service
+
+        Args:
+            generator (AsyncGenerator): Does the generation
+            max_concurrency (int): Generations running at the same time
+            max_queue (int): Requests allowed to wait for a slot
+            client_limit (int): Running plus waiting requests allowed per client
+        """
+        self.generator = generator
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.client_limit = client_limit
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.admitted = 0  # Running plus waiting requests
+        self.running = 0
+        self.per_client = {}  # client id -> admitted requests
+        self.rejected = {"queue_full": 0, "client_limit": 0, "draining": 0}
+        self.draining = False
+        self.stop = asyncio.Event()  # Set to begin a graceful shutdown
+        self.idle = asyncio.Event()  # Set while nothing is admitted
+        self.idle.set()
+        self.connections = set()  # Open connection writers, closed on shutdown
+
+    def stats(self):
+        """
+        Returns queue numbers for /healthz and metrics
+
+        Returns:
+            dict: running, waiting, limits, rejection counters and drain state
+        """
+        return {
+            "running": self.running,
+            "waiting": self.admitted - self.running,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": dict(self.rejected),
+            "draining": self.draining
+        }
+
+    def admit(self, client_id):
+        """
+        Decides whether a request may enter the queue
+
+        Args:
+            client_id (str): Who sent the request
+
+        Raises:
+            HTTPError: 503 when draining or the queue is full, 429 when the client is over its limit
+        """
+        if self.draining:
+            self.rejected["draining"] += 1
+            raise HTTPError(503, "Service is shutting down")
+        if self.admitted >= self.max_concurrency + self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise HTTPError(503, "Queue is full, try again later", {"Retry-After": "1"})
+        if self.per_client.get(client_id, 0) >= self.client_limit:
+            self.rejected["client_limit"] += 1
+            raise HTTPError(429, "Too many requests from this client", {"Retry-After": "1"})
+
+        self.admitted += 1
+        self.per_client[client_id] = self.per_client.get(client_id, 0) + 1
+        self.idle.clear()
+
+    def release(self, client_id):
+        """Frees the queue place of a finished request"""
+        self.admitted -= 1
+        self.per_client[client_id] -= 1
+        if not self.per_client[client_id]:
+            del self.per_client[client_id]
+        if self.admitted == 0:
+            self.idle.set()
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves requests on one connection until the client or the service closes it
+
+        Args:
+            reader (asyncio.StreamReader): Incoming data
+            writer (asyncio.StreamWriter): Outgoing data
+        """
+        self.connections.add(writer)
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                request = None
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        return
+                    method, path, headers, body = request
+                    client_id = client_identity(peer, headers)
+                    keep_alive = await self.route(method, path, headers, body, client_id, writer)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": e.message}, e.headers)
+                    # After a malformed request the rest of its body may still be unread, so close
+                    keep_alive = e.status < 500 and request is not None and not self.draining
+
+                if not keep_alive or headers_say_close(request) or self.draining:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def route(self, method, path, headers, body, client_id, writer):
+        """
+        Answers one request
+
+        Returns:
+            bool: Whether the connection can be kept open for another request
+        """
+        if path == "/healthz":
+            stats = self.stats()
+            await send_json(writer, 503 if self.draining else 200, {"status": "draining" if self.draining else "ok", **stats})
+            return True
+        if path == "/metrics":
+            await send_response(writer, 200, metrics.render_prometheus().encode("utf-8"),
+                                "text/plain; version=0.0.4")
+            return True
+        if path not in ("/v1/generate", "/v1/generate/stream"):
+            raise HTTPError(404, "Not found")
+        if method != "POST":
+            raise HTTPError(405, "Use POST")
+
+        arguments = parse_generation_request(body)
+        self.admit(client_id)
+        try:
+            # Waiting here is the queue, the slot limits upstream calls
+            # A request whose time budget runs out while waiting is never started
+            try:
+                await asyncio.wait_for(self.slots.acquire(), arguments["deadline"].remaining())
+            except asyncio.TimeoutError:
+                raise HTTPError(504, "Timed out waiting in the queue")
+            self.running += 1
+            try:
+                if path == "/v1/generate":
+                    result = await self.generator.generate_text(**arguments)
+                    await self.send_result(writer, result)
+                    return True
+                await self.stream(writer, arguments)
+                return False  # Streams end by closing the connection
+            finally:
+                self.running -= 1
+                self.slots.release()
+        finally:
+            self.release(client_id)
+
+    async def send_result(self, writer, result):
+        """
+        Answers with a GenerationResult
+
+        Success is 200. Temporary failures are 503 with Retry-After, so
+        clients know to try again; other failures are 502.
+        """
+        if result.ok:
+            body = {"text": result.text}
+            if result.similarity is not None:
+                # Text was written for an almost identical earlier prompt
+                body["reused_similarity"] = result.similarity
+            await send_json(writer, 200, body)
+        elif result.retryable:
+            retry_after = math.ceil(result.retry_after or 1)
+            await send_json(writer, 503, {"error": result.error, "retryable": True},
+                            {"Retry-After": str(retry_after)})
+        else:
+            await send_json(writer, 502, {"error": result.error, "retryable": False})
+
+    async def stream(self, writer, arguments):
+        """
+        Sends generated text as server-sent events
+
+        Each piece is a "data: {"delta": ...}" event, errors are an "error"
+        event, and "data: [DONE]" ends the stream. A text reused from an
+        almost identical earlier prompt is announced with a "reused" event.
+        """
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        await writer.drain()
+
+        def announce_reuse(similarity):
+            writer.write(f"event: reused\ndata: {json.dumps({'similarity': similarity})}\n\n".encode("utf-8"))
+
+        pieces = self.generator.stream_text(**arguments, on_reuse=announce_reuse)
+        try:
+            try:
+                async for delta in pieces:
+                    writer.write(f"data: {json.dumps({'delta': delta})}\n\n".encode("utf-8"))
+                    # drain waits while the client reads slowly, which is the backpressure for streams
+                    await writer.drain()
+            except GenerationError as e:
+                error = {"error": e.result.error, "retryable": e.result.retryable}
+                writer.write(f"event: error\ndata: {json.dumps(error)}\n\n".encode("utf-8"))
+            writer.write(b"data: [DONE]\n\n")
+            await writer.drain()
+        finally:
+            await pieces.aclose()
+
+    async def shutdown(self, server, timeout=SERVICE_DRAIN_SECONDS):
+        """
+        Stops accepting requests and waits for running ones to finish
+
+        Args:
+            server (asyncio.Server): Listening server
+            timeout (float): Longest wait for running generations in seconds
+        """
+        self.draining = True
+        server.close()  # No new connections
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Drain timed out with {self.admitted} request(s) left")
+
+        # Close idle keep-alive connections
+        for writer in list(self.connections):
+            writer.close()
+        await self.generator.aclose()
+
+
+def headers_say_close(request):
+    """Returns True if the client asked to close the connection after this request"""
+    return request is not None and request[2].get("connection", "").lower() == "close"
+
+
+async def send_response(writer, status, body, content_type, headers=None):
+    """Writes a complete HTTP response with a body"""
+    lines = [
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}"
+    ]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+async def send_json(writer, status, payload, headers=None):
+    """Writes a JSON response"""
+    await send_response(writer, status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+
+async def serve(host, port, max_concurrency, max_queue, client_limit, drain_seconds, ready=None):
+    """
+    Runs the service until Ctrl+C or SIGTERM
+
+    Args:
+        host (str): Address to listen on
+        port (int): Port to listen on, 0 picks a free port
+        max_concurrency (int): Generations running at the same time
+        max_queue (int): Requests allowed to wait
+        client_limit (int): Running plus waiting requests allowed per client
+        drain_seconds (float): Longest wait for running generations on shutdown
+        ready (callable): Called with (service, port) once listening, e.g. by benchmarks;
+                          service.stop.set() shuts the service down
+    """
+    service = GenerationService(AsyncGenerator(), max_concurrency, max_queue, client_limit)
+    # backlog sized for bursts of new connections
+    server = await asyncio.start_server(service.handle_connection, host, port,
+                                        backlog=max_concurrency + max_queue)
+    port = server.sockets[0].getsockname()[1]
+
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, service.stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows or not the main thread, Ctrl+C still raises KeyboardInterrupt
+
+    print(f"Generation service listening on http://{host}:{port}")
+    if ready is not None:
+        ready(service, port)
+
+    await service.stop.wait()
+    print("Shutting down, finishing running generations...")
+    await service.shutdown(server, drain_seconds)
+
+
+def main():
+    """Reads command line options and runs the service"""
+    parser = argparse.ArgumentParser(description="Serve text generation over HTTP")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--max-concurrency", type=int, default=SERVICE_MAX_CONCURRENCY,
+                        help="Generations running at the same time")
+    parser.add_argument("--max-queue", type=int, default=SERVICE_MAX_QUEUE,
+                        help="Requests allowed to wait, more are answered with 503")
+    parser.add_argument("--client-limit", type=int, default=SERVICE_CLIENT_CONCURRENCY,
+                        help="Running plus waiting requests allowed per client, more get 429")
+    parser.add_argument("--drain-seconds", type=float, default=SERVICE_DRAIN_SECONDS,
+                        help="How long shutdown waits for running generations")
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.host, args.port, args.max_concurrency, args.max_queue,
+                      args.client_limit, args.drain_seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""
+Shared test setup
+This file makes the app's modules importable when pytest runs from any folder
+"""
+
+import os
+import sys
+
+# Tests import config and utils the same way the app does, from the project folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,91 @@
+"""
+Tests for the generation helpers
+This file checks which providers count as configured, what cache keys include
+and which requests share one API call
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import utils.api_handler as api_handler
+from config.settings import PROVIDERS
+from utils.api_handler import GroqClient, _is_configured, build_request, cache_key
+from utils.providers import Provider, ProviderRegistry
+from utils.rate_limiter import SingleFlight
+from utils.response_cache import ResponseCache
+
+
+def test_provider_with_a_key_is_configured(monkeypatch):
+    monkeypatch.setenv("XAI_API_KEY", "test-key")
+    assert _is_configured(PROVIDERS["xai"])
+
+
+def test_provider_with_only_a_changed_url_is_configured(monkeypatch):
+    # e.g. a mock server, which needs no key
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    monkeypatch.setenv("GROQ_API_URL", "http://127.0.0.1:8000/openai/v1/chat/completions")
+    assert _is_configured(PROVIDERS["groq"])
+
+
+def test_provider_without_key_or_url_is_not_configured(monkeypatch):
+    monkeypatch.delenv("LOCAL_API_URL", raising=False)
+    assert not _is_configured(PROVIDERS["local"])
+
+
+def registry(*models):
+    """Registry with one provider per (name, model) pair, nothing is sent"""
+    return ProviderRegistry([
+        Provider(name, GroqClient(api_url="http://127.0.0.1:1/v1/chat/completions", api_key=None, model=model))
+        for name, model in models
+    ])
+
+
+def test_cache_key_depends_on_the_configured_providers(monkeypatch):
+    data = build_request("cats", "Blog Post", "Professional", (300, 500))
+    keys = []
+    for providers in ([("groq", "llama")], [("groq", "llama"), ("xai", "grok")], [("groq", "llama-big")]):
+        monkeypatch.setattr(api_handler, "provider_registry", registry(*providers))
+        keys.append(cache_key("cats", "Blog Post", "Professional", (300, 500), data))
+    assert len(set(keys)) == 3
+
+
+class SlowClient:
+    """Answers every chat request after a delay and counts the requests"""
+
+    model = "fake"
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def chat(self, data, call=None, deadline=None):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return "A generated text.", None
+
+
+def run_twice_at_once(monkeypatch, use_cache):
+    """Sends the same request twice at the same time, returns how many reached the provider"""
+    client = SlowClient(delay=0.2)
+    monkeypatch.setattr(api_handler, "provider_registry", ProviderRegistry([Provider("fake", client)]))
+    monkeypatch.setattr(api_handler, "response_cache", ResponseCache(db_path=None))
+    monkeypatch.setattr(api_handler, "singleflight", SingleFlight())
+
+    def generate(_):
+        return api_handler.generate_text("cats", "Blog Post", "Professional", (300, 500), use_cache=use_cache)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(generate, range(2)))
+    assert all(result.ok for result in results)
+    return client.calls
+
+
+def test_identical_requests_at_once_share_one_call(monkeypatch):
+    assert run_twice_at_once(monkeypatch, use_cache=True) == 1
+
+
+def test_fresh_variations_are_never_shared(monkeypatch):
+    assert run_twice_at_once(monkeypatch, use_cache=False) == 2
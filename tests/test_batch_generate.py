@@ -0,0 +1,31 @@
+"""
+Tests for batch generation
+This file checks that malformed input lines don't stop a batch
+"""
+
+import json
+
+from batch_generate import process_row, read_rows, run_batch
+
+
+def test_malformed_lines_become_invalid_rows(tmp_path):
+    input_path = tmp_path / "prompts.jsonl"
+    input_path.write_text('{"id": "p1", "prompt": ""}\n{"prompt": \n\n["a list"]\n', encoding="utf-8")
+
+    rows = list(read_rows(input_path))
+    assert [row["id"] for row in rows] == ["p1", 2, 4]
+    assert rows[1]["invalid_line"].startswith("Line 2 is not valid JSON")
+    assert rows[2]["invalid_line"] == "Line 4 is not a JSON object"
+    assert process_row(rows[2], use_cache=True) == {"id": 4, "status": "invalid", "error": "Line 4 is not a JSON object"}
+
+
+def test_batch_keeps_going_after_a_malformed_line(tmp_path):
+    # No row needs the API: one has no prompt, the others can't be read
+    input_path = tmp_path / "prompts.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    input_path.write_text('not json\n{"id": "p1", "prompt": ""}\n42\n', encoding="utf-8")
+
+    counts = run_batch(input_path, output_path, workers=2)
+    assert counts == {"ok": 0, "error": 0, "invalid": 3}
+    results = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    assert sorted(str(result["id"]) for result in results) == ["1", "3", "p1"]
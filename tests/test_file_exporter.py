@@ -0,0 +1,63 @@
+"""
+Tests for history exports
+This file checks export size limits and the cleanup of exports saved on the server
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from utils.file_exporter import ExportTooLargeError, build_export, prune_exports, save_export_async
+from utils.history_store import HistoryRecord
+
+
+def make_records(count, words=50):
+    return [
+        HistoryRecord(i, f"prompt {i}", "Blog Post", "Friendly", "Short", 1, "word " * words, time.time())
+        for i in range(count)
+    ]
+
+
+def test_build_export_returns_the_whole_file():
+    data = build_export(make_records(3), "JSONL")
+    lines = data.decode("utf-8").splitlines()
+    assert [json.loads(line)["prompt"] for line in lines] == ["prompt 0", "prompt 1", "prompt 2"]
+
+
+def test_build_export_refuses_large_exports():
+    with pytest.raises(ExportTooLargeError):
+        build_export(make_records(100), "Markdown", max_bytes=1000)
+
+
+def test_prune_keeps_only_the_newest_exports(tmp_path):
+    now = time.time()
+    for i in range(5):
+        path = tmp_path / f"history_2024010{i}_120000.jsonl"
+        path.write_text("{}")
+        os.utime(path, (now - 100 + i, now - 100 + i))
+    other = tmp_path / "notes.txt"
+    other.write_text("not an export")
+
+    deleted = prune_exports(str(tmp_path), keep=2, max_age=3600)
+    assert len(deleted) == 3
+    assert sorted(os.listdir(tmp_path)) == ["history_20240103_120000.jsonl", "history_20240104_120000.jsonl", "notes.txt"]
+
+
+def test_prune_deletes_old_exports(tmp_path):
+    path = tmp_path / "history_20240101_120000.zip"
+    path.write_bytes(b"zip")
+    old = time.time() - 7200
+    os.utime(path, (old, old))
+    assert prune_exports(str(tmp_path), keep=10, max_age=3600) == [str(path)]
+
+
+def test_server_save_is_limited_and_leaves_no_partial_file(tmp_path):
+    future = save_export_async(make_records(100), "JSONL", folder=str(tmp_path), max_bytes=1000)
+    with pytest.raises(ExportTooLargeError):
+        future.result(timeout=10)
+    assert os.listdir(tmp_path) == []
+
+    path = save_export_async(make_records(2), "JSONL", folder=str(tmp_path)).result(timeout=10)
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
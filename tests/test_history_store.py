@@ -0,0 +1,63 @@
+"""
+Tests for the history database
+This file checks that sessions stay apart and old texts are deleted
+"""
+
+import time
+
+from utils.history_store import HistoryStore
+
+
+def entry(prompt):
+    return {"prompt": prompt, "content_type": "Blog Post", "tone": "Friendly",
+            "length": "Short", "text": f"Text about {prompt}", "version": 1}
+
+
+def age_all(store, seconds):
+    """Moves every saved text back in time"""
+    with store.lock:
+        store.db.execute("UPDATE history SET created_at = created_at - ?", (seconds,))
+        store.db.commit()
+
+
+def test_sessions_only_see_their_own_texts():
+    store = HistoryStore(":memory:")
+    store.add("a", entry("cats"))
+    store.add("b", entry("dogs"))
+    assert [record.prompt for record in store.page("a", 0, 10)] == ["cats"]
+    store.clear("a")
+    assert store.count("a") == 0 and store.count("b") == 1
+
+
+def test_prune_deletes_texts_past_the_retention_period():
+    store = HistoryStore(":memory:", retention_days=1)
+    store.add("a", entry("old"))
+    store.add("b", entry("also old"))
+    age_all(store, 2 * 24 * 60 * 60)
+    store.add("a", entry("new"))
+
+    assert store.prune() == 2
+    assert [record.prompt for record in store.page("a", 0, 10)] == ["new"]
+    assert store.count("b") == 0
+    if store.full_text_search:
+        assert store.count("a", search="old") == 0
+
+
+def test_add_prunes_about_once_an_hour():
+    store = HistoryStore(":memory:", retention_days=1)
+    store.add("a", entry("old"))
+    age_all(store, 2 * 24 * 60 * 60)
+    store.add("a", entry("new"))
+    assert store.count("a") == 2  # Pruned recently, when the store opened
+
+    store.pruned_at = time.time() - 2 * 60 * 60
+    store.add("a", entry("newer"))
+    assert store.count("a") == 2
+
+
+def test_zero_retention_keeps_texts_forever():
+    store = HistoryStore(":memory:", retention_days=0)
+    store.add("a", entry("old"))
+    age_all(store, 1000 * 24 * 60 * 60)
+    assert store.prune() == 0
+    assert store.count("a") == 1
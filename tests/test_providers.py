@@ -0,0 +1,146 @@
+"""
+Tests for provider routing
+This file checks hedged requests with fake clients, no network needed
+"""
+
+import threading
+import time
+
+import pytest
+
+from utils.providers import Provider, ProviderRegistry
+from utils.resilience import Deadline, DeadlineExceeded
+
+
+class FakeClient:
+    """Answers chat requests after a delay, or fails"""
+
+    def __init__(self, text, delay=0.0, error=None):
+        self.text = text
+        self.delay = delay
+        self.error = error
+        self.threads = []  # Names of the threads that sent requests
+
+    def chat(self, data, call=None, deadline=None):
+        self.threads.append(threading.current_thread().name)
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.text, None
+
+
+def make_provider(name, client, samples=3, latency=0.01):
+    provider = Provider(name, client)
+    for _ in range(samples):
+        provider.record("full", latency, True)
+    return provider
+
+
+def hedged_registry(primary_client, backup_client):
+    primary = make_provider("primary", primary_client)
+    backup = make_provider("backup", backup_client, latency=1.0)  # Ranked after primary
+    return ProviderRegistry([primary, backup], hedge=True, hedge_min_samples=3)
+
+
+def test_primary_runs_on_the_callers_thread():
+    primary = FakeClient("from primary")
+    backup = FakeClient("from backup")
+    registry = hedged_registry(primary, backup)
+    call = {}
+    assert registry.chat({}, call) == ("from primary", None)
+    assert primary.threads == [threading.current_thread().name]
+    assert backup.threads == []
+    assert "hedged" not in call
+
+
+def test_slow_failing_primary_uses_the_backup_already_sent():
+    primary = FakeClient("from primary", delay=0.2, error=ConnectionError("down"))
+    backup = FakeClient("from backup", delay=0.3)
+    registry = hedged_registry(primary, backup)
+    call = {}
+    started = time.perf_counter()
+    assert registry.chat({}, call, Deadline(5)) == ("from backup", None)
+    assert call["hedged"] and call["provider"] == "backup"
+    assert backup.threads[0].startswith("hedge")
+    # The backup was sent at the primary's p95, not after the primary failed
+    assert time.perf_counter() - started < 0.2 + 0.3
+    assert len(backup.threads) == 1
+
+
+def test_slow_primary_that_answers_keeps_its_answer():
+    primary = FakeClient("from primary", delay=0.1)
+    backup = FakeClient("from backup")
+    registry = hedged_registry(primary, backup)
+    call = {}
+    assert registry.chat({}, call) == ("from primary", None)
+    assert call["hedged"] and call["provider"] == "primary"
+
+
+def test_waiting_for_the_backup_stops_at_the_deadline():
+    primary = FakeClient("from primary", delay=0.05, error=ConnectionError("down"))
+    backup = FakeClient("from backup", delay=2.0)
+    registry = hedged_registry(primary, backup)
+    started = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        registry.chat({}, {}, Deadline(0.3))
+    assert time.perf_counter() - started < 1.0
+
+
+class APIError(Exception):
+    """Stands in for utils.api_handler.APIError, only the status code matters"""
+
+    def __init__(self, status_code):
+        super().__init__(f"{status_code} - error")
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("status_code", [400, 413, 422])
+def test_rejected_request_does_not_open_the_circuit_or_fail_over(status_code):
+    primary = FakeClient("from primary", error=APIError(status_code))
+    backup = FakeClient("from backup")
+    registry = ProviderRegistry([Provider("primary", primary, failure_limit=2), Provider("backup", backup)])
+    for _ in range(5):
+        with pytest.raises(APIError):
+            registry.chat({})
+    assert registry.get("primary").healthy()
+    assert backup.threads == []
+
+
+@pytest.mark.parametrize("error", [APIError(429), APIError(503), APIError(408), ConnectionError("down")])
+def test_temporary_errors_fail_over_and_open_the_circuit(error):
+    primary = Provider("primary", FakeClient("from primary", error=error), failure_limit=2)
+    registry = ProviderRegistry([primary, Provider("backup", FakeClient("from backup"))])
+    assert registry.chat({}) == ("from backup", None)
+
+    # Alone, the failing provider's circuit opens after failure_limit errors
+    registry = ProviderRegistry([primary])
+    with pytest.raises(type(error)):
+        registry.chat({})
+    assert not primary.healthy()
+
+
+def test_rejected_hedged_request_does_not_wait_for_the_backup():
+    primary = FakeClient("from primary", delay=0.1, error=APIError(400))
+    backup = FakeClient("from backup", delay=0.1)
+    registry = hedged_registry(primary, backup)
+    with pytest.raises(APIError):
+        registry.chat({}, {}, Deadline(5))
+    assert registry.get("primary").healthy()
+
+
+def test_rejected_stream_does_not_fail_over():
+    class StreamClient(FakeClient):
+        def stream_chat(self, data, on_usage=None, call=None, deadline=None):
+            self.threads.append(threading.current_thread().name)
+            if self.error is not None:
+                raise self.error
+            yield self.text
+
+    primary = StreamClient("from primary", error=APIError(422))
+    backup = StreamClient("from backup")
+    registry = ProviderRegistry([Provider("primary", primary), Provider("backup", backup)])
+    with pytest.raises(APIError):
+        list(registry.stream_chat({}))
+    assert backup.threads == []
+    primary.error = ConnectionError("down")
+    assert list(registry.stream_chat({})) == ["from backup"]
@@ -0,0 +1,118 @@
+"""
+Tests for rate limiting and request coalescing
+This file checks RateLimiter reservations and SingleFlight sharing
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.rate_limiter import RateLimiter, SingleFlight, TokenBucket
+from utils.resilience import Deadline, DeadlineExceeded
+
+
+def test_bucket_allows_a_burst_then_makes_callers_wait():
+    bucket = TokenBucket(capacity=2, refill_per_second=1)
+    now = bucket.updated_at
+    assert bucket.reserve(1, now) == 0.0
+    assert bucket.reserve(1, now) == 0.0
+    assert bucket.reserve(1, now) == pytest.approx(1.0)
+    assert bucket.reserve(1, now) == pytest.approx(2.0)  # Waiting callers stay in line
+
+
+def test_bucket_refund_never_goes_past_capacity():
+    bucket = TokenBucket(capacity=2, refill_per_second=1)
+    bucket.refund(5)
+    assert bucket.tokens == 2
+
+
+def test_acquire_waits_for_the_slower_limit():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60)  # 10 requests, 1 token per second
+    assert limiter.acquire(60) == 0.0
+    assert limiter.reserve(1) == pytest.approx(1.0, abs=0.05)
+    assert limiter.stats()["delayed_requests"] == 1
+
+
+def test_request_that_gives_up_on_its_deadline_frees_its_slot():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60)  # 1 token per second
+    limiter.acquire(60)  # Empties the token bucket
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(1, Deadline(0.1))
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(limiter.acquire_async(1, Deadline(0.1)))
+    # The refused requests didn't push the next one further back
+    assert limiter.reserve(1) == pytest.approx(1.0, abs=0.05)
+    assert limiter.stats()["total_requests"] == 2
+
+
+def test_cancelled_async_wait_frees_its_slot():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60)
+    limiter.acquire(60)
+
+    async def give_up():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire_async(1), 0.05)
+
+    asyncio.run(give_up())
+    assert limiter.stats()["queue_depth"] == 0
+    assert limiter.reserve(1) < 1.0
+
+
+def test_singleflight_runs_once_for_concurrent_callers():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight.stats()["coalesced"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "coalesced": 3}
+
+
+def test_singleflight_shares_errors_and_forgets_finished_keys():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: (_ for _ in ()).throw(ValueError("bad")))
+    assert flight.do("key", lambda: "again") == "again"
+
+
+def test_singleflight_waiting_caller_stops_at_its_deadline():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "late"
+
+    leader = threading.Thread(target=flight.do, args=("key", slow))
+    leader.start()
+    started.wait(5)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            flight.do("key", slow, Deadline(0.05))
+    finally:
+        release.set()
+        leader.join(5)
@@ -0,0 +1,111 @@
+"""
+Tests for failure handling
+This file checks the circuit breaker, deadlines and error classification
+"""
+
+import time
+
+import pytest
+
+from utils.resilience import (
+    CircuitBreaker,
+    Deadline,
+    DeadlineExceeded,
+    GenerationResult,
+    is_provider_failure
+)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+def test_breaker_opens_after_failures_in_a_row():
+    breaker = CircuitBreaker(failure_limit=3, cooldown=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # A success resets the count
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert 59 < breaker.retry_after() <= 60
+    assert breaker.times_opened == 1
+
+
+def test_breaker_lets_one_probe_through_after_the_cooldown():
+    breaker = CircuitBreaker(failure_limit=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # Only one probe at a time
+
+
+def test_failed_probe_opens_the_circuit_again():
+    breaker = CircuitBreaker(failure_limit=3, cooldown=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+
+
+def test_successful_probe_closes_the_circuit():
+    breaker = CircuitBreaker(failure_limit=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.retry_after() == 0.0
+
+
+def test_probe_that_never_reports_back_is_replaced():
+    breaker = CircuitBreaker(failure_limit=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+def test_deadline_shortens_timeouts_and_expires():
+    deadline = Deadline(0.05)
+    assert deadline.timeout(10) <= 0.05
+    assert deadline.timeout(0.01) == 0.01
+    time.sleep(0.06)
+    assert deadline.expired()
+    with pytest.raises(DeadlineExceeded):
+        deadline.check()
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout(10)
+
+
+@pytest.mark.parametrize("error, failure", [
+    (ConnectionError("down"), True),
+    (TimeoutError(), True),
+    (StatusError(408), True),
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (StatusError(400), False),
+    (StatusError(401), False),
+    (StatusError(413), False),
+    (StatusError(422), False),
+])
+def test_only_temporary_errors_are_provider_failures(error, failure):
+    assert is_provider_failure(error) is failure
+
+
+def test_generation_result_states():
+    ok = GenerationResult.success("text")
+    assert ok.ok and not ok.retryable and ok.message == "text" and ok.similarity is None
+    failed = GenerationResult.failure("busy", retryable=True, status_code=429, retry_after=2)
+    assert not failed.ok and failed.retryable and failed.message == "busy"
+    assert not GenerationResult.failure("bad", retryable=False).retryable
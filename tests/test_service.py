@@ -0,0 +1,104 @@
+"""
+Tests for the generation service
+This file checks request parsing without starting a server
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from config.settings import REQUEST_DEADLINE_SECONDS
+from service import MAX_BODY_BYTES, HTTPError, client_identity, parse_generation_request, read_request
+
+
+def read(raw):
+    """Runs read_request on raw request bytes"""
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await read_request(reader)
+    return asyncio.run(run())
+
+
+def test_read_request_returns_method_path_headers_and_body():
+    method, path, headers, body = read(
+        b"POST /v1/generate?x=1 HTTP/1.1\r\nContent-Length: 2\r\nX-Client-Id: a\r\n\r\n{}"
+    )
+    assert (method, path, body) == ("POST", "/v1/generate", b"{}")
+    assert headers["x-client-id"] == "a"
+
+
+def test_read_request_without_body():
+    assert read(b"GET /healthz HTTP/1.1\r\nHost: x\r\n\r\n")[3] == b""
+
+
+def test_client_hang_up_is_not_an_error():
+    assert read(b"GET /healthz HTTP/1.1\r\n") is None
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-5", b"1.5", b"\xb2", b"0x10"])
+def test_malformed_content_length_is_a_400(length):
+    with pytest.raises(HTTPError) as error:
+        read(b"POST /v1/generate HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n{}")
+    assert error.value.status == 400
+
+
+def test_too_large_body_is_a_413():
+    with pytest.raises(HTTPError) as error:
+        read(f"POST / HTTP/1.1\r\nContent-Length: {MAX_BODY_BYTES + 1}\r\n\r\n".encode())
+    assert error.value.status == 413
+
+
+def test_chunked_body_is_a_411_that_closes_the_connection():
+    with pytest.raises(HTTPError) as error:
+        read(b"POST /v1/generate HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n2\r\n{}\r\n0\r\n\r\n")
+    assert error.value.status == 411
+    assert error.value.headers["Connection"] == "close"
+
+
+def test_bad_request_line_is_a_400():
+    with pytest.raises(HTTPError) as error:
+        read(b"NONSENSE\r\n\r\n")
+    assert error.value.status == 400
+
+
+def test_client_id_header_of_an_untrusted_peer_is_ignored():
+    assert client_identity(("203.0.113.7", 5000), {"x-client-id": "someone-else"}) == "203.0.113.7"
+
+
+def test_client_id_header_of_a_trusted_proxy_is_used():
+    headers = {"x-client-id": "team-a"}
+    assert client_identity(("10.0.0.5", 5000), headers, ("10.0.0.5",)) == "10.0.0.5/team-a"
+    assert client_identity(("10.0.0.5", 5000), {}, ("10.0.0.5",)) == "10.0.0.5"
+
+
+def test_parse_uses_app_defaults():
+    arguments = parse_generation_request(json.dumps({"prompt": "Cats"}).encode())
+    assert arguments["prompt"] == "Cats"
+    assert arguments["use_cache"] is True
+    assert 0 < arguments["deadline"].remaining() <= REQUEST_DEADLINE_SECONDS
+
+
+def test_parse_caps_the_timeout():
+    arguments = parse_generation_request(json.dumps({"prompt": "Cats", "timeout": 10 ** 6}).encode())
+    assert arguments["deadline"].remaining() <= REQUEST_DEADLINE_SECONDS
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    b"[1, 2]",
+    b"{}",
+    b'{"prompt": "   "}',
+    b'{"prompt": "Cats", "tone": "Angry"}',
+    b'{"prompt": "Cats", "content_type": "Poem"}',
+    b'{"prompt": "Cats", "length": "Huge"}',
+    b'{"prompt": "Cats", "timeout": 0}',
+    b'{"prompt": "Cats", "timeout": true}',
+    b'{"prompt": "Cats", "timeout": "5"}',
+])
+def test_parse_rejects_invalid_bodies(body):
+    with pytest.raises(HTTPError) as error:
+        parse_generation_request(body)
+    assert error.value.status == 400
@@ -0,0 +1,89 @@
+"""
+Tests for near-duplicate prompt detection
+This file checks that only prompts with the same meaning reuse a result
+"""
+
+import utils.api_handler as api_handler
+from utils.response_cache import ResponseCache
+from utils.similarity import NearDuplicateIndex, numbers, prompt_words
+
+X100 = "Write a product description for the Acme X100 wireless headphones with noise cancelling"
+X200 = "Write a product description for the Acme X200 wireless headphones with noise cancelling"
+EXERCISE = "Write a blog post about 5 health benefits of regular morning exercise for busy office workers"
+
+
+def test_numbers_finds_numbers_inside_words():
+    assert numbers("acme x100 in 2 colors, 3.5 mm jack") == ["100", "2", "3.5"]
+
+
+def test_prompt_words_ignore_case_spaces_and_punctuation():
+    assert prompt_words("Write about  CATS!") == prompt_words("write about cats")
+
+
+def test_finds_prompt_that_differs_only_in_case_spaces_and_punctuation():
+    index = NearDuplicateIndex()
+    index.add(X100, "x100", scope="s")
+    match = index.find("  write a product description for the ACME X100 wireless headphones, with noise cancelling.", "s")
+    assert match == ("x100", 1.0)
+
+
+def test_model_number_change_is_not_a_near_duplicate():
+    index = NearDuplicateIndex()
+    index.add(X100, "x100", scope="s")
+    assert index.find(X200, "s") is None
+    # Even a loose threshold never matches prompts with different numbers
+    assert index.find(X200, "s", threshold=0.1) is None
+
+
+def test_reworded_adjective_is_a_near_duplicate():
+    index = NearDuplicateIndex()
+    index.add(EXERCISE, "exercise", scope="s")
+    match = index.find(EXERCISE.replace("regular", "daily"), "s")
+    assert match is not None and match[0] == "exercise"
+
+
+def test_changed_number_or_topic_is_not_a_near_duplicate():
+    index = NearDuplicateIndex()
+    index.add(EXERCISE, "exercise", scope="s")
+    assert index.find(EXERCISE.replace("5", "7"), "s") is None
+    assert index.find(EXERCISE.replace("regular morning exercise", "a plant based diet"), "s") is None
+
+
+def test_scope_keeps_prompts_apart():
+    index = NearDuplicateIndex()
+    index.add(X100, "x100", scope="friendly")
+    assert index.find(X100, "formal") is None
+
+
+def test_oldest_prompts_are_dropped_past_the_limit():
+    index = NearDuplicateIndex(max_entries=2)
+    for i in range(3):
+        index.add(f"prompt number {i}", f"key{i}")
+    assert len(index) == 2
+    assert index.find("prompt number 0") is None
+    assert index.find("prompt number 2") == ("key2", 1.0)
+
+
+def test_cached_text_never_reuses_another_model_number(monkeypatch):
+    # Fresh in-memory cache and index, so the test doesn't see real results
+    monkeypatch.setattr(api_handler, "response_cache", ResponseCache(db_path=None))
+    monkeypatch.setattr(api_handler, "prompt_index", NearDuplicateIndex())
+    monkeypatch.setattr(api_handler, "NEAR_DUPLICATE_REUSE", True)
+    api_handler._store_text("key-x100", X100, "scope", "The X100 has 30 hours of battery.")
+
+    call = {}
+    assert api_handler._cached_text("key-x200", X200, "scope", call) is None
+    assert "similarity" not in call
+
+    # The same prompt written differently is reused, and the call says so
+    text = api_handler._cached_text("key-x100-loud", X100.upper() + "!", "scope", call)
+    assert text == "The X100 has 30 hours of battery."
+    assert call["cache"] == "near_hit"
+    assert call["similarity"] == 1.0
+
+
+def test_near_duplicate_reuse_is_off_by_default(monkeypatch):
+    monkeypatch.setattr(api_handler, "response_cache", ResponseCache(db_path=None))
+    monkeypatch.setattr(api_handler, "prompt_index", NearDuplicateIndex())
+    api_handler._store_text("key-x100", X100, "scope", "The X100 has 30 hours of battery.")
+    assert api_handler._cached_text("key-x100-loud", X100 + "!", "scope", {}) is None
@@ -0,0 +1,69 @@
+"""
+Tests for streamed length limits
+This file checks that LengthGuard and TextAnalyzer.feed stop at real sentence ends
+"""
+
+from utils.text_processor import TextAnalyzer, analyze_text, count_words
+from utils.token_budget import LengthGuard
+
+# Token-sized pieces, the way the API streams them
+TOKENS = ["One", " two", " three", " four", ".", " Five", " six", " seven", ".", " Eight", " nine", "!"]
+
+
+def stream_until_stop(guard, deltas):
+    """Collects pieces like stream_text does, up to and including the one that stops it"""
+    pieces = []
+    for delta in deltas:
+        pieces.append(delta)
+        if guard.should_stop(delta):
+            break
+    return "".join(pieces)
+
+
+def test_guard_stops_at_the_first_sentence_end_past_the_limit():
+    guard = LengthGuard((0, 3), overrun_factor=1)
+    assert stream_until_stop(guard, TOKENS) == "One two three four."
+
+
+def test_guard_never_stops_one_word_into_a_new_sentence():
+    guard = LengthGuard((0, 5), overrun_factor=1)
+    text = stream_until_stop(guard, TOKENS)
+    assert text == "One two three four. Five six seven."
+    assert not text.endswith("Five")
+
+
+def test_guard_stops_at_sentence_end_followed_by_spaces():
+    guard = LengthGuard((0, 3), overrun_factor=1)
+    assert stream_until_stop(guard, ["One two", " three four. ", "Five six."]) == "One two three four. "
+
+
+def test_guard_keeps_going_below_the_limit():
+    guard = LengthGuard((0, 100))
+    assert stream_until_stop(guard, TOKENS) == "".join(TOKENS)
+
+
+def test_guard_ignores_dots_inside_a_word():
+    guard = LengthGuard((0, 1), overrun_factor=1)
+    assert stream_until_stop(guard, ["Version", " 3", ".5", " is", " out", "."]) == "Version 3.5 is out."
+
+
+def test_feed_in_tokens_matches_whole_text():
+    text = "One two three four. Five six seven.\n\nEight nine! Ten \"eleven.\""
+    analyzer = TextAnalyzer()
+    for i in range(0, len(text), 3):
+        analyzer.feed(text[i:i + 3])
+    result = analyzer.result()
+    assert result == analyze_text(text)
+    assert result["words"] == count_words(text)
+    assert result["sentences"] == 4
+    assert result["paragraphs"] == 2
+
+
+def test_feed_holds_back_the_last_word():
+    analyzer = TextAnalyzer()
+    analyzer.feed("One two three four. Fi")
+    assert analyzer.words == 4
+    assert analyzer.fed_words() == 5
+    assert not analyzer.at_sentence_end()
+    analyzer.feed("ve.")
+    assert analyzer.at_sentence_end()
@@ -3,21 +3,516 @@ Functions for communicating with Groq API
 This file manages API calls and error handling
 """
 
+import json  # For parsing streamed chunks
 import os
+import random  # For random jitter between retries
+import threading  # For per-thread connection timing
+import time  # For waiting between retries and measuring calls
+from concurrent.futures import ThreadPoolExecutor, as_completed  # For parallel API calls
+from email.utils import parsedate_to_datetime  # For Retry-After headers given as a date
 import requests  # For HTTP requests
+from requests.adapters import HTTPAdapter  # For connection pool settings
+from urllib3.connection import HTTPConnection, HTTPSConnection  # For timing new connections
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from dotenv import load_dotenv
+from config.settings import (
+    MAX_PARALLEL_REQUESTS,  # Upper bound for parallel calls
+    HTTP_POOL_SIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+    REQUEST_DEADLINE_SECONDS,
+    RATE_LIMIT_REQUESTS_PER_MINUTE,
+    RATE_LIMIT_TOKENS_PER_MINUTE,
+    PROVIDERS,
+    NEAR_DUPLICATE_REUSE
+)
+from utils.metrics import MetricsRegistry  # For per-call telemetry
+from utils.providers import Provider, ProviderRegistry  # For routing between providers
+from utils.rate_limiter import RateLimiter, SingleFlight  # For staying under provider limits
+from utils.resilience import (  # For structured results, fail-fast and time budgets
+    RETRYABLE_STATUS_CODES,
+    Deadline,
+    DeadlineExceeded,
+    CircuitOpenError,
+    GenerationResult,
+    GenerationError
+)
+from utils.response_cache import ResponseCache  # For reusing results of identical requests
+from utils.similarity import NearDuplicateIndex  # For reusing results of almost identical requests
+from utils.text_processor import clean_text, analyze_text  # For normalizing prompts and counting words
+from utils.token_budget import estimate_tokens, plan_max_tokens, LengthGuard, DriftTracker
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Groq API information
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")  # Get API key from .env file
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"  # Groq API endpoint
+# Groq API endpoint, can be pointed at a local mock server with the GROQ_API_URL variable
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
 
 
-def generate_text(prompt, content_type, tone, length):
+class APIError(Exception):
+    """Raised when the API answers with an error status code"""
+
+    def __init__(self, status_code, body):
+        super().__init__(f"{status_code} - {body}")
+        self.status_code = status_code  # HTTP status code, e.g. 429
+        self.body = body  # Response text sent by the API
+
+
+# Time spent opening the last new connection, per thread
+# Stays 0 when a kept-alive connection is reused
+_connect_timing = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """HTTP connection that remembers how long connecting took"""
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _connect_timing.seconds = time.perf_counter() - started
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS connection that remembers how long connecting (TCP + TLS) took"""
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _connect_timing.seconds = time.perf_counter() - started
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """Connection pool adapter whose connections record their connect time"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool
+        }
+
+
+class GroqClient:
     """
-    Generates text using Groq API
+    Reusable HTTP client for the Groq API
+
+    Keeps one pooled session with keep-alive connections, so repeated calls
+    skip the TCP and TLS handshake. Temporary errors are retried with
+    jittered exponential backoff. Works with any OpenAI-compatible chat
+    completions endpoint, such as xAI or a local server.
+    """
+
+    def __init__(self, api_url=GROQ_API_URL, api_key=GROQ_API_KEY, pool_size=HTTP_POOL_SIZE,
+                 connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 max_retries=HTTP_MAX_RETRIES, backoff_base=HTTP_BACKOFF_BASE,
+                 backoff_max=HTTP_BACKOFF_MAX, rate_limiter=None, model=None):
+        """
+        Creates the client and its connection pool
+
+        Args:
+            api_url (str): Chat completions endpoint
+            api_key (str): API key sent in the Authorization header, None sends no key
+            pool_size (int): Maximum number of kept-alive connections
+            connect_timeout (float): Seconds to wait for a connection
+            read_timeout (float): Seconds to wait for the response
+            max_retries (int): How many times a failed request is tried again
+            backoff_base (float): First retry delay in seconds
+            backoff_max (float): Longest allowed retry delay in seconds
+            rate_limiter (RateLimiter): Shared limiter every request waits for, None for no limit
+            model (str): Model name put into every request, None keeps the request's model
+        """
+        self.api_url = api_url
+        # Model list endpoint next to the chat endpoint, used for warm-up
+        self.models_url = api_url.rsplit("/chat/completions", 1)[0] + "/models"
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)  # requests accepts (connect, read) tuple
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+
+        # Session keeps connections open between requests
+        # Headers are created once and sent with every request
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        if api_key is not None:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+        # Adapter holds the connection pool
+        # pool_maxsize is how many connections can be kept open at the same time
+        adapter = _TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def warm_up(self):
+        """
+        Opens a kept-alive connection before the first real request
+
+        Asks for the model list, a cheap GET that goes through DNS, TCP and
+        TLS just like a chat request. The connection stays in the pool, so
+        the first generation skips the handshake. Any answer counts, even an
+        error status, and nothing is counted against the rate limit.
+
+        Returns:
+            float: Milliseconds spent connecting, 0 if a connection was already open
+
+        Raises:
+            requests.RequestException: If the API can't be reached
+        """
+        _connect_timing.seconds = 0.0
+        # Body is read right away, so the connection goes back to the pool
+        self.session.get(self.models_url, timeout=self.timeout)
+        return _connect_timing.seconds * 1000
+
+    def post(self, data, stream=False, call=None, deadline=None):
+        """
+        Sends a request to the API and retries temporary errors
+
+        Args:
+            data (dict): JSON body of the request
+            stream (bool): Whether the response body should be streamed
+            call (dict): Telemetry of the call, filled with connect time, time to first byte and retries
+            deadline (Deadline): Time budget of the whole request, None for no limit
+
+        Returns:
+            requests.Response: Successful response (status code 200)
+
+        Raises:
+            APIError: If the API answers with an error that can't be retried
+            DeadlineExceeded: If the time budget runs out
+            requests.RequestException: If the connection keeps failing
+        """
+        if call is None:
+            call = {}  # Telemetry is optional, collect into a throwaway dictionary
+        call.setdefault("retries", 0)
+        if self.model is not None:
+            # Each provider has its own model names
+            data = {**data, "model": self.model}
+        call.setdefault("connect_ms", 0.0)
+
+        attempt = 0
+        while True:
+            # Every try counts against the rate limit, retries included
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(estimate_request_tokens(data), deadline)
+
+            # Timeouts never reach past the deadline
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = tuple(deadline.timeout(limit) for limit in self.timeout)
+
+            call["retries"] = attempt
+            _connect_timing.seconds = 0.0
+            try:
+                response = self.session.post(self.api_url, json=data, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(deadline) from e
+                # Network problem, try again until retries run out
+                if attempt >= self.max_retries:
+                    raise
+                self._wait_before_retry(attempt, None, deadline, e)
+                attempt += 1
+                continue
+
+            # Connect time is 0 when a kept-alive connection was reused
+            # elapsed is the time from sending the request until the response headers arrived
+            call["connect_ms"] += _connect_timing.seconds * 1000
+            call["ttfb_ms"] = response.elapsed.total_seconds() * 1000
+            call["status_code"] = response.status_code
+
+            if response.status_code == 200:
+                return response
+
+            # Error response, read the body so the connection goes back to the pool
+            error = APIError(response.status_code, response.text)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                raise error
+
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            self._wait_before_retry(attempt, retry_after, deadline, error)
+            attempt += 1
+
+    def chat(self, data, call=None, deadline=None):
+        """
+        Sends a chat completion request and returns the generated text
+
+        Args:
+            data (dict): JSON body of the request
+            call (dict): Telemetry of the call, see post()
+            deadline (Deadline): Time budget of the whole request, None for no limit
+
+        Returns:
+            tuple: (generated text, "usage" block with token counts or None)
+        """
+        result = self.post(data, call=call, deadline=deadline).json()  # Parse JSON response
+        generated_text = result["choices"][0]["message"]["content"]  # Get generated text
+        return generated_text, result.get("usage")
+
+    def stream_chat(self, data, on_usage=None, call=None, deadline=None):
+        """
+        Sends a streaming chat completion request
+
+        The API answers with server-sent events, one "data: {...}" line per
+        piece of text, and a final "data: [DONE]" line.
+
+        Args:
+            data (dict): JSON body of the request
+            on_usage (callable): Called with the "usage" block when the API sends it
+            call (dict): Telemetry of the call, see post()
+            deadline (Deadline): Time budget of the whole request, None for no limit
+
+        Yields:
+            str: Next piece of generated text
+
+        Raises:
+            DeadlineExceeded: If the time budget runs out while the text is streaming
+        """
+        response = self.post({**data, "stream": True}, stream=True, call=call, deadline=deadline)
+
+        # with block returns the connection to the pool even if the caller stops early
+        with response:
+            response.encoding = "utf-8"  # SSE is always UTF-8
+            for line in response.iter_lines(decode_unicode=True):
+                if deadline is not None:
+                    deadline.check()
+                # Skip empty keep-alive lines and comments
+                if not line or not line.startswith("data:"):
+                    continue
+
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+
+                chunk = json.loads(payload)
+
+                # Token counts come with the last chunk
+                # Groq puts them under "x_groq", OpenAI-compatible servers under "usage"
+                usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+                if usage and on_usage is not None:
+                    on_usage(usage)
+
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+
+                # delta holds only the new piece of text
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """
+        Calculates how long to wait before the next try
+
+        Args:
+            attempt (int): Number of the failed try, starting from 0
+            retry_after (float): Delay the server asked for, if any
+
+        Returns:
+            float: Seconds to wait
+        """
+        # Exponential backoff with full jitter: 0-0.5s, 0-1s, 0-2s ...
+        # Jitter stops many clients from retrying at exactly the same moment
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+        # If the server told us when to come back, wait at least that long
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _wait_before_retry(self, attempt, retry_after, deadline, error):
+        """
+        Sleeps before the next try, or raises error if the try would come too late
+
+        Args:
+            attempt (int): Number of the failed try, starting from 0
+            retry_after (float): Delay the server asked for, if any
+            deadline (Deadline): Time budget of the request, None for no limit
+            error (Exception): Error of the failed try
+        """
+        delay = self._backoff_delay(attempt, retry_after)
+        # No time left for another try after waiting, the real error says more than a timeout
+        if deadline is not None and delay >= deadline.remaining():
+            raise error
+        time.sleep(delay)
+
+
+def estimate_request_tokens(data):
+    """
+    Roughly estimates how many tokens a request uses
+
+    Args:
+        data (dict): JSON body of the request
+
+    Returns:
+        int: Estimated prompt tokens plus max_tokens
+    """
+    prompt_tokens = sum(estimate_tokens(message["content"]) for message in data["messages"])
+    return prompt_tokens + data.get("max_tokens", 0)
+
+
+def _parse_retry_after(value):
+    """
+    Reads a Retry-After header value
+
+    Args:
+        value (str): Header value, either seconds or an HTTP date
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # Date form, e.g. "Wed, 21 Oct 2015 07:28:00 GMT"
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# One rate limiter shared by the whole process
+# All Streamlit sessions together stay under the provider's limits
+rate_limiter = RateLimiter(RATE_LIMIT_REQUESTS_PER_MINUTE, RATE_LIMIT_TOKENS_PER_MINUTE)
+
+
+def _is_configured(config):
+    """Returns True if a provider's API key or its URL is set"""
+    # A changed URL counts too, e.g. a local mock server or proxy that needs no key
+    return any(os.getenv(name) is not None for name in (config["key_env"], config["url_env"]) if name)
+
+
+def _make_provider(name, config):
+    """
+    Creates a provider and its HTTP client from one PROVIDERS entry
+
+    Args:
+        name (str): Provider name
+        config (dict): Settings of the provider
+
+    Returns:
+        Provider: Provider with its own connection pool
+    """
+    # Groq shares the process-wide limiter, so its stats show up in the performance panel
+    if name == "groq":
+        limiter = rate_limiter
+    elif config["rate_limited"]:
+        limiter = RateLimiter(RATE_LIMIT_REQUESTS_PER_MINUTE, RATE_LIMIT_TOKENS_PER_MINUTE)
+    else:
+        limiter = None
+
+    client = GroqClient(
+        api_url=os.getenv(config["url_env"]) or config["api_url"],
+        api_key=os.getenv(config["key_env"]) if config["key_env"] else None,
+        rate_limiter=limiter,
+        model=config["model"]
+    )
+    return Provider(name, client)
+
+
+def _build_providers():
+    """
+    Creates a provider for every configured API in PROVIDERS
+
+    Groq is added even without a key when nothing is configured, so a
+    missing key gives the same error message as before.
+
+    Returns:
+        list: Provider objects in the order of PROVIDERS
+    """
+    providers = [_make_provider(name, config) for name, config in PROVIDERS.items() if _is_configured(config)]
+    return providers or [_make_provider("groq", PROVIDERS["groq"])]
+
+
+# Providers shared by the whole process
+# Every Streamlit session reuses the same kept-alive connections
+provider_registry = ProviderRegistry(_build_providers())
+
+# Client of the preferred provider
+client = provider_registry.providers[0].client
+
+# Identical requests running at the same time share one API call
+singleflight = SingleFlight()
+
+# Actual versus target length of every generated text
+drift_tracker = DriftTracker()
+
+# One cache shared by the whole process
+# Identical requests from any session are answered without calling the API
+response_cache = ResponseCache()
+
+# Prompts of cached results, so almost identical prompts can reuse them
+prompt_index = NearDuplicateIndex()
+
+# Timings, token counts and outcomes of every generation call
+metrics = MetricsRegistry()
+
+
+def warm_up():
+    """
+    Opens a connection to every provider before the first generation
+
+    The first call of a fresh process otherwise pays for DNS, TCP and TLS
+    while the user waits. Providers are warmed up one after another; a
+    provider that can't be reached is left for the real request to report.
+
+    Returns:
+        dict: Provider name -> connect time in milliseconds, or the error message
+    """
+    results = {}
+    for provider in provider_registry.providers:
+        try:
+            results[provider.name] = provider.client.warm_up()
+        except requests.RequestException as e:
+            results[provider.name] = str(e)
+    return results
+
+
+def _failure_result(error):
+    """
+    Turns an exception raised while generating into a failed result
+
+    Temporary problems (timeouts, lost connections, rate limits, server
+    errors, open circuits) are retryable; everything else is fatal.
+
+    Args:
+        error (Exception): The exception
+
+    Returns:
+        GenerationResult: Failed result with the message shown to the user
+    """
+    if isinstance(error, APIError):
+        return GenerationResult.failure(
+            f"API Error: {error.status_code} - {error.body}",
+            retryable=error.status_code in RETRYABLE_STATUS_CODES,
+            status_code=error.status_code
+        )
+    if isinstance(error, CircuitOpenError):
+        return GenerationResult.failure(f"Error occurred: {error}", retryable=True, retry_after=error.retry_after)
+    retryable = isinstance(error, (DeadlineExceeded, requests.ConnectionError, requests.Timeout))
+    return GenerationResult.failure(f"Error occurred: {str(error)}", retryable=retryable)
+
+
+def build_request(prompt, content_type, tone, length):
+    """
+    Creates the JSON body for a chat completion request
 
     Args:
         prompt (str): Topic or instruction written by user
@@ -26,51 +521,437 @@ def generate_text(prompt, content_type, tone, length):
         length (tuple): Minimum and maximum word count
 
     Returns:
-        str: Generated text or error message
+        dict: Data to send to API
     """
-
-    try:
-        # Create system prompt (telling AI its role)
-        system_prompt = f"""You are a professional content writer. 
+    # Create system prompt (telling AI its role)
+    system_prompt = f"""You are a professional content writer. 
         Your task is to create {content_type} type content.
         Tone: {tone}
         Length: Must be between {length[0]}-{length[1]} words."""
 
-        # Required headers for API request
-        # Authorization header sends the API key
-        # Bearer keyword specifies token type
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
+    return build_chat_request([
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ], length)
 
-        # Data to send to API
-        # model: One of the available models in Groq
-        # llama-3.1-8b-instant is a fast and lightweight model
-        data = {
-            "model": "llama-3.1-8b-instant",  # Groq's best general-purpose model
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7,  # Creativity level (0-2 range, 0.7 is balanced)
-            "max_tokens": 2000  # Maximum number of tokens to generate
-        }
 
-        # Send POST request to API
-        # timeout parameter means wait 30 seconds, then timeout
-        response = requests.post(GROQ_API_URL, headers=headers, json=data, timeout=30)
+def build_chat_request(messages, length):
+    """
+    Creates the JSON body for a chat completion request from ready messages
+
+    Args:
+        messages (list): Chat messages, dicts with "role" and "content"
+        length (tuple): Minimum and maximum word count of the answer
 
-        # Check response
-        # 200 status code means success
-        if response.status_code == 200:
-            result = response.json()  # Parse JSON response
-            generated_text = result["choices"][0]["message"]["content"]  # Get generated text
-            return generated_text
-        else:
-            # If there's an error, return error code and message
-            return f"API Error: {response.status_code} - {response.text}"
+    Returns:
+        dict: Data to send to API
+    """
+    # Data to send to API
+    # model: One of the available models in Groq
+    # llama-3.1-8b-instant is a fast and lightweight model
+    return {
+        "model": "llama-3.1-8b-instant",  # Groq's best general-purpose model
+        "messages": messages,
+        "temperature": 0.7,  # Creativity level (0-2 range, 0.7 is balanced)
+        "max_tokens": plan_max_tokens(length)  # Token budget sized for the selected length
+    }
+
+
+def cache_key(prompt, content_type, tone, length, data, variant=0):
+    """
+    Creates the response cache key for a request
+
+    Prompts that differ only in spaces or letter case share the same key.
+    The key names every configured provider and model instead of the
+    request's model, so results of another provider setup are never reused.
+
+    Args:
+        prompt (str): Topic or instruction written by user
+        content_type (str): Content type description
+        tone (str): Tone description
+        length (tuple): Minimum and maximum word count
+        data (dict): Request body from build_request
+        variant (int): Version number
+
+    Returns:
+        str: Cache key
+    """
+    normalized_prompt = clean_text(prompt).lower()
+    return ResponseCache.make_key(
+        normalized_prompt, content_type, tone, length,
+        provider_registry.models(data["model"]), data["temperature"], variant
+    )
+
+
+def prompt_scope(content_type, tone, length, data, variant=0):
+    """
+    Creates the near-duplicate scope of a request
+
+    Everything except the prompt must match exactly, so a similar prompt
+    with another tone or length never reuses a result.
+
+    Returns:
+        str: Cache key of the request with an empty prompt
+    """
+    return cache_key("", content_type, tone, length, data, variant)
+
+
+def _cached_text(key, prompt, scope, call):
+    """
+    Looks up a result for a request, first exact, then for an almost identical prompt
+
+    Args:
+        key (str): Exact cache key
+        prompt (str): Prompt written by user
+        scope (str): Near-duplicate scope from prompt_scope
+        call (dict): Telemetry record, gets the cache outcome
+
+    Returns:
+        str: Cached text, or None on a miss
+    """
+    cached_text = response_cache.get(key)
+    if cached_text is not None:
+        call["cache"] = "hit"
+        return cached_text
+
+    if NEAR_DUPLICATE_REUSE:
+        match = prompt_index.find(prompt, scope)
+        if match is not None:
+            cached_text = response_cache.get(match[0])
+            if cached_text is not None:
+                call["cache"] = "near_hit"
+                call["similarity"] = match[1]
+                return cached_text
+    return None
+
+
+def _store_text(key, prompt, scope, text):
+    """Saves a successful result in the cache and indexes its prompt, if there is one"""
+    response_cache.set(key, text)
+    if prompt is not None:
+        prompt_index.add(prompt, key, scope)
+
+
+def generate_text(prompt, content_type, tone, length, use_cache=True, variant=0, deadline=None):
+    """
+    Generates text using Groq API
+
+    Args:
+        prompt (str): Topic or instruction written by user
+        content_type (str): Content type description
+        tone (str): Tone description
+        length (tuple): Minimum and maximum word count
+        use_cache (bool): False skips cached results and asks for a fresh variation
+        variant (int): Version number, each version is cached separately
+        deadline (Deadline): Time budget, None starts a new one of REQUEST_DEADLINE_SECONDS
+
+    Returns:
+        GenerationResult: Generated text, or whether and why the request failed
+    """
+
+    # Telemetry of this call, recorded when the call ends
+    call = _new_call(stream=False, use_cache=use_cache)
+    started = time.perf_counter()
+    if deadline is None:
+        deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+
+    try:
+        data = build_request(prompt, content_type, tone, length)
+        key = cache_key(prompt, content_type, tone, length, data, variant)
+        scope = prompt_scope(content_type, tone, length, data, variant)
+
+        # Return saved result if the same or an almost identical request was made before
+        if use_cache:
+            cached_text = _cached_text(key, prompt, scope, call)
+            if cached_text is not None:
+                # similarity is only set when the text was written for another prompt
+                return GenerationResult.success(cached_text, call.get("similarity"))
+
+        # Send request through the shared client
+        # Client retries temporary errors like 429 and 503 by itself
+        if not use_cache:
+            # A fresh variation was asked for, so it never gets the answer of a request already running
+            return GenerationResult.success(_chat_and_cache(key, prompt, scope, data, length, call, deadline))
+
+        # If the same request is already running, wait for its result instead
+        generated_text = singleflight.do(
+            key, lambda: _chat_and_cache(key, prompt, scope, data, length, call, deadline), deadline
+        )
+        if not call["upstream"]:
+            call["cache"] = "coalesced"
+        return GenerationResult.success(generated_text)
+
+    except Exception as e:
+        # API error, timeout, internet disconnected, every provider down, etc.
+        call["status"] = "error"
+        return _failure_result(e)
+
+    finally:
+        call["total_ms"] = (time.perf_counter() - started) * 1000
+        metrics.record_call(call)
+
+
+def complete(messages, length, use_cache=True, variant=0, deadline=None):
+    """
+    Generates text for ready-made chat messages
+
+    Used for requests that don't follow the build_request prompt, e.g. the
+    outline and sections of long texts. Results are cached by their exact
+    messages; near-duplicate reuse only applies to generate_text.
+
+    Args:
+        messages (list): Chat messages, dicts with "role" and "content"
+        length (tuple): Minimum and maximum word count of the answer
+        use_cache (bool): False skips cached results and asks for a fresh variation
+        variant (int): Version number, each version is cached separately
+        deadline (Deadline): Time budget, None starts a new one of REQUEST_DEADLINE_SECONDS
+
+    Returns:
+        GenerationResult: Generated text, or whether and why the request failed
+    """
+    call = _new_call(stream=False, use_cache=use_cache)
+    started = time.perf_counter()
+    if deadline is None:
+        deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+
+    try:
+        data = build_chat_request(messages, length)
+        key = ResponseCache.make_key(
+            json.dumps(messages), "messages", "", length,
+            data["model"], data["temperature"], variant
+        )
+
+        if use_cache:
+            cached_text = response_cache.get(key)
+            if cached_text is not None:
+                call["cache"] = "hit"
+                return GenerationResult.success(cached_text)
+
+        if not use_cache:
+            return GenerationResult.success(_chat_and_cache(key, None, None, data, length, call, deadline))
+
+        generated_text = singleflight.do(
+            key, lambda: _chat_and_cache(key, None, None, data, length, call, deadline), deadline
+        )
+        if not call["upstream"]:
+            call["cache"] = "coalesced"
+        return GenerationResult.success(generated_text)
 
     except Exception as e:
-        # If an exception occurs (internet disconnected, timeout, etc.)
-        return f"Error occurred: {str(e)}"
\ No newline at end of file
+        call["status"] = "error"
+        return _failure_result(e)
+
+    finally:
+        call["total_ms"] = (time.perf_counter() - started) * 1000
+        metrics.record_call(call)
+
+
+def _new_call(stream, use_cache):
+    """
+    Creates an empty telemetry record for one generation call
+
+    Args:
+        stream (bool): Whether the call streams
+        use_cache (bool): Whether the cache may answer the call
+
+    Returns:
+        dict: Telemetry record, filled while the call runs
+    """
+    return {
+        "started_at": time.time(),
+        "stream": stream,
+        "cache": "miss" if use_cache else "bypass",
+        "status": "ok",
+        "upstream": False,  # True once this call itself sends a request to the API
+        "retries": 0
+    }
+
+
+def _record_usage(call, usage):
+    """Copies token counts from the API's usage block into a telemetry record"""
+    if usage:
+        call["prompt_tokens"] = usage.get("prompt_tokens")
+        call["completion_tokens"] = usage.get("completion_tokens")
+
+
+def _chat_and_cache(key, prompt, scope, data, length, call, deadline=None):
+    """
+    Calls the API and saves the result in the cache
+
+    Args:
+        key (str): Cache key
+        prompt (str): Prompt written by user, indexed for near-duplicate reuse, None skips indexing
+        scope (str): Near-duplicate scope from prompt_scope
+        data (dict): Request body
+        length (tuple): Minimum and maximum word count, for length drift tracking
+        call (dict): Telemetry record of the call
+        deadline (Deadline): Time budget of the request, None for no limit
+
+    Returns:
+        str: Generated text
+    """
+    call["upstream"] = True
+    generated_text, usage = provider_registry.chat(data, call=call, deadline=deadline)
+    _record_usage(call, usage)
+    drift_tracker.record(length, analyze_text(generated_text)["words"], usage, data["max_tokens"])
+
+    # Only successful results are saved, error messages never reach the cache
+    _store_text(key, prompt, scope, generated_text)
+    return generated_text
+
+
+def get_traffic_stats():
+    """
+    Returns rate limiter, coalescing and cache counters
+
+    Returns:
+        dict: Statistics grouped by component
+    """
+    return {
+        "rate_limiter": rate_limiter.stats(),
+        "singleflight": singleflight.stats(),
+        "cache": response_cache.stats(),
+        "length_drift": drift_tracker.stats(),
+        "providers": provider_registry.stats()
+    }
+
+
+def _traffic_gauges():
+    """Flattens traffic statistics into gauges for the Prometheus exporter"""
+    limiter = rate_limiter.stats()
+    cache = response_cache.stats()
+    gauges = {}
+    for name, stats in provider_registry.stats().items():
+        gauges[f"provider_{name}_healthy"] = int(stats["healthy"])
+        gauges[f"provider_{name}_circuit_opened"] = stats["circuit_opened"]
+        gauges[f"provider_{name}_error_rate"] = stats["error_rate"]
+        gauges[f"provider_{name}_full_p50_ms"] = stats["full_p50_ms"]
+        gauges[f"provider_{name}_stream_p50_ms"] = stats["stream_p50_ms"]
+    return {
+        **gauges,
+        "rate_limit_queue_depth": limiter["queue_depth"],
+        "rate_limit_max_queue_depth": limiter["max_queue_depth"],
+        "rate_limit_average_wait_seconds": limiter["average_wait_seconds"],
+        "rate_limit_max_wait_seconds": limiter["max_wait_seconds"],
+        "singleflight_in_flight": singleflight.stats()["in_flight"],
+        "singleflight_coalesced": singleflight.stats()["coalesced"],
+        "cache_hit_ratio": cache["hit_ratio"],
+        "cache_memory_entries": cache["memory_entries"],
+        "prompt_index_entries": len(prompt_index)
+    }
+
+
+metrics.add_gauge_source(_traffic_gauges)
+
+
+def stream_text(prompt, content_type, tone, length, use_cache=True, deadline=None, on_reuse=None):
+    """
+    Generates text using Groq API and yields it piece by piece
+
+    Text pieces are yielded as soon as the API sends them, so the first
+    words can be shown long before the whole text is ready.
+
+    Args:
+        prompt (str): Topic or instruction written by user
+        content_type (str): Content type description
+        tone (str): Tone description
+        length (tuple): Minimum and maximum word count
+        use_cache (bool): False skips cached results and asks for a fresh variation
+        deadline (Deadline): Time budget, None starts a new one of REQUEST_DEADLINE_SECONDS
+        on_reuse (callable): Called with the similarity when the text of an almost identical prompt is reused
+
+    Yields:
+        str: Next piece of generated text
+
+    Raises:
+        GenerationError: If the text can't be finished, with the failed GenerationResult
+    """
+    # Telemetry of this call, recorded when the stream ends
+    call = _new_call(stream=True, use_cache=use_cache)
+    started = time.perf_counter()
+    if deadline is None:
+        deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+
+    try:
+        data = build_request(prompt, content_type, tone, length)
+        key = cache_key(prompt, content_type, tone, length, data)
+        scope = prompt_scope(content_type, tone, length, data)
+
+        # Cached text is sent as one piece
+        if use_cache:
+            cached_text = _cached_text(key, prompt, scope, call)
+            if cached_text is not None:
+                if on_reuse is not None and "similarity" in call:
+                    on_reuse(call["similarity"])
+                yield cached_text
+                return
+
+        # Collect pieces so the complete text can be cached at the end
+        pieces = []
+        usage = {}  # Filled by stream_chat when the last chunk arrives
+        guard = LengthGuard(length)
+        call["upstream"] = True
+        for delta in provider_registry.stream_chat(data, on_usage=usage.update, call=call, deadline=deadline):
+            if not pieces:
+                call["ttft_ms"] = (time.perf_counter() - started) * 1000  # Time to first token
+            pieces.append(delta)
+            yield delta
+
+            # Stop reading once the text is clearly longer than requested
+            if guard.should_stop(delta):
+                break
+
+        # Stream finished without an error, save the complete text
+        generated_text = "".join(pieces)
+        _record_usage(call, usage)
+        drift_tracker.record(length, guard.analyzer.result()["words"], usage or None, data["max_tokens"])
+        _store_text(key, prompt, scope, generated_text)
+
+    except Exception as e:
+        # API error, timeout, internet disconnected, every provider down, etc.
+        call["status"] = "error"
+        raise GenerationError(_failure_result(e)) from e
+
+    finally:
+        # Also runs when the reader stops early
+        call["total_ms"] = (time.perf_counter() - started) * 1000
+        metrics.record_call(call)
+
+
+def generate_versions(prompt, content_type, tone, length, num_versions, use_cache=True, deadline=None):
+    """
+    Generates several versions of the same text in parallel
+
+    All requests are sent at once from a small thread pool, so generating
+    3 versions takes about as long as generating 1. All versions share one
+    deadline, so the whole set is done within the time budget.
+
+    Args:
+        prompt (str): Topic or instruction written by user
+        content_type (str): Content type description
+        tone (str): Tone description
+        length (tuple): Minimum and maximum word count
+        num_versions (int): How many versions to generate
+        use_cache (bool): False skips cached results and asks for fresh variations
+        deadline (Deadline): Time budget, None starts a new one of REQUEST_DEADLINE_SECONDS
+
+    Yields:
+        tuple: (version index starting from 0, GenerationResult)
+               in the order the results arrive, not in version order
+    """
+    # Never open more threads than requests, and never more than the configured limit
+    workers = max(1, min(num_versions, MAX_PARALLEL_REQUESTS))
+    if deadline is None:
+        deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Submit every version at once and remember which future belongs to which version
+        futures = {
+            executor.submit(generate_text, prompt, content_type, tone, length, use_cache, i, deadline): i
+            for i in range(num_versions)
+        }
+
+        # as_completed gives back each future as soon as its result is ready
+        # generate_text never raises, it returns failures as results
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1,424 @@
+"""
+Asyncio version of the text generation functions
+This file generates texts on an event loop, without a thread per request
+"""
+
+import asyncio  # For waiting between retries and coalescing requests
+import json  # For parsing streamed chunks
+import time  # For measuring calls
+import httpx  # For async HTTP requests with a connection pool
+from config.settings import SERVICE_POOL_SIZE, REQUEST_DEADLINE_SECONDS
+from utils.api_handler import (
+    APIError,
+    RETRYABLE_STATUS_CODES,
+    build_request,
+    cache_key,
+    prompt_scope,
+    estimate_request_tokens,
+    provider_registry,
+    drift_tracker,
+    metrics,
+    _parse_retry_after,
+    _failure_result,
+    _cached_text,
+    _store_text,
+    _new_call,
+    _record_usage
+)
+from utils.resilience import Deadline, DeadlineExceeded, CircuitOpenError, GenerationResult, GenerationError
+from utils.text_processor import analyze_text  # For counting words of finished texts
+from utils.token_budget import LengthGuard  # For stopping streams that run too long
+
+
+def _async_failure_result(error):
+    """Turns an exception into a failed result, see utils.api_handler._failure_result"""
+    # Network errors of httpx are temporary, like those of requests
+    if isinstance(error, httpx.TransportError):
+        return GenerationResult.failure(f"Error occurred: {str(error)}", retryable=True)
+    return _failure_result(error)
+
+
+class AsyncChatClient:
+    """
+    Async HTTP client for one provider
+
+    Takes its address, key, model, timeouts, retry settings and rate
+    limiter from the provider's GroqClient, so both clients behave the same.
+    """
+
+    def __init__(self, client, max_connections=SERVICE_POOL_SIZE):
+        """
+        Creates the client and its connection pool
+
+        Args:
+            client (GroqClient): Blocking client whose settings are copied
+            max_connections (int): Maximum number of open connections
+        """
+        self.client = client
+        connect_timeout, read_timeout = client.timeout
+        # One pool of kept-alive connections shared by every request on the event loop
+        self.http = httpx.AsyncClient(
+            headers=dict(client.session.headers),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        # Requests wait for a connection here instead of in the httpx pool,
+        # which rechecks every waiting request whenever a connection frees up
+        self.slots = asyncio.Semaphore(max_connections)
+
+    async def post(self, data, stream=False, call=None, deadline=None):
+        """
+        Sends a request and retries temporary errors, see GroqClient.post
+
+        Args:
+            data (dict): JSON body of the request
+            stream (bool): Whether the response body should be streamed
+            call (dict): Telemetry of the call, filled with time to first byte and retries
+            deadline (Deadline): Time budget of the whole request, None for no limit
+
+        Returns:
+            httpx.Response: Successful response, call aclose() on streamed responses
+
+        Raises:
+            APIError: If the API answers with an error that can't be retried
+            DeadlineExceeded: If the time budget runs out
+            httpx.HTTPError: If the connection keeps failing
+        """
+        if call is None:
+            call = {}
+        call.setdefault("retries", 0)
+        if self.client.model is not None:
+            data = {**data, "model": self.client.model}
+
+        attempt = 0
+        while True:
+            # Every try counts against the rate limit, retries included
+            if self.client.rate_limiter is not None:
+                await self.client.rate_limiter.acquire_async(estimate_request_tokens(data), deadline)
+
+            # Timeouts never reach past the deadline
+            connect_timeout, read_timeout = self.client.timeout
+            if deadline is not None:
+                connect_timeout, read_timeout = deadline.timeout(connect_timeout), deadline.timeout(read_timeout)
+
+            call["retries"] = attempt
+            started = time.perf_counter()
+            try:
+                request = self.http.build_request(
+                    "POST", self.client.api_url, json=data,
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+                )
+                response = await self.http.send(request, stream=stream)
+            except (httpx.ConnectError, httpx.TimeoutException, httpx.RemoteProtocolError) as e:
+                if deadline is not None and deadline.expired():
+                    raise DeadlineExceeded(deadline) from e
+                # Network problem, try again until retries run out
+                if attempt >= self.client.max_retries:
+                    raise
+                await self._wait_before_retry(attempt, None, deadline, e)
+                attempt += 1
+                continue
+
+            # send() returns as soon as the response headers have arrived
+            call["ttfb_ms"] = (time.perf_counter() - started) * 1000
+            call["status_code"] = response.status_code
+
+            if response.status_code == 200:
+                return response
+
+            # Error response, read the body so the connection goes back to the pool
+            body = (await response.aread()).decode("utf-8", errors="replace")
+            await response.aclose()
+            error = APIError(response.status_code, body)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.client.max_retries:
+                raise error
+
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            await self._wait_before_retry(attempt, retry_after, deadline, error)
+            attempt += 1
+
+    async def _wait_before_retry(self, attempt, retry_after, deadline, error):
+        """Sleeps before the next try, or raises error if it would come too late, see GroqClient"""
+        delay = self.client._backoff_delay(attempt, retry_after)
+        if deadline is not None and delay >= deadline.remaining():
+            raise error
+        await asyncio.sleep(delay)
+
+    async def chat(self, data, call=None, deadline=None):
+        """
+        Sends a chat completion request and returns the generated text
+
+        Returns:
+            tuple: (generated text, "usage" block with token counts or None)
+        """
+        async with self.slots:
+            response = await self.post(data, call=call, deadline=deadline)
+            result = response.json()
+        return result["choices"][0]["message"]["content"], result.get("usage")
+
+    async def stream_chat(self, data, on_usage=None, call=None, deadline=None):
+        """
+        Sends a streaming chat completion request, see GroqClient.stream_chat
+
+        Yields:
+            str: Next piece of generated text
+        """
+        # The connection stays busy until the whole stream has been read
+        async with self.slots:
+            response = await self.post({**data, "stream": True}, stream=True, call=call, deadline=deadline)
+            try:
+                async for line in response.aiter_lines():
+                    if deadline is not None:
+                        deadline.check()
+                    # Skip empty keep-alive lines and comments
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+
+                    chunk = json.loads(payload)
+                    usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+                    if usage and on_usage is not None:
+                        on_usage(usage)
+
+                    choices = chunk.get("choices") or []
+                    delta = choices[0].get("delta", {}).get("content") if choices else None
+                    if delta:
+                        yield delta
+            finally:
+                # Returns the connection to the pool even if the reader stops early
+                await response.aclose()
+
+    async def aclose(self):
+        """Closes every pooled connection"""
+        await self.http.aclose()
+
+
+class AsyncGenerator:
+    """
+    Async counterpart of generate_text and stream_text
+
+    Shares the response cache, near-duplicate index, provider health,
+    drift tracking and metrics with the blocking functions, so results
+    generated here are reused by the app and the other way round.
+    Create it inside the event loop that uses it.
+    """
+
+    def __init__(self, registry=provider_registry, max_connections=SERVICE_POOL_SIZE):
+        """
+        Creates an async client for every provider
+
+        Args:
+            registry (ProviderRegistry): Providers to route between
+            max_connections (int): Connection pool size of each provider
+        """
+        self.registry = registry
+        self.clients = {
+            provider.name: AsyncChatClient(provider.client, max_connections)
+            for provider in registry.providers
+        }
+        self.in_flight = {}  # cache key -> Future of the request that is already running
+
+    async def generate_text(self, prompt, content_type, tone, length, use_cache=True, variant=0, deadline=None):
+        """
+        Generates text, see utils.api_handler.generate_text
+
+        Returns:
+            GenerationResult: Generated text, or whether and why the request failed
+        """
+        call = _new_call(stream=False, use_cache=use_cache)
+        started = time.perf_counter()
+        if deadline is None:
+            deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+
+        try:
+            data = build_request(prompt, content_type, tone, length)
+            key = cache_key(prompt, content_type, tone, length, data, variant)
+            scope = prompt_scope(content_type, tone, length, data, variant)
+
+            if use_cache:
+                # The cache may read from disk, so it runs on a worker thread
+                cached_text = await asyncio.to_thread(_cached_text, key, prompt, scope, call)
+                if cached_text is not None:
+                    return GenerationResult.success(cached_text, call.get("similarity"))
+
+            if not use_cache:
+                # A fresh variation was asked for, so it never gets the answer of a request already running
+                return GenerationResult.success(await self._within(
+                    deadline, self._chat_and_cache(key, prompt, scope, data, length, call, deadline)
+                ))
+
+            # If the same request is already running, wait for its result instead
+            # Each caller only waits as long as its own deadline allows
+            running = self.in_flight.get(key)
+            if running is not None:
+                call["cache"] = "coalesced"
+                return GenerationResult.success(await self._within(deadline, asyncio.shield(running)))
+
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[key] = future
+            try:
+                generated_text = await self._within(
+                    deadline, self._chat_and_cache(key, prompt, scope, data, length, call, deadline)
+                )
+                future.set_result(generated_text)
+                return GenerationResult.success(generated_text)
+            except BaseException as e:
+                future.set_exception(e)
+                future.exception()  # Mark as retrieved when nobody else was waiting
+                raise
+            finally:
+                del self.in_flight[key]
+
+        except Exception as e:
+            call["status"] = "error"
+            return _async_failure_result(e)
+
+        finally:
+            call["total_ms"] = (time.perf_counter() - started) * 1000
+            metrics.record_call(call)
+
+    async def stream_text(self, prompt, content_type, tone, length, use_cache=True, deadline=None, on_reuse=None):
+        """
+        Generates text piece by piece, see utils.api_handler.stream_text
+
+        Yields:
+            str: Next piece of generated text
+
+        Raises:
+            GenerationError: If the text can't be finished, with the failed GenerationResult
+        """
+        call = _new_call(stream=True, use_cache=use_cache)
+        started = time.perf_counter()
+        if deadline is None:
+            deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+
+        try:
+            data = build_request(prompt, content_type, tone, length)
+            key = cache_key(prompt, content_type, tone, length, data)
+            scope = prompt_scope(content_type, tone, length, data)
+
+            if use_cache:
+                # The cache may read from disk, so it runs on a worker thread
+                cached_text = await asyncio.to_thread(_cached_text, key, prompt, scope, call)
+                if cached_text is not None:
+                    if on_reuse is not None and "similarity" in call:
+                        on_reuse(call["similarity"])
+                    yield cached_text
+                    return
+
+            pieces = []
+            usage = {}
+            guard = LengthGuard(length)
+            call["upstream"] = True
+            async for delta in self._stream_chat(data, usage.update, call, deadline):
+                if not pieces:
+                    call["ttft_ms"] = (time.perf_counter() - started) * 1000
+                pieces.append(delta)
+                yield delta
+                if guard.should_stop(delta):
+                    break
+
+            generated_text = "".join(pieces)
+            _record_usage(call, usage)
+            drift_tracker.record(length, guard.analyzer.result()["words"], usage or None, data["max_tokens"])
+            await asyncio.to_thread(_store_text, key, prompt, scope, generated_text)
+
+        except Exception as e:
+            call["status"] = "error"
+            raise GenerationError(_async_failure_result(e)) from e
+
+        finally:
+            call["total_ms"] = (time.perf_counter() - started) * 1000
+            metrics.record_call(call)
+
+    async def aclose(self):
+        """Closes the connection pools of every provider"""
+        for client in self.clients.values():
+            await client.aclose()
+
+    @staticmethod
+    async def _within(deadline, awaitable):
+        """Awaits something, raising DeadlineExceeded when the deadline passes first"""
+        try:
+            return await asyncio.wait_for(awaitable, deadline.remaining())
+        except TimeoutError as e:
+            raise DeadlineExceeded(deadline) from e
+
+    async def _chat_and_cache(self, key, prompt, scope, data, length, call, deadline):
+        """Calls the best provider, fails over on errors and caches the result, see ProviderRegistry.chat"""
+        call["upstream"] = True
+        call["failovers"] = 0
+        attempts = 0
+        error = None
+
+        for provider in self.registry.ranked("full"):
+            if not provider.breaker.allow():
+                continue
+            deadline.check()
+            call["failovers"] = attempts
+            attempts += 1
+            attempt = {"provider": provider.name}
+            provider_started = time.perf_counter()
+            try:
+                generated_text, usage = await self.clients[provider.name].chat(data, call=attempt, deadline=deadline)
+            except DeadlineExceeded:
+                raise  # The request ran out of time, that says nothing about the provider
+            except Exception as e:
+                if not provider.record_error("full", e):
+                    raise  # The request itself was rejected, other providers would reject it too
+                error = e
+                continue
+
+            provider.record("full", time.perf_counter() - provider_started, True)
+            call.update(attempt)
+            _record_usage(call, usage)
+            drift_tracker.record(length, analyze_text(generated_text)["words"], usage, data["max_tokens"])
+            await asyncio.to_thread(_store_text, key, prompt, scope, generated_text)
+            return generated_text
+
+        if error is None:
+            raise CircuitOpenError(self.registry.retry_after())
+        raise error
+
+    async def _stream_chat(self, data, on_usage, call, deadline):
+        """Streams from the best provider, failing over until the first piece arrives"""
+        call["failovers"] = 0
+        attempts = 0
+        error = None
+
+        for provider in self.registry.ranked("stream"):
+            if not provider.breaker.allow():
+                continue
+            deadline.check()
+            call["failovers"] = attempts
+            attempts += 1
+            provider_started = time.perf_counter()
+            stream = self.clients[provider.name].stream_chat(data, on_usage=on_usage, call=call, deadline=deadline)
+            try:
+                first = await self._within(deadline, anext(stream, None))
+            except DeadlineExceeded:
+                await stream.aclose()
+                raise
+            except Exception as e:
+                await stream.aclose()
+                if not provider.record_error("stream", e):
+                    raise  # The request itself was rejected, other providers would reject it too
+                error = e
+                continue
+
+            provider.record("stream", time.perf_counter() - provider_started, True)
+            call["provider"] = provider.name
+            try:
+                if first is not None:
+                    yield first
+                async for delta in stream:
+                    yield delta
+            finally:
+                await stream.aclose()
+            return
+
+        if error is None:
+            raise CircuitOpenError(self.registry.retry_after())
+        raise error
@@ -1,9 +1,31 @@
 """
 File saving and export operations
-This file saves generated texts in TXT format
+This file saves generated texts, builds single-text downloads and exports whole histories
 """
 
+import hashlib  # For download cache keys
+import json  # For JSONL export
+import os
+import tempfile  # For writing next to the target before renaming
+import threading  # For locking, many sessions use the download cache at the same time
+import time  # For the age of saved exports
+import zipfile  # For ZIP export
+from collections import OrderedDict  # Keeps downloads in usage order for LRU eviction
+from concurrent.futures import ThreadPoolExecutor  # For saving without blocking the page
 from datetime import datetime  # For date and time
+from config.settings import (
+    EXPORT_DIR,
+    EXPORT_CHUNK_SIZE,
+    EXPORT_KEEP_FILES,
+    EXPORT_MAX_AGE_SECONDS,
+    EXPORT_MAX_BYTES,
+    EXPORT_DOWNLOAD_MAX_BYTES,
+    DOWNLOAD_CACHE_MAX_BYTES
+)
+
+# Server-side saves run here, so a large export doesn't freeze the page
+# Two workers are enough, exports are limited by disk speed
+_save_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="export")
 
 
 def save_as_txt(text, content_type):
@@ -29,12 +51,10 @@ def save_as_txt(text, content_type):
     filename = f"{safe_content_type}_{timestamp}.txt"
 
     # Write file
-    # 'w' mode means write mode
-    # encoding='utf-8' is important for proper display of special characters
-    # with block automatically closes the file, it's a safe method
+    # atomic_write writes a temporary file first and renames it at the end,
+    # so a half-written file never appears under the real name
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(text)  # Write text to file
+        atomic_write(filename, [text.encode("utf-8")])
         return filename  # Return filename if successful
 
     except Exception as e:
@@ -56,4 +76,395 @@ def create_download_link(text, filename):
     # This function prepares data for Streamlit's download_button
     # Returns text data, filename, and MIME type
     # MIME type tells the browser "this is a text file"
-    return text, filename, "text/plain"
\ No newline at end of file
+    return text, filename, "text/plain"
+
+
+def atomic_write(path, chunks):
+    """
+    Writes chunks to a file so that it appears complete or not at all
+
+    Chunks go to a temporary file in the same folder, which is renamed over
+    the target at the end. Renaming inside one folder is atomic, so readers
+    see either the old file or the new one, never a partial file.
+
+    Args:
+        path (str): Target file
+        chunks (iterable): bytes pieces, consumed one at a time
+
+    Returns:
+        str: The target path
+    """
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+
+    handle, temp_path = tempfile.mkstemp(dir=folder, prefix=".", suffix=".part")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())  # Make sure the data is on disk before the rename
+        os.replace(temp_path, path)
+    except BaseException:
+        # Don't leave half-written temporary files behind
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def record_metadata(record):
+    """Returns the settings of a history record as a plain dictionary"""
+    return {
+        "id": record.id,
+        "prompt": record.prompt,
+        "content_type": record.content_type,
+        "tone": record.tone,
+        "length": record.length,
+        "version": record.version,
+        "created_at": datetime.fromtimestamp(record.created_at).isoformat(timespec="seconds")
+    }
+
+
+def iter_jsonl(records):
+    """
+    Streams records as JSON Lines, one object per text
+
+    Args:
+        records (iterable): HistoryRecord objects
+
+    Yields:
+        bytes: One line per record
+    """
+    for record in records:
+        line = dict(record_metadata(record), text=record.text)
+        yield (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def iter_markdown(records):
+    """
+    Streams records as one Markdown document
+
+    Args:
+        records (iterable): HistoryRecord objects
+
+    Yields:
+        bytes: Document title, then one section per record
+    """
+    yield f"# Text History\n\nExported {datetime.now():%Y-%m-%d %H:%M}\n".encode("utf-8")
+    for record in records:
+        meta = record_metadata(record)
+        section = (
+            f"\n---\n\n## {record.prompt}\n\n"
+            f"*{meta['content_type']} · {meta['tone']} · {meta['length']} · "
+            f"version {meta['version']} · {meta['created_at']}*\n\n"
+            f"{record.text}\n"
+        )
+        yield section.encode("utf-8")
+
+
+class _ChunkSink:
+    """
+    Write-only file object that collects bytes until they are taken out
+
+    It has no seek() or tell(), so zipfile writes in streaming mode and
+    never goes back to patch earlier bytes.
+    """
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Returns and forgets everything written so far"""
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def iter_zip(records, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Streams records as a ZIP archive with one TXT file per text
+
+    The archive is built on the fly, so only one chunk of one text is held
+    in memory at a time. File names carry the number, type and version;
+    use the JSONL format when all settings are needed.
+
+    Args:
+        records (iterable): HistoryRecord objects
+        chunk_size (int): Bytes compressed at a time
+
+    Yields:
+        bytes: Pieces of the ZIP file
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for number, record in enumerate(records, start=1):
+            name = f"{number:05d}_{record.content_type.replace(' ', '_')}_v{record.version}.txt"
+            data = record.text.encode("utf-8")
+            with archive.open(name, mode="w") as entry:
+                for start in range(0, len(data), chunk_size):
+                    entry.write(data[start:start + chunk_size])
+                    yield sink.drain()
+            yield sink.drain()  # Entry trailer written on close
+
+    yield sink.drain()  # Central directory written when the archive closes
+
+
+# Download format of a single text -> (file extension, MIME type)
+DOWNLOAD_FORMATS = {
+    "TXT": ("txt", "text/plain"),
+    "Markdown": ("md", "text/markdown"),
+    "JSON": ("json", "application/json")
+}
+
+
+def build_download(text, download_format, metadata=None):
+    """
+    Builds the file for downloading one text
+
+    Args:
+        text (str): Text to download
+        download_format (str): Key of DOWNLOAD_FORMATS
+        metadata (dict): Settings of the text, e.g. from record_metadata(); TXT files leave them out
+
+    Returns:
+        bytes: File contents
+    """
+    metadata = metadata or {}
+    if download_format == "JSON":
+        return json.dumps(dict(metadata, text=text), ensure_ascii=False, indent=2).encode("utf-8")
+
+    if download_format == "Markdown":
+        # Prompt as the title, the other settings in one line below it
+        title = f"# {metadata['prompt']}\n\n" if metadata.get("prompt") else ""
+        details = " · ".join(
+            str(metadata[name]) for name in ("content_type", "tone", "length", "created_at") if metadata.get(name)
+        )
+        if metadata.get("version"):
+            details += f" · version {metadata['version']}"
+        return (title + (f"*{details}*\n\n" if details else "") + f"{text}\n").encode("utf-8")
+
+    return text.encode("utf-8")
+
+
+class DownloadCache:
+    """
+    Recently built download files, limited by total size
+
+    Files are built only when a user asks for a download and are kept
+    here, so asking again doesn't build them again. Keys come from the
+    content, so sessions downloading the same text share one file. When
+    the size limit is reached, the least recently used files are dropped.
+    """
+
+    def __init__(self, max_bytes=DOWNLOAD_CACHE_MAX_BYTES):
+        """
+        Creates an empty cache
+
+        Args:
+            max_bytes (int): Maximum total size of the kept files
+        """
+        self.max_bytes = max_bytes
+        self.files = OrderedDict()  # key -> file bytes
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, download_format, metadata=None):
+        """
+        Returns a download file, building it if it isn't cached
+
+        Args:
+            text (str): Text to download
+            download_format (str): Key of DOWNLOAD_FORMATS
+            metadata (dict): Settings of the text, see build_download()
+
+        Returns:
+            bytes: File contents
+        """
+        key_source = json.dumps([download_format, metadata or {}, text], ensure_ascii=False, sort_keys=True)
+        key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+        with self.lock:
+            data = self.files.get(key)
+            if data is not None:
+                self.files.move_to_end(key)  # Mark as recently used
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        # Built outside the lock, other sessions don't wait for it
+        data = build_download(text, download_format, metadata)
+
+        with self.lock:
+            if key not in self.files:
+                self.files[key] = data
+                self.total_bytes += len(data)
+            # Drop least recently used files, but always keep the newest one
+            while self.total_bytes > self.max_bytes and len(self.files) > 1:
+                _, dropped = self.files.popitem(last=False)
+                self.total_bytes -= len(dropped)
+        return data
+
+
+# Export format -> (chunk generator, file extension, MIME type)
+EXPORT_FORMATS = {
+    "ZIP": (iter_zip, "zip", "application/zip"),
+    "JSONL": (iter_jsonl, "jsonl", "application/x-ndjson"),
+    "Markdown": (iter_markdown, "md", "text/markdown")
+}
+
+
+class ExportTooLargeError(Exception):
+    """Raised when an export grows past its size limit"""
+
+    def __init__(self, max_bytes):
+        super().__init__(f"Export is larger than {max_bytes // (1024 * 1024)} MB")
+        self.max_bytes = max_bytes
+
+
+def iter_export(records, export_format):
+    """
+    Streams records in one of the EXPORT_FORMATS
+
+    Empty chunks are skipped, so every yielded piece can be written directly.
+
+    Args:
+        records (iterable): HistoryRecord objects
+        export_format (str): Key of EXPORT_FORMATS
+
+    Yields:
+        bytes: Pieces of the exported file
+    """
+    generator = EXPORT_FORMATS[export_format][0]
+    for chunk in generator(records):
+        if chunk:
+            yield chunk
+
+
+def limit_size(chunks, max_bytes=EXPORT_MAX_BYTES):
+    """
+    Passes chunks through until their total size passes a limit
+
+    Args:
+        chunks (iterable): bytes pieces
+        max_bytes (int): Largest allowed total size
+
+    Yields:
+        bytes: The same pieces
+
+    Raises:
+        ExportTooLargeError: As soon as the total is larger than max_bytes
+    """
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        if total > max_bytes:
+            raise ExportTooLargeError(max_bytes)
+        yield chunk
+
+
+def build_export(records, export_format, max_bytes=EXPORT_DOWNLOAD_MAX_BYTES):
+    """
+    Builds a whole export in memory, for a download button
+
+    Args:
+        records (iterable): HistoryRecord objects
+        export_format (str): Key of EXPORT_FORMATS
+        max_bytes (int): Largest allowed export size
+
+    Returns:
+        bytes: Exported file
+
+    Raises:
+        ExportTooLargeError: If the export is larger than max_bytes
+    """
+    return b"".join(limit_size(iter_export(records, export_format), max_bytes))
+
+
+def export_filename(export_format):
+    """
+    Creates a timestamped file name for an export
+
+    Args:
+        export_format (str): Key of EXPORT_FORMATS
+
+    Returns:
+        str: File name such as history_20240101_120000.zip
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"history_{timestamp}.{EXPORT_FORMATS[export_format][1]}"
+
+
+def prune_exports(folder=EXPORT_DIR, keep=EXPORT_KEEP_FILES, max_age=EXPORT_MAX_AGE_SECONDS):
+    """
+    Deletes old exports saved on the server
+
+    Only files named like export_filename() are touched. Exports older
+    than max_age are deleted, and of the rest only the newest keep stay.
+
+    Args:
+        folder (str): Export folder
+        keep (int): Number of newest exports to keep
+        max_age (float): Seconds after which an export is deleted
+
+    Returns:
+        list: Paths of the deleted files
+    """
+    extensions = tuple(f".{extension}" for _, extension, _ in EXPORT_FORMATS.values())
+    try:
+        names = [name for name in os.listdir(folder) if name.startswith("history_") and name.endswith(extensions)]
+    except FileNotFoundError:
+        return []
+
+    # Newest first
+    paths = sorted((os.path.join(folder, name) for name in names), key=os.path.getmtime, reverse=True)
+    now = time.time()
+    deleted = []
+    for position, path in enumerate(paths):
+        if position >= keep or now - os.path.getmtime(path) > max_age:
+            try:
+                os.remove(path)
+                deleted.append(path)
+            except OSError:
+                pass  # Another session deleted it first
+    return deleted
+
+
+def _save_export(path, chunks, folder):
+    """Writes one export and then deletes old ones, runs in the save thread"""
+    atomic_write(path, chunks)
+    prune_exports(folder)
+    return path
+
+
+def save_export_async(records, export_format, folder=EXPORT_DIR, max_bytes=EXPORT_MAX_BYTES):
+    """
+    Writes an export to the server in a background thread
+
+    The page doesn't wait for the file; check the returned future instead.
+    The records iterable is consumed in the background thread. Afterwards
+    old exports are deleted with prune_exports, so the folder stays small.
+
+    Args:
+        records (iterable): HistoryRecord objects
+        export_format (str): Key of EXPORT_FORMATS
+        folder (str): Folder for the export file
+        max_bytes (int): Largest allowed export size, a larger one is not saved
+
+    Returns:
+        Future: Resolves to the saved path, or raises the write error or ExportTooLargeError
+    """
+    path = os.path.join(folder, export_filename(export_format))
+    chunks = limit_size(iter_export(records, export_format), max_bytes)
+    return _save_executor.submit(_save_export, path, chunks, folder)
@@ -0,0 +1,467 @@
+"""
+Persistent storage for generated texts
+This file saves text history in SQLite so it survives page reloads
+"""
+
+import os
+import sqlite3  # For the history database
+import sys  # For string interning and object sizes
+import threading  # For locking, many sessions use the store at the same time
+import time  # For timestamps
+import zlib  # For compressing long texts in memory
+from collections import deque  # For oldest-first eviction
+from itertools import islice  # For reading one page without building a full list
+from config.settings import HISTORY_DB_PATH, HISTORY_RETENTION_DAYS, HISTORY_MEMORY_CAP_BYTES, HISTORY_COMPRESS_MIN_BYTES
+
+# How often old texts are looked for while new ones are saved
+_PRUNE_INTERVAL_SECONDS = 60 * 60
+
+
+class HistoryRecord:
+    """
+    One generated text with its settings
+
+    __slots__ removes the per-object dictionary, so a record is much smaller
+    than a plain dict. Content type, tone and length repeat across many
+    records, so they are interned and every record shares the same string.
+    Long texts can be kept zlib-compressed and are unpacked when read.
+    """
+
+    __slots__ = ("id", "prompt", "content_type", "tone", "length", "version",
+                 "created_at", "_text", "_compressed")
+
+    def __init__(self, id, prompt, content_type, tone, length, version, text,
+                 created_at=None, compress_min_bytes=None):
+        """
+        Creates a record
+
+        Args:
+            id (int): Entry id
+            prompt (str): Topic written by user
+            content_type (str): Text type
+            tone (str): Tone
+            length (str): Length option
+            version (int): Which version
+            text (str): Generated text
+            created_at (float): Timestamp, now if not given
+            compress_min_bytes (int): Texts at least this long are compressed, None never compresses
+        """
+        self.id = id
+        self.prompt = prompt
+        # sys.intern returns one shared copy of each distinct string
+        self.content_type = sys.intern(content_type)
+        self.tone = sys.intern(tone)
+        self.length = sys.intern(length)
+        self.version = version
+        self.created_at = created_at if created_at is not None else time.time()
+
+        encoded = text.encode("utf-8")
+        if compress_min_bytes is not None and len(encoded) >= compress_min_bytes:
+            self._text = zlib.compress(encoded)
+            self._compressed = True
+        else:
+            self._text = text
+            self._compressed = False
+
+    @property
+    def text(self):
+        """Generated text, decompressed if needed"""
+        if self._compressed:
+            return zlib.decompress(self._text).decode("utf-8")
+        return self._text
+
+    def nbytes(self):
+        """
+        Estimates memory used by this record
+
+        Interned fields are shared between records, so they aren't counted.
+
+        Returns:
+            int: Size in bytes
+        """
+        return sys.getsizeof(self) + sys.getsizeof(self.prompt) + sys.getsizeof(self._text)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Creates a record from a database row
+
+        Args:
+            row (sqlite3.Row): Row of the history table
+
+        Returns:
+            HistoryRecord: Record with the same values
+        """
+        return cls(row["id"], row["prompt"], row["content_type"], row["tone"], row["length"],
+                   row["version"], row["text"], row["created_at"])
+
+
+class HistoryStore:
+    """
+    SQLite history with indexes and full-text search
+
+    Every entry belongs to a session id, so each browser session sees only
+    its own texts. Pages are read with LIMIT/OFFSET, so only the visible
+    entries are loaded from disk. Texts older than the retention period
+    are deleted when the store opens and then about once an hour.
+    """
+
+    def __init__(self, db_path=HISTORY_DB_PATH, retention_days=HISTORY_RETENTION_DAYS):
+        """
+        Opens (or creates) the history database
+
+        Args:
+            db_path (str): SQLite file path, ":memory:" for a temporary store
+            retention_days (float): Texts older than this are deleted, 0 keeps them forever
+        """
+        self.retention_seconds = retention_days * 24 * 60 * 60
+        self.pruned_at = 0.0
+        folder = os.path.dirname(db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        # check_same_thread=False allows use from many threads, the lock keeps it safe
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row  # Rows can be read like dictionaries
+        self.lock = threading.Lock()
+
+        with self.lock:
+            # WAL mode lets readers and the writer work at the same time
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, prompt TEXT NOT NULL, "
+                "content_type TEXT NOT NULL, tone TEXT NOT NULL, length TEXT NOT NULL, "
+                "version INTEGER NOT NULL, text TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            # Indexes for the newest-first list and the sidebar filters
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_history_session "
+                            "ON history (session_id, created_at)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_history_type "
+                            "ON history (session_id, content_type, created_at)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_history_tone "
+                            "ON history (session_id, tone, created_at)")
+            # For deleting old texts of every session
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON history (created_at)")
+
+            # Full-text index over prompts and texts
+            # Some SQLite builds don't include FTS5, search then falls back to LIKE
+            try:
+                self.db.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+                    "prompt, text, content='history', content_rowid='id')"
+                )
+                # Triggers keep the search index in sync with the history table
+                self.db.execute(
+                    "CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN "
+                    "INSERT INTO history_fts (rowid, prompt, text) VALUES (new.id, new.prompt, new.text); END"
+                )
+                self.db.execute(
+                    "CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN "
+                    "INSERT INTO history_fts (history_fts, rowid, prompt, text) "
+                    "VALUES ('delete', old.id, old.prompt, old.text); END"
+                )
+                self.full_text_search = True
+            except sqlite3.OperationalError:
+                self.full_text_search = False
+            self.db.commit()
+        self.prune()
+
+    def add(self, session_id, entry):
+        """
+        Saves one generated text
+
+        Args:
+            session_id (str): Browser session the text belongs to
+            entry (dict): prompt, content_type, tone, length, text and version
+
+        Returns:
+            int: id of the new entry
+        """
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO history (session_id, prompt, content_type, tone, length, version, text, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, entry["prompt"], entry["content_type"], entry["tone"],
+                 entry["length"], entry["version"], entry["text"], time.time())
+            )
+            self.db.commit()
+            entry_id = cursor.lastrowid
+        if time.time() - self.pruned_at > _PRUNE_INTERVAL_SECONDS:
+            self.prune()
+        return entry_id
+
+    def prune(self):
+        """
+        Deletes texts older than the retention period, from every session
+
+        Returns:
+            int: Number of deleted entries
+        """
+        self.pruned_at = time.time()
+        if not self.retention_seconds:
+            return 0
+        with self.lock:
+            cursor = self.db.execute("DELETE FROM history WHERE created_at < ?",
+                                     (self.pruned_at - self.retention_seconds,))
+            self.db.commit()
+            return cursor.rowcount
+
+    def count(self, session_id, content_type=None, tone=None, search=None):
+        """
+        Counts entries matching the filters
+
+        Args:
+            session_id (str): Browser session
+            content_type (str): Only this content type, None for all
+            tone (str): Only this tone, None for all
+            search (str): Words that must appear in the prompt or text
+
+        Returns:
+            int: Number of matching entries
+        """
+        where, params = self._filters(session_id, content_type, tone, search)
+        with self.lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM history WHERE {where}", params).fetchone()[0]
+
+    def page(self, session_id, offset, limit, content_type=None, tone=None, search=None):
+        """
+        Reads one page of entries, newest first
+
+        Args:
+            session_id (str): Browser session
+            offset (int): Number of entries to skip
+            limit (int): Maximum number of entries to return
+            content_type (str): Only this content type, None for all
+            tone (str): Only this tone, None for all
+            search (str): Words that must appear in the prompt or text
+
+        Returns:
+            list: HistoryRecord objects
+        """
+        where, params = self._filters(session_id, content_type, tone, search)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT * FROM history WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [HistoryRecord.from_row(row) for row in rows]
+
+    def get(self, session_id, entry_id):
+        """
+        Reads one entry
+
+        Args:
+            session_id (str): Browser session
+            entry_id (int): Entry id
+
+        Returns:
+            HistoryRecord: Entry, or None if it doesn't exist
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT * FROM history WHERE session_id = ? AND id = ?", (session_id, entry_id)
+            ).fetchone()
+        return HistoryRecord.from_row(row) if row is not None else None
+
+    def iter_records(self, session_id, content_type=None, tone=None, search=None, batch_size=200):
+        """
+        Reads every matching entry, oldest first, a batch at a time
+
+        Only one batch is in memory at once and the lock is released between
+        batches, so exporting a long history doesn't block other sessions.
+
+        Args:
+            session_id (str): Browser session
+            content_type (str): Only this content type, None for all
+            tone (str): Only this tone, None for all
+            search (str): Words that must appear in the prompt or text
+            batch_size (int): Entries read per query
+
+        Yields:
+            HistoryRecord: Next entry
+        """
+        where, params = self._filters(session_id, content_type, tone, search)
+        last_id = 0
+        while True:
+            # Continue after the last id instead of using OFFSET, which would rescan skipped rows
+            with self.lock:
+                rows = self.db.execute(
+                    f"SELECT * FROM history WHERE {where} AND id > ? ORDER BY id LIMIT ?",
+                    params + [last_id, batch_size]
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield HistoryRecord.from_row(row)
+            last_id = rows[-1]["id"]
+
+    def clear(self, session_id):
+        """
+        Deletes every entry of a session
+
+        Args:
+            session_id (str): Browser session
+        """
+        with self.lock:
+            self.db.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+            self.db.commit()
+
+    def _filters(self, session_id, content_type, tone, search):
+        """
+        Builds the WHERE clause for the given filters
+
+        Returns:
+            tuple: (SQL condition, list of parameters)
+        """
+        conditions = ["session_id = ?"]
+        params = [session_id]
+
+        if content_type:
+            conditions.append("content_type = ?")
+            params.append(content_type)
+        if tone:
+            conditions.append("tone = ?")
+            params.append(tone)
+
+        words = search.split() if search else []
+        if words and self.full_text_search:
+            # Each word is quoted so characters like - or * aren't read as search syntax
+            # The * after the quote matches words that start with the typed text
+            query = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+            conditions.append("id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+            params.append(query)
+        else:
+            for word in words:
+                conditions.append("(prompt LIKE ? OR text LIKE ?)")
+                params.extend([f"%{word}%", f"%{word}%"])
+
+        return " AND ".join(conditions), params
+
+
+class SessionHistory:
+    """
+    In-memory history for a single session
+
+    Has the same methods as HistoryStore, so the app can use either one.
+    Total memory is capped; when a new text doesn't fit, the oldest texts
+    are dropped first. Used when HISTORY_BACKEND is "memory".
+    """
+
+    def __init__(self, memory_cap=HISTORY_MEMORY_CAP_BYTES, compress_min_bytes=HISTORY_COMPRESS_MIN_BYTES):
+        """
+        Creates an empty history
+
+        Args:
+            memory_cap (int): Maximum bytes used by all records together
+            compress_min_bytes (int): Texts at least this long are compressed, None never compresses
+        """
+        self.memory_cap = memory_cap
+        self.compress_min_bytes = compress_min_bytes
+        self.records = deque()  # Oldest on the left, newest on the right
+        self.total_bytes = 0
+        self.next_id = 1
+        self.evicted = 0  # Number of records dropped because of the cap
+
+    def add(self, session_id, entry):
+        """
+        Saves one generated text
+
+        Args:
+            session_id (str): Ignored, the object itself belongs to one session
+            entry (dict): prompt, content_type, tone, length, text and version
+
+        Returns:
+            int: id of the new entry
+        """
+        record = HistoryRecord(
+            self.next_id, entry["prompt"], entry["content_type"], entry["tone"],
+            entry["length"], entry["version"], entry["text"],
+            compress_min_bytes=self.compress_min_bytes
+        )
+        self.next_id += 1
+        self.records.append(record)
+        self.total_bytes += record.nbytes()
+
+        # Drop oldest texts until everything fits, but always keep the newest one
+        while self.total_bytes > self.memory_cap and len(self.records) > 1:
+            self.total_bytes -= self.records.popleft().nbytes()
+            self.evicted += 1
+        return record.id
+
+    def count(self, session_id, content_type=None, tone=None, search=None):
+        """
+        Counts entries matching the filters
+
+        Returns:
+            int: Number of matching entries
+        """
+        if not (content_type or tone or search):
+            return len(self.records)
+        return sum(1 for _ in self._matching(content_type, tone, search))
+
+    def page(self, session_id, offset, limit, content_type=None, tone=None, search=None):
+        """
+        Reads one page of entries, newest first
+
+        Returns:
+            list: HistoryRecord objects
+        """
+        # islice stops reading as soon as the page is full
+        return list(islice(self._matching(content_type, tone, search), offset, offset + limit))
+
+    def get(self, session_id, entry_id):
+        """
+        Reads one entry
+
+        Returns:
+            HistoryRecord: Entry, or None if it doesn't exist (or was evicted)
+        """
+        for record in self.records:
+            if record.id == entry_id:
+                return record
+        return None
+
+    def iter_records(self, session_id, content_type=None, tone=None, search=None):
+        """
+        Reads every matching entry, oldest first
+
+        Returns:
+            iterator: HistoryRecord objects, taken from a snapshot so the
+                      history can change while an export is running
+        """
+        matching = list(self._matching(content_type, tone, search))
+        return reversed(matching)
+
+    def clear(self, session_id):
+        """Deletes every entry"""
+        self.records.clear()
+        self.total_bytes = 0
+
+    def footprint(self):
+        """
+        Reports memory used by this session's history
+
+        Returns:
+            dict: Bytes used, cap, number of records and evicted records
+        """
+        return {
+            "bytes": self.total_bytes + sys.getsizeof(self.records),
+            "cap_bytes": self.memory_cap,
+            "records": len(self.records),
+            "evicted": self.evicted
+        }
+
+    def _matching(self, content_type, tone, search):
+        """Yields records that match the filters, newest first"""
+        words = search.lower().split() if search else []
+        for record in reversed(self.records):
+            if content_type and record.content_type != content_type:
+                continue
+            if tone and record.tone != tone:
+                continue
+            if words:
+                haystack = (record.prompt + " " + record.text).lower()
+                if not all(word in haystack for word in words):
+                    continue
+            yield record
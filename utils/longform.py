@@ -0,0 +1,250 @@
+"""
+Long-form generation from an outline
+This file writes long texts section by section, generating the sections in parallel
+"""
+
+import re  # For cleaning outline lines
+from concurrent.futures import ThreadPoolExecutor, as_completed  # For parallel section requests
+from config.settings import (
+    LONGFORM_CONTENT_TYPES,
+    LONGFORM_MIN_WORDS,
+    LONGFORM_SECTIONS,
+    LONGFORM_MAX_PARALLEL,
+    REQUEST_DEADLINE_SECONDS
+)
+from utils.api_handler import complete
+from utils.resilience import Deadline, GenerationResult
+from utils.text_processor import count_words, trim_to_words
+
+# Word range of the outline itself, a title plus one line per section
+OUTLINE_LENGTH = (30, 150)
+
+# Numbers, bullets and heading marks in front of outline lines, e.g. "1.", "-", "##"
+_LIST_MARKER = re.compile(r"^\s*(?:#+|[-*•]|\d+[.)]|section\s+\d+\s*[:.-])\s*", re.IGNORECASE)
+
+
+def uses_longform(content_type, length):
+    """
+    Checks whether a request is long enough for long-form mode
+
+    Args:
+        content_type (str): Content type name, e.g. "Blog Post"
+        length (tuple): Minimum and maximum word count
+
+    Returns:
+        bool: True if the text should be written from an outline
+    """
+    return content_type in LONGFORM_CONTENT_TYPES and length[1] >= LONGFORM_MIN_WORDS
+
+
+def section_budgets(length, sections):
+    """
+    Splits the word range of the whole text between its sections
+
+    Args:
+        length (tuple): Minimum and maximum word count of the whole text
+        sections (int): Number of sections
+
+    Returns:
+        list: (minimum, maximum) word count of each section
+    """
+    # Leftover words go to the first sections, so the budgets add up exactly
+    low, low_rest = divmod(length[0], sections)
+    high, high_rest = divmod(length[1], sections)
+    return [
+        (low + (i < low_rest), high + (i < high_rest))
+        for i in range(sections)
+    ]
+
+
+def outline_messages(prompt, content_type, tone, length, sections):
+    """Creates the chat messages that ask for a title and section plan"""
+    system_prompt = f"""You are a professional content writer planning {content_type} type content.
+        Tone: {tone}
+        The finished text will be {length[0]}-{length[1]} words long.
+        Answer with a plan only: the first line is "Title: " and the title,
+        then exactly {sections} lines, one per section, each a short heading
+        followed by a colon and one sentence about what the section covers."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def parse_outline(text, sections):
+    """
+    Reads the title and section plans from an outline answer
+
+    Args:
+        text (str): Outline written by the model
+        sections (int): Number of sections that were asked for
+
+    Returns:
+        tuple: (title or "", list of section plans, at most sections long)
+    """
+    title = ""
+    plans = []
+    for line in text.splitlines():
+        # Bold marks are left out, models often write "**Heading**: ..."
+        line = _LIST_MARKER.sub("", line.replace("**", "")).strip()
+        if not line:
+            continue
+        if line.lower().startswith("title:"):
+            title = line[len("title:"):].strip().strip('"')
+        else:
+            plans.append(line)
+    return title, plans[:sections]
+
+
+def section_heading(plan):
+    """Returns the heading part of a section plan, the text before its colon"""
+    return plan.split(":", 1)[0].strip()
+
+
+def section_messages(prompt, content_type, tone, title, plans, index, budget):
+    """
+    Creates the chat messages for one section
+
+    Every section sees the whole plan, so the sections fit together even
+    though they are written at the same time.
+    """
+    plan_text = "\n".join(
+        f"{number}. {plan}" + ("   <- write this one" if number - 1 == index else "")
+        for number, plan in enumerate(plans, start=1)
+    )
+    if index == 0:
+        position = "This is the first section, so it opens the text."
+    elif index == len(plans) - 1:
+        position = "This is the last section, so it closes the text. Don't repeat the introduction."
+    else:
+        position = "This is a middle section. Don't introduce or conclude the whole text."
+
+    system_prompt = f"""You are a professional content writer.
+        You are writing one section of a {content_type} type text titled "{title}".
+        Tone: {tone}
+        Plan of the whole text:
+        {plan_text}
+        {position}
+        Write only section {index + 1}, without its heading.
+        Length: Must be between {budget[0]}-{budget[1]} words."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def stitch(title, plans, section_texts, length, headings=True):
+    """
+    Joins finished sections into one text within the word budget
+
+    Args:
+        title (str): Title from the outline, may be empty
+        plans (list): Section plans from the outline
+        section_texts (list): Text of each section, in order
+        length (tuple): Minimum and maximum word count of the whole text
+        headings (bool): Whether the title and section headings are included
+
+    Returns:
+        str: Complete text
+    """
+    texts = [text.strip() for text in section_texts]
+
+    # Headings count towards the budget too, so the body gets what is left
+    heading_lines = []
+    if headings:
+        heading_lines = [f"# {title}"] if title else []
+        heading_lines += [f"## {section_heading(plan)}" for plan in plans]
+    allowed = length[1] - sum(count_words(line) for line in heading_lines)
+
+    # Shorten the last sections first, they are the easiest to end early
+    excess = sum(count_words(text) for text in texts) - allowed
+    for i in reversed(range(len(texts))):
+        if excess <= 0:
+            break
+        words = count_words(texts[i])
+        texts[i] = trim_to_words(texts[i], max(1, words - excess))
+        excess -= words - count_words(texts[i])
+
+    parts = []
+    if headings and title:
+        parts.append(f"# {title}")
+    for plan, text in zip(plans, texts):
+        if headings:
+            parts.append(f"## {section_heading(plan)}")
+        parts.append(text)
+    return "\n\n".join(parts)
+
+
+def generate_long_text(prompt, content_type, tone, length, use_cache=True, headings=True,
+                       sections=LONGFORM_SECTIONS, max_parallel=LONGFORM_MAX_PARALLEL, deadline=None):
+    """
+    Writes a long text from an outline, generating the sections in parallel
+
+    First a short outline is generated, then every section is requested at
+    once. Each section is reported as soon as it is ready, so the reader
+    sees progress long before the whole text is done. The outline and all
+    sections share one deadline.
+
+    Args:
+        prompt (str): Topic or instruction written by user
+        content_type (str): Content type description
+        tone (str): Tone description
+        length (tuple): Minimum and maximum word count of the whole text
+        use_cache (bool): False skips cached results and asks for fresh variations
+        headings (bool): Whether the finished text has a title and section headings
+        sections (int): Number of sections to plan
+        max_parallel (int): Sections generated at the same time
+        deadline (Deadline): Time budget, None starts a new one of REQUEST_DEADLINE_SECONDS
+
+    Yields:
+        tuple: One of
+               ("outline", title, list of section plans)
+               ("section", section index starting from 0, section text), in finishing order
+               ("done", GenerationResult with the complete text or the first failure) at the end
+    """
+    if deadline is None:
+        deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+
+    outline = complete(
+        outline_messages(prompt, content_type, tone, length, sections), OUTLINE_LENGTH, use_cache, deadline=deadline
+    )
+    if not outline.ok:
+        yield "done", outline
+        return
+
+    title, plans = parse_outline(outline.text, sections)
+    # The model didn't follow the format, plan the sections by number instead
+    if len(plans) < 2:
+        plans = [f"Part {number}" for number in range(1, sections + 1)]
+    yield "outline", title, plans
+
+    budgets = section_budgets(length, len(plans))
+    section_texts = [None] * len(plans)
+    failure = None
+
+    workers = max(1, min(len(plans), max_parallel))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                complete,
+                section_messages(prompt, content_type, tone, title, plans, i, budgets[i]),
+                budgets[i],
+                use_cache,
+                deadline=deadline
+            ): i
+            for i in range(len(plans))
+        }
+        # complete never raises, it returns failures as results
+        for future in as_completed(futures):
+            i = futures[future]
+            result = future.result()
+            if not result.ok:
+                failure = failure or result
+                continue
+            section_texts[i] = result.text
+            yield "section", i, result.text
+
+    if failure is not None:
+        yield "done", failure
+        return
+    yield "done", GenerationResult.success(stitch(title, plans, section_texts, length, headings))
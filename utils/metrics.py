@@ -0,0 +1,248 @@
+"""
+Telemetry for generation calls
+This file collects per-call timings and exposes them as Prometheus metrics
+"""
+
+import threading  # For locking shared counters and the exporter thread
+from collections import deque  # For the list of recent calls
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # For the /metrics endpoint
+from config.settings import METRICS_HOST
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000)
+
+# Descriptions shown in the exposition format
+HISTOGRAM_HELP = {
+    "total_ms": "Total generation call time in milliseconds",
+    "ttfb_ms": "Time until response headers arrived in milliseconds",
+    "ttft_ms": "Time until the first streamed token in milliseconds",
+    "connect_ms": "Time spent opening new connections in milliseconds",
+    "prompt_tokens": "Prompt tokens reported by the API",
+    "completion_tokens": "Completion tokens reported by the API"
+}
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, the same shape Prometheus uses
+
+    Keeps only one counter per bucket, so memory stays constant no matter
+    how many values are observed.
+    """
+
+    def __init__(self, buckets):
+        """
+        Creates an empty histogram
+
+        Args:
+            buckets (tuple): Sorted bucket upper bounds, +Inf is added automatically
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Adds one value
+
+        Args:
+            value (float): Observed value
+        """
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimates a quantile by interpolating inside its bucket
+
+        Args:
+            q (float): Quantile between 0 and 1, e.g. 0.95
+
+        Returns:
+            float: Estimated value, or None if nothing was observed
+        """
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            if seen + self.counts[i] >= target:
+                # Assume values are spread evenly inside the bucket
+                share = (target - seen) / self.counts[i] if self.counts[i] else 0.0
+                return lower + (bound - lower) * share
+            seen += self.counts[i]
+            lower = bound
+        return self.buckets[-1]  # Value is in the +Inf bucket, report the last bound
+
+    def cumulative(self):
+        """
+        Returns cumulative bucket counts for the exposition format
+
+        Returns:
+            list: (upper bound label, count of values <= bound) pairs
+        """
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            pairs.append((str(bound), total))
+        return pairs
+
+
+class MetricsRegistry:
+    """
+    Collects telemetry of every generation call in the process
+
+    Each call is a dictionary filled by utils.api_handler with timings in
+    milliseconds, token counts, retries, cache status and outcome.
+    """
+
+    def __init__(self, recent_size=50):
+        """
+        Creates an empty registry
+
+        Args:
+            recent_size (int): Number of recent calls kept for the performance panel
+        """
+        self.lock = threading.Lock()
+        self.histograms = {
+            "total_ms": Histogram(LATENCY_BUCKETS_MS),
+            "ttfb_ms": Histogram(LATENCY_BUCKETS_MS),
+            "ttft_ms": Histogram(LATENCY_BUCKETS_MS),
+            "connect_ms": Histogram(LATENCY_BUCKETS_MS),
+            "prompt_tokens": Histogram(TOKEN_BUCKETS),
+            "completion_tokens": Histogram(TOKEN_BUCKETS)
+        }
+        self.requests = {}  # (status, cache, mode) -> count
+        self.retries = 0
+        self.recent = deque(maxlen=recent_size)
+        self.gauge_sources = []  # Functions returning {name: value} for extra gauges
+
+    def record_call(self, call):
+        """
+        Adds one finished generation call
+
+        Args:
+            call (dict): Telemetry of the call, missing timings are skipped
+        """
+        with self.lock:
+            for name, histogram in self.histograms.items():
+                value = call.get(name)
+                if value is not None:
+                    histogram.observe(value)
+
+            key = (call.get("status", "ok"), call.get("cache", "miss"), "stream" if call.get("stream") else "full")
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.retries += call.get("retries", 0)
+            self.recent.append(dict(call))
+
+    def add_gauge_source(self, source):
+        """
+        Registers a function whose values are exported as gauges
+
+        Args:
+            source (callable): Returns a flat {metric name: number} dictionary
+        """
+        self.gauge_sources.append(source)
+
+    def summary(self):
+        """
+        Returns numbers for the performance panel
+
+        Returns:
+            dict: Call counts, retries, cache hits (exact and near-duplicate),
+                  p50/p95 per histogram and recent calls
+        """
+        with self.lock:
+            return {
+                "calls": sum(self.requests.values()),
+                "errors": sum(count for (status, _, _), count in self.requests.items() if status != "ok"),
+                "retries": self.retries,
+                "cache_hits": sum(count for (_, cache, _), count in self.requests.items()
+                                  if cache in ("hit", "near_hit")),
+                "quantiles": {
+                    name: {"p50": histogram.quantile(0.5), "p95": histogram.quantile(0.95)}
+                    for name, histogram in self.histograms.items()
+                },
+                "recent": list(self.recent)
+            }
+
+    def render_prometheus(self):
+        """
+        Renders every metric in the Prometheus text exposition format
+
+        Returns:
+            str: Text for a /metrics endpoint
+        """
+        lines = []
+        with self.lock:
+            lines.append("# HELP textstudio_requests_total Generation calls by outcome")
+            lines.append("# TYPE textstudio_requests_total counter")
+            for (status, cache, mode), count in sorted(self.requests.items()):
+                lines.append(f'textstudio_requests_total{{status="{status}",cache="{cache}",mode="{mode}"}} {count}')
+
+            lines.append("# HELP textstudio_retries_total HTTP retries made by the API client")
+            lines.append("# TYPE textstudio_retries_total counter")
+            lines.append(f"textstudio_retries_total {self.retries}")
+
+            for name, histogram in self.histograms.items():
+                metric = f"textstudio_{name}"
+                lines.append(f"# HELP {metric} {HISTOGRAM_HELP[name]}")
+                lines.append(f"# TYPE {metric} histogram")
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+                lines.append(f"{metric}_sum {histogram.sum}")
+                lines.append(f"{metric}_count {histogram.count}")
+
+        # Gauges are read outside the lock, their sources have locks of their own
+        for source in self.gauge_sources:
+            for name, value in source().items():
+                if value is None:
+                    continue
+                lines.append(f"# TYPE textstudio_{name} gauge")
+                lines.append(f"textstudio_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(registry, port, host=METRICS_HOST):
+    """
+    Serves registry.render_prometheus() at /metrics in a background thread
+
+    Args:
+        registry (MetricsRegistry): Metrics to export
+        port (int): Port to listen on
+        host (str): Address to listen on, only this machine by default
+
+    Returns:
+        ThreadingHTTPServer: Running server, call shutdown() to stop it
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            """Keeps the console quiet, Prometheus scrapes every few seconds"""
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,277 @@
+"""
+Local stand-in for the Groq chat completions API
+This file runs a fake OpenAI-compatible server for benchmarks and load tests
+
+Usage:
+    python -m utils.mock_server --port 8000 --latency-ms 300
+
+Then point the app at it:
+    GROQ_API_URL=http://127.0.0.1:8000/openai/v1/chat/completions streamlit run app.py
+"""
+
+import argparse  # For command line arguments
+import json  # For request and response bodies
+import math
+import random  # For latency and error sampling
+import sys
+import threading  # For running the server in the background
+import time  # For simulated latency
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # One thread per connection
+
+CHAT_PATH = "/openai/v1/chat/completions"
+MODELS_PATH = "/openai/v1/models"
+
+
+class MockGroqServer:
+    """
+    Fake chat completions server with configurable behaviour
+
+    Latency before the first token follows a log-normal distribution, like
+    real API latency with its long tail. Tokens are then produced at a fixed
+    rate. A share of requests can be answered with 429 or 5xx errors.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=300, latency_sigma=0.3,
+                 tokens_per_second=500, completion_tokens=300, error_rate_429=0.0,
+                 error_rate_5xx=0.0, retry_after=1, seed=None):
+        """
+        Creates the server (call start() to begin serving)
+
+        Args:
+            host (str): Address to listen on
+            port (int): Port to listen on, 0 picks a free port
+            latency_ms (float): Median time to first token in milliseconds
+            latency_sigma (float): Spread of the log-normal latency, 0 means always the median
+            tokens_per_second (float): Token generation speed after the first token
+            completion_tokens (int): Tokens in each answer, capped by the request's max_tokens
+            error_rate_429 (float): Share of requests answered with 429 (0-1)
+            error_rate_5xx (float): Share of requests answered with 500 or 503 (0-1)
+            retry_after (float): Retry-After header value sent with 429 answers
+            seed (int): Random seed for repeatable runs
+        """
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()  # random.Random isn't safe to share between threads
+
+        # Request counters by outcome
+        self.counts = {"ok": 0, "429": 0, "5xx": 0}
+        self.counts_lock = threading.Lock()
+
+        self.httpd = _QuietHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True  # Don't wait for open connections on shutdown
+        self.thread = None
+
+    @property
+    def url(self):
+        """Full chat completions URL of the running server"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{CHAT_PATH}"
+
+    def start(self):
+        """
+        Starts serving in a background thread
+
+        Returns:
+            MockGroqServer: The server itself, so it can be chained
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops the server and closes its socket"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def sample(self):
+        """
+        Decides how one request is answered
+
+        Returns:
+            tuple: (error status code or None, seconds before the first token)
+        """
+        with self.random_lock:
+            roll = self.random.random()
+            latency = self.latency_ms / 1000 * math.exp(self.random.gauss(0, self.latency_sigma))
+            server_error = self.random.choice((500, 503))
+
+        if roll < self.error_rate_429:
+            return 429, latency
+        if roll < self.error_rate_429 + self.error_rate_5xx:
+            return server_error, latency
+        return None, latency
+
+    def count(self, outcome):
+        """Adds one request to the outcome counters"""
+        with self.counts_lock:
+            self.counts[outcome] += 1
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """HTTP server that doesn't print tracebacks when a client hangs up"""
+
+    # Room for bursts of new connections, the default of 5 drops connections under load
+    request_queue_size = 512
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def _make_handler(server):
+    """Creates the request handler class bound to one MockGroqServer"""
+
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 keeps connections open, like the real API
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            """Keeps the console quiet, benchmarks send thousands of requests"""
+
+        def do_GET(self):
+            """Answers the model list, used for connection warm-up"""
+            if self.path != MODELS_PATH:
+                self._send_json(404, {"error": {"message": "Not found"}})
+                return
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+
+        def do_POST(self):
+            """Answers a chat completion request"""
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path != CHAT_PATH:
+                self._send_json(404, {"error": {"message": "Not found"}})
+                return
+
+            data = json.loads(body or b"{}")
+            status, latency = server.sample()
+
+            if status is not None:
+                # Errors come back fast, like a real overloaded API
+                server.count("429" if status == 429 else "5xx")
+                headers = {"Retry-After": str(server.retry_after)} if status == 429 else {}
+                self._send_json(status, {"error": {"message": f"Mock error {status}"}}, headers)
+                return
+
+            server.count("ok")
+            tokens = min(server.completion_tokens, data.get("max_tokens") or server.completion_tokens)
+            prompt_tokens = sum(len(m.get("content", "")) for m in data.get("messages", [])) // 4
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": tokens,
+                "total_tokens": prompt_tokens + tokens
+            }
+            words = _mock_words(tokens)
+
+            time.sleep(latency)  # Time to first token
+
+            if data.get("stream"):
+                self._stream(words, usage)
+            else:
+                time.sleep(tokens / server.tokens_per_second)  # Time to generate the rest
+                self._send_json(200, {
+                    "object": "chat.completion",
+                    "model": data.get("model", "mock-model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                                 "finish_reason": "stop"}],
+                    "usage": usage
+                })
+
+        def _stream(self, words, usage):
+            """Sends words as server-sent events at the configured token rate"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            # Spread the generation time of all tokens evenly over the words
+            delay = usage["completion_tokens"] / server.tokens_per_second / len(words)
+            try:
+                for i, word in enumerate(words):
+                    delta = word if i == 0 else " " + word
+                    self._send_event({"choices": [{"index": 0, "delta": {"content": delta}}]})
+                    time.sleep(delay)
+                # Last chunk carries token counts, the same way Groq sends them
+                self._send_event({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                                  "x_groq": {"usage": usage}})
+                self._send_chunk(b"data: [DONE]\n\n")
+                self._send_chunk(b"")  # Zero-length chunk ends the body
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client stopped reading early
+
+        def _send_event(self, payload):
+            """Sends one SSE data line"""
+            self._send_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+        def _send_chunk(self, data):
+            """Sends one piece of a chunked response body"""
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, status, payload, headers=None):
+            """Sends a complete JSON response"""
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def _mock_words(tokens):
+    """
+    Creates filler text of about the given token count
+
+    Args:
+        tokens (int): Completion tokens
+
+    Returns:
+        list: Words, with a sentence end every 15 words
+    """
+    word_count = max(1, int(tokens / 1.35))
+    words = []
+    for i in range(word_count):
+        word = "lorem" if i % 15 else "Lorem"
+        if i % 15 == 14 or i == word_count - 1:
+            word += "."
+        words.append(word)
+    return words
+
+
+def main():
+    """Runs the mock server in the foreground"""
+    parser = argparse.ArgumentParser(description="Run a local mock of the Groq chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=300, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="Spread of the latency distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=500)
+    parser.add_argument("--completion-tokens", type=int, default=300)
+    parser.add_argument("--error-429", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Share of requests answered with 5xx")
+    args = parser.parse_args()
+
+    server = MockGroqServer(
+        host=args.host, port=args.port, latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        error_rate_429=args.error_429, error_rate_5xx=args.error_5xx
+    )
+    print(f"Mock Groq API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""
+Routing between several chat completion providers
+This file picks the fastest healthy provider and fails over when one is down
+"""
+
+import threading  # For locking shared provider statistics
+import time  # For measuring calls and cooldowns
+from collections import deque  # For rolling windows of recent calls
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError  # For hedged requests
+from config.settings import (
+    PROVIDER_LATENCY_WINDOW,
+    PROVIDER_FAILURE_LIMIT,
+    PROVIDER_COOLDOWN_SECONDS,
+    HEDGE_REQUESTS,
+    HEDGE_MIN_SAMPLES
+)
+from utils.resilience import (  # For skipping failing providers
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    is_provider_failure
+)
+
+
+def _quantile(values, q):
+    """Returns the nearest-rank quantile of a list, or None for an empty list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Provider:
+    """
+    One chat completions API with rolling health statistics
+
+    Latency is tracked separately for full and streamed calls, because a
+    streamed call is measured until its first token and a full call until
+    the whole text has arrived. A circuit breaker stops sending requests
+    to the provider after repeated failures.
+    """
+
+    def __init__(self, name, client, window=PROVIDER_LATENCY_WINDOW,
+                 failure_limit=PROVIDER_FAILURE_LIMIT, cooldown=PROVIDER_COOLDOWN_SECONDS):
+        """
+        Creates a provider
+
+        Args:
+            name (str): Provider name, e.g. "groq"
+            client (GroqClient): HTTP client pointed at the provider
+            window (int): Number of recent calls kept for statistics
+            failure_limit (int): Failures in a row before the provider's circuit opens
+            cooldown (float): Seconds an open circuit waits before a probe request
+        """
+        self.name = name
+        self.client = client
+        self.breaker = CircuitBreaker(failure_limit, cooldown)
+        self.lock = threading.Lock()
+        self.latencies = {"full": deque(maxlen=window), "stream": deque(maxlen=window)}
+        self.outcomes = deque(maxlen=window)  # True for success, False for failure
+
+    def record(self, mode, seconds, ok):
+        """
+        Adds the result of one call
+
+        Args:
+            mode (str): "full" or "stream"
+            seconds (float): Call latency, None if the call failed before measuring it
+            ok (bool): Whether the call succeeded
+        """
+        with self.lock:
+            self.outcomes.append(ok)
+            if ok and seconds is not None:
+                self.latencies[mode].append(seconds)
+        # Too many failures in a row open the circuit, see CircuitBreaker
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def record_error(self, mode, error):
+        """
+        Adds a failed call, counting it only if the provider is to blame
+
+        Errors that are about the request itself (e.g. 400, 413 or 422) show
+        that the provider is up and answering, so they don't open its circuit.
+
+        Args:
+            mode (str): "full" or "stream"
+            error (Exception): Error raised by the call
+
+        Returns:
+            bool: True if another provider may succeed, False if the request can't succeed anywhere
+        """
+        if not is_provider_failure(error):
+            self.breaker.record_success()
+            return False
+        self.record(mode, None, False)
+        return True
+
+    def healthy(self):
+        """Returns False while the circuit is open or half-open after repeated failures"""
+        return self.breaker.state == CircuitBreaker.CLOSED
+
+    def latency(self, mode, q=0.5):
+        """
+        Returns a latency quantile of recent successful calls
+
+        Args:
+            mode (str): "full" or "stream"
+            q (float): Quantile, 0.5 is the median
+
+        Returns:
+            float: Seconds, or None before the first successful call
+        """
+        with self.lock:
+            return _quantile(list(self.latencies[mode]), q)
+
+    def samples(self, mode):
+        """Returns how many successful calls of a mode are in the window"""
+        with self.lock:
+            return len(self.latencies[mode])
+
+    def error_rate(self):
+        """Returns the share of failed calls in the window, 0 before any call"""
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    def score(self, mode):
+        """
+        Returns the routing score, lower is better
+
+        Median latency is raised by the error rate, so a fast provider that
+        often fails ranks behind a slightly slower reliable one. Providers
+        without measurements score 0 and are tried first, so every provider
+        gets measured, unless they have only failed so far.
+        """
+        median = self.latency(mode)
+        if median is None:
+            return 0.0 if self.error_rate() == 0 else float("inf")
+        return median / max(0.05, 1.0 - self.error_rate())
+
+    def stats(self):
+        """
+        Returns statistics for the performance panel and metrics
+
+        Returns:
+            dict: healthy flag, circuit state, error rate, failures in a row and latency quantiles in ms
+        """
+        report = {
+            "healthy": self.healthy(),
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.times_opened,
+            "error_rate": self.error_rate(),
+            "failures_in_row": self.breaker.failures_in_row
+        }
+        for mode in ("full", "stream"):
+            for name, q in (("p50", 0.5), ("p95", 0.95)):
+                value = self.latency(mode, q)
+                report[f"{mode}_{name}_ms"] = None if value is None else value * 1000
+        return report
+
+
+class ProviderRegistry:
+    """
+    Sends each request to the best provider and fails over to the others
+
+    Providers are ranked by score on every request. A request that fails
+    for a temporary reason is repeated on the next provider, so one
+    provider's outage doesn't stop generation. A request the provider
+    rejects (e.g. 400 or 422) fails at once, it isn't the provider's fault
+    and doesn't count towards its circuit. Providers whose circuit is open are skipped; when every
+    circuit is open, requests fail at once instead of waiting for timeouts.
+    With hedging on, a second provider is asked as well when the first one
+    is slower than its usual p95, and its answer is used if the first fails.
+    """
+
+    def __init__(self, providers, hedge=HEDGE_REQUESTS, hedge_min_samples=HEDGE_MIN_SAMPLES):
+        """
+        Creates the registry
+
+        Args:
+            providers (list): Provider objects, in order of preference for ties
+            hedge (bool): Whether slow requests are hedged on a second provider
+            hedge_min_samples (int): Calls needed before a provider's p95 is used
+        """
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        # Only backup requests of hedged calls run here, the primary request runs on the caller's thread
+        # Backups that aren't needed finish in the background
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+    def get(self, name):
+        """Returns the provider with this name, or None"""
+        for provider in self.providers:
+            if provider.name == name:
+                return provider
+        return None
+
+    def models(self, default_model):
+        """
+        Describes which models may answer a request, for cache keys
+
+        Any configured provider may answer, so a cached result belongs to
+        the whole set of providers and models, not to the request's model.
+
+        Args:
+            default_model (str): Model of the request, used by providers without their own
+
+        Returns:
+            str: Provider and model names, e.g. "groq:llama-3.1-8b-instant|xai:grok-3-mini"
+        """
+        return "|".join(f"{p.name}:{p.client.model or default_model}" for p in self.providers)
+
+    def ranked(self, mode):
+        """
+        Returns providers in the order they should be tried
+
+        Args:
+            mode (str): "full" or "stream"
+
+        Returns:
+            list: Healthy providers by score, then the others by how soon they may be probed
+        """
+        # sorted is stable, so ties keep the configured order
+        healthy = sorted((p for p in self.providers if p.healthy()), key=lambda p: p.score(mode))
+        failing = sorted((p for p in self.providers if not p.healthy()), key=lambda p: p.breaker.retry_after())
+        return healthy + failing
+
+    def retry_after(self):
+        """Returns seconds until the first open circuit lets a probe through"""
+        return min(provider.breaker.retry_after() for provider in self.providers)
+
+    def chat(self, data, call=None, deadline=None):
+        """
+        Sends a chat completion request to the best provider
+
+        Args:
+            data (dict): JSON body of the request, the provider's model is filled in
+            call (dict): Telemetry of the call, gets "provider" and "failovers"
+            deadline (Deadline): Time budget of the whole request, None for no limit
+
+        Returns:
+            tuple: (generated text, usage block or None)
+
+        Raises:
+            CircuitOpenError: If every provider's circuit is open
+            DeadlineExceeded: If the time budget ran out before a provider answered
+            Exception: Error of the last provider if every provider failed
+        """
+        if call is None:
+            call = {}
+        candidates = self.ranked("full")
+        call["failovers"] = 0
+        attempts = 0
+        error = None
+
+        for index, provider in enumerate(candidates):
+            # Skip providers whose circuit is open, asking them would only wait for a timeout
+            if not provider.breaker.allow():
+                continue
+            if deadline is not None:
+                deadline.check()
+            call["failovers"] = attempts
+            attempts += 1
+            backups = candidates[index + 1:]
+            try:
+                if self.hedge and backups:
+                    result, attempt = self._hedged_chat(provider, backups[0], data, call, deadline)
+                else:
+                    result, attempt = self._chat_on(provider, data, deadline)
+                # Keep the telemetry of the request whose answer is used
+                call.update(attempt)
+                return result
+            except Exception as e:
+                if not is_provider_failure(e):
+                    raise  # The request itself was rejected, other providers would reject it too
+                error = e
+
+        if error is None:
+            raise CircuitOpenError(self.retry_after())
+        raise error
+
+    def stream_chat(self, data, on_usage=None, call=None, deadline=None):
+        """
+        Streams a chat completion from the best provider
+
+        Fails over only until the first piece of text arrives; after that
+        the reader has already shown part of the text, so errors are raised.
+
+        Args:
+            data (dict): JSON body of the request
+            on_usage (callable): Called with the "usage" block when it arrives
+            call (dict): Telemetry of the call, gets "provider" and "failovers"
+            deadline (Deadline): Time budget of the whole request, None for no limit
+
+        Yields:
+            str: Next piece of generated text
+
+        Raises:
+            CircuitOpenError: If every provider's circuit is open
+        """
+        if call is None:
+            call = {}
+        call["failovers"] = 0
+        attempts = 0
+        error = None
+
+        for provider in self.ranked("stream"):
+            if not provider.breaker.allow():
+                continue
+            if deadline is not None:
+                deadline.check()
+            call["failovers"] = attempts
+            attempts += 1
+            started = time.perf_counter()
+            stream = provider.client.stream_chat(data, on_usage=on_usage, call=call, deadline=deadline)
+            try:
+                first = next(stream, None)
+            except DeadlineExceeded:
+                raise  # The request ran out of time, that says nothing about the provider
+            except Exception as e:
+                if not provider.record_error("stream", e):
+                    raise  # The request itself was rejected, other providers would reject it too
+                error = e
+                continue
+
+            provider.record("stream", time.perf_counter() - started, True)
+            call["provider"] = provider.name
+            if first is not None:
+                yield first
+            yield from stream
+            return
+
+        if error is None:
+            raise CircuitOpenError(self.retry_after())
+        raise error
+
+    def stats(self):
+        """
+        Returns statistics of every provider
+
+        Returns:
+            dict: provider name -> Provider.stats()
+        """
+        return {provider.name: provider.stats() for provider in self.providers}
+
+    def _chat_on(self, provider, data, deadline=None):
+        """
+        Runs one full request on one provider and records the outcome
+
+        Returns:
+            tuple: ((generated text, usage), telemetry of this request)
+        """
+        attempt = {"provider": provider.name}  # Own record, hedged requests run at the same time
+        started = time.perf_counter()
+        try:
+            result = provider.client.chat(data, call=attempt, deadline=deadline)
+        except DeadlineExceeded:
+            raise  # The request ran out of time, that says nothing about the provider
+        except Exception as e:
+            provider.record_error("full", e)
+            raise
+        provider.record("full", time.perf_counter() - started, True)
+        return result, attempt
+
+    def _hedged_chat(self, primary, backup, data, call, deadline=None):
+        """
+        Sends the request to primary, and also to backup if primary is slow
+
+        Primary runs on the caller's thread, so requests never queue for
+        the hedge pool. If primary hasn't answered within its p95 latency,
+        a timer sends the same request to backup on the pool. When primary
+        then fails, backup's answer is used, and it is already on the way
+        instead of starting after the failure. A primary that does answer
+        keeps its answer, the backup finishes in the background.
+        Until primary has enough measurements, or while backup's circuit is
+        open, no hedge is sent.
+
+        Returns:
+            tuple: ((generated text, usage), telemetry of the answering request)
+        """
+        if primary.samples("full") < self.hedge_min_samples:
+            return self._chat_on(primary, data, deadline)
+
+        lock = threading.Lock()
+        hedge = {"primary_done": False, "backup": None}
+
+        def send_backup():
+            with lock:
+                if hedge["primary_done"] or not backup.breaker.allow():
+                    return
+                call["hedged"] = True
+                hedge["backup"] = self.executor.submit(self._chat_on, backup, data, deadline)
+
+        timer = threading.Timer(primary.latency("full", 0.95), send_backup)
+        timer.daemon = True
+        timer.start()
+        try:
+            return self._chat_on(primary, data, deadline)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if not is_provider_failure(e):
+                raise  # Backup would reject the same request
+            error = e
+        finally:
+            timer.cancel()
+            with lock:
+                hedge["primary_done"] = True
+
+        if hedge["backup"] is None:
+            raise error
+        # Wait for backup, but never past the request's time budget
+        try:
+            return hedge["backup"].result(timeout=None if deadline is None else deadline.remaining())
+        except FutureTimeoutError:
+            raise DeadlineExceeded(deadline)
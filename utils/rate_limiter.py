@@ -0,0 +1,276 @@
+"""
+Request rate limiting and request coalescing
+This file keeps the whole app under the API provider's rate limits
+"""
+
+import asyncio  # For waiting without blocking the event loop
+import threading  # For locks and events shared between sessions
+import time  # For measuring and waiting
+from utils.resilience import DeadlineExceeded  # For giving up when a request runs out of time
+
+
+class TokenBucket:
+    """
+    Classic token bucket
+
+    The bucket refills at a steady rate up to its capacity. Each request
+    takes some tokens out. The balance may go below zero: callers then
+    wait until the bucket has refilled their share, which keeps them in
+    first-come, first-served order without polling.
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        """
+        Creates a full bucket
+
+        Args:
+            capacity (float): Maximum number of tokens (allowed burst size)
+            refill_per_second (float): Tokens added back every second
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self, amount, now):
+        """
+        Takes tokens out of the bucket
+
+        Args:
+            amount (float): Tokens needed
+            now (float): Current time.monotonic() value
+
+        Returns:
+            float: Seconds the caller must wait before using the tokens
+        """
+        # Add tokens for the time passed since the last call
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+
+        # A single request can never need more than a full bucket
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_per_second
+
+    def refund(self, amount):
+        """
+        Puts back tokens of a reservation that won't be used
+
+        Args:
+            amount (float): Tokens that were reserved
+        """
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+
+class RateLimiter:
+    """
+    Process-wide limiter for requests per minute and tokens per minute
+
+    All Streamlit sessions share one instance, so a burst of users waits
+    in line instead of getting 429 errors from the provider.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        """
+        Creates the limiter
+
+        Args:
+            requests_per_minute (int): Allowed requests per minute
+            tokens_per_minute (int): Allowed estimated tokens per minute
+        """
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.lock = threading.Lock()
+
+        # Counters for capacity planning
+        self.waiting = 0  # Requests waiting right now (queue depth)
+        self.max_waiting = 0
+        self.total_requests = 0
+        self.delayed_requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def reserve(self, tokens, deadline=None):
+        """
+        Reserves one request and its tokens without waiting
+
+        Args:
+            tokens (int): Estimated tokens used by the request
+            deadline (Deadline): Time budget of the request, None for no limit
+
+        Returns:
+            float: Seconds to wait before sending the request
+
+        Raises:
+            DeadlineExceeded: If the slot comes after the deadline, nothing is reserved then
+        """
+        with self.lock:
+            now = time.monotonic()
+            # Both limits must allow the request, so wait for the slower one
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+
+            # Don't keep a slot that comes too late, so later requests can use it
+            if deadline is not None and wait > deadline.remaining():
+                self.requests.refund(1)
+                self.tokens.refund(tokens)
+                raise DeadlineExceeded(deadline)
+
+            self.total_requests += 1
+            if wait > 0:
+                self.delayed_requests += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def acquire(self, tokens, deadline=None):
+        """
+        Waits until the request may be sent
+
+        Args:
+            tokens (int): Estimated tokens used by the request
+            deadline (Deadline): Time budget of the request, None for no limit
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            DeadlineExceeded: If the wait would last past the deadline
+        """
+        wait = self.reserve(tokens, deadline)
+        if wait > 0:
+            self._enter_queue()
+            try:
+                time.sleep(wait)
+            finally:
+                self._leave_queue()
+        return wait
+
+    async def acquire_async(self, tokens, deadline=None):
+        """
+        Waits until the request may be sent, without blocking the event loop
+
+        Args:
+            tokens (int): Estimated tokens used by the request
+            deadline (Deadline): Time budget of the request, None for no limit
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            DeadlineExceeded: If the wait would last past the deadline
+        """
+        wait = self.reserve(tokens, deadline)
+        if wait > 0:
+            self._enter_queue()
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # The caller gave up while waiting, e.g. its deadline passed, so the slot is free again
+                with self.lock:
+                    self.requests.refund(1)
+                    self.tokens.refund(tokens)
+                raise
+            finally:
+                self._leave_queue()
+        return wait
+
+    def stats(self):
+        """
+        Returns queue depth and waiting time counters
+
+        Returns:
+            dict: Limiter statistics
+        """
+        with self.lock:
+            return {
+                "queue_depth": self.waiting,
+                "max_queue_depth": self.max_waiting,
+                "total_requests": self.total_requests,
+                "delayed_requests": self.delayed_requests,
+                "average_wait_seconds": self.total_wait / self.total_requests if self.total_requests else 0.0,
+                "max_wait_seconds": self.max_wait
+            }
+
+    def _enter_queue(self):
+        """Counts a request that started waiting"""
+        with self.lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def _leave_queue(self):
+        """Counts a request that finished waiting"""
+        with self.lock:
+            self.waiting -= 1
+
+
+class SingleFlight:
+    """
+    Coalesces identical requests that run at the same time
+
+    The first caller for a key does the work. Callers that arrive while
+    it is still running wait for it and receive the same result.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> [finished event, result, exception]
+        self.coalesced = 0  # Requests that shared another request's result
+
+    def do(self, key, func, deadline=None):
+        """
+        Runs func once for all concurrent callers with the same key
+
+        Args:
+            key (str): Identifies identical requests
+            func (callable): Function without arguments that does the work
+            deadline (Deadline): How long a waiting caller waits at most, None for no limit
+
+        Returns:
+            Result of func, shared by every caller with the same key
+
+        Raises:
+            DeadlineExceeded: If a waiting caller runs out of time first
+            Exception: Whatever func raised, raised for every waiting caller
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = [threading.Event(), None, None]
+                self.calls[key] = call
+                leader = True
+
+        if not leader:
+            # Another caller is already doing the work, wait for its result
+            timeout = None if deadline is None else deadline.remaining()
+            if not call[0].wait(timeout):
+                raise DeadlineExceeded(deadline)
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+
+        try:
+            call[1] = func()
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            # Remove the key first, so later callers start a new request
+            with self.lock:
+                del self.calls[key]
+            call[0].set()
+
+    def stats(self):
+        """
+        Returns coalescing counters
+
+        Returns:
+            dict: Requests running now and requests that shared a result
+        """
+        with self.lock:
+            return {"in_flight": len(self.calls), "coalesced": self.coalesced}
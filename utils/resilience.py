@@ -0,0 +1,257 @@
+"""
+Failure handling for generation requests
+This file has the generation result type, the circuit breaker and request deadlines
+"""
+
+import math
+import threading  # For locking breaker state shared between sessions
+import time  # For measuring deadlines and cooldowns
+
+
+# Status codes worth trying again
+# 429 means too many requests, 5xx means a temporary problem on the server side
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_provider_failure(error):
+    """
+    Tells whether a failed call says something bad about the provider
+
+    No answer at all (lost connection, timeout) or a temporary error status
+    counts against the provider. Any other error status, e.g. 400, 413 or
+    422, means the provider rejected the request itself; another provider
+    would reject it the same way.
+
+    Args:
+        error (Exception): Error raised by the call, API errors have a status_code
+
+    Returns:
+        bool: True if the error should count towards the provider's circuit
+    """
+    status_code = getattr(error, "status_code", None)
+    return status_code is None or status_code in RETRYABLE_STATUS_CODES
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has used up its time budget"""
+
+    def __init__(self, deadline):
+        super().__init__(f"Request took longer than its {deadline.seconds:g} second time budget")
+        self.deadline = deadline
+
+
+class CircuitOpenError(Exception):
+    """Raised when every provider is failing and none may be tried right now"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Every provider is failing right now, try again in {math.ceil(retry_after)} seconds")
+        self.retry_after = retry_after  # Seconds until a provider may be tried again
+
+
+class Deadline:
+    """
+    Point in time by which a whole request must be finished
+
+    One deadline is created per request and handed down to everything the
+    request does: retries, waiting for the rate limiter, failover and the
+    versions generated in parallel. Every step only gets the time that is
+    left, so the request as a whole never runs past its budget. Functions
+    take deadline=None to mean no limit.
+    """
+
+    def __init__(self, seconds):
+        """
+        Starts the deadline
+
+        Args:
+            seconds (float): Time budget from now
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Returns seconds left, at least 0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        """Returns True once the time budget is used up"""
+        return self.remaining() <= 0
+
+    def check(self):
+        """
+        Stops the request if its time is up
+
+        Raises:
+            DeadlineExceeded: If the time budget is used up
+        """
+        if self.expired():
+            raise DeadlineExceeded(self)
+
+    def timeout(self, limit):
+        """
+        Shortens a timeout so it ends by the deadline
+
+        Args:
+            limit (float): Timeout the step would use on its own
+
+        Returns:
+            float: The smaller of limit and the time left
+
+        Raises:
+            DeadlineExceeded: If the time budget is already used up
+        """
+        self.check()
+        return min(limit, self.remaining())
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider that keeps failing
+
+    closed:    requests go through, failures in a row are counted
+    open:      after failure_limit failures in a row, requests fail at once
+               instead of waiting for timeouts, until the cooldown is over
+    half_open: after the cooldown one probe request is let through;
+               success closes the circuit, failure opens it again
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_limit, cooldown):
+        """
+        Creates a closed breaker
+
+        Args:
+            failure_limit (int): Failures in a row that open the circuit
+            cooldown (float): Seconds the circuit stays open before a probe
+        """
+        self.failure_limit = failure_limit
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures_in_row = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.times_opened = 0
+
+    def allow(self):
+        """
+        Asks whether a request may be sent now
+
+        Call this right before sending, because in the half-open state it
+        hands out the single probe.
+
+        Returns:
+            bool: True if the request may be sent
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and now >= self.opened_at + self.cooldown:
+                self.state = self.HALF_OPEN
+                self.probe_started = now
+                return True
+            # A probe that never reported back doesn't block the provider forever
+            if self.state == self.HALF_OPEN and now >= self.probe_started + self.cooldown:
+                self.probe_started = now
+                return True
+            return False
+
+    def record_success(self):
+        """Closes the circuit after a successful request"""
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures_in_row = 0
+
+    def record_failure(self):
+        """Counts a failed request, opening the circuit when there are too many"""
+        with self.lock:
+            self.failures_in_row += 1
+            if self.state == self.HALF_OPEN or self.failures_in_row >= self.failure_limit:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self):
+        """Returns seconds until the next request may be sent, 0 if it may be sent now"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            start = self.opened_at if self.state == self.OPEN else self.probe_started
+            return max(0.0, start + self.cooldown - time.monotonic())
+
+
+class GenerationResult:
+    """
+    Outcome of one generation request
+
+    ok:        text holds the generated text
+    retryable: the request failed for a temporary reason (timeout, rate
+               limit, provider outage), the same request may work later
+    fatal:     the request itself can't succeed (bad key, invalid request),
+               trying again won't help
+    """
+
+    OK = "ok"
+    RETRYABLE = "retryable"
+    FATAL = "fatal"
+
+    def __init__(self, status, text="", error="", status_code=None, retry_after=None, similarity=None):
+        """
+        Creates a result, usually through success() or failure()
+
+        Args:
+            status (str): OK, RETRYABLE or FATAL
+            text (str): Generated text, empty on failure
+            error (str): Error message shown to the user, empty on success
+            status_code (int): HTTP status code of the API error, if there was one
+            retry_after (float): Seconds after which trying again makes sense, if known
+            similarity (float): Set when text was reused from an almost identical earlier prompt
+        """
+        self.status = status
+        self.text = text
+        self.error = error
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.similarity = similarity
+
+    @classmethod
+    def success(cls, text, similarity=None):
+        """Creates a successful result, similarity is set for a reused near-duplicate result"""
+        return cls(cls.OK, text=text, similarity=similarity)
+
+    @classmethod
+    def failure(cls, error, retryable, status_code=None, retry_after=None):
+        """Creates a failed result"""
+        return cls(cls.RETRYABLE if retryable else cls.FATAL, error=error,
+                   status_code=status_code, retry_after=retry_after)
+
+    @property
+    def ok(self):
+        """True if text was generated"""
+        return self.status == self.OK
+
+    @property
+    def retryable(self):
+        """True if the request failed but may work when tried again"""
+        return self.status == self.RETRYABLE
+
+    @property
+    def message(self):
+        """Generated text on success, error message on failure"""
+        return self.text if self.ok else self.error
+
+    def __repr__(self):
+        return f"GenerationResult({self.status!r}, {self.message[:40]!r})"
+
+
+class GenerationError(Exception):
+    """Raised by streaming functions when the text can't be finished"""
+
+    def __init__(self, result):
+        super().__init__(result.error)
+        self.result = result  # Failed GenerationResult
@@ -0,0 +1,198 @@
+"""
+Response cache for generated texts
+This file stores API results so identical requests don't call the API again
+"""
+
+import hashlib  # For creating cache keys
+import json  # For turning key parts into one string
+import os
+import sqlite3  # For the on-disk cache
+import threading  # For locking, many sessions use the cache at the same time
+import time  # For expiry times
+from collections import OrderedDict  # Keeps items in usage order for LRU eviction
+from config.settings import CACHE_DB_PATH, CACHE_MEMORY_SIZE, CACHE_DISK_SIZE, CACHE_TTL_SECONDS
+
+
+class ResponseCache:
+    """
+    Two-tier cache for generated texts
+
+    First tier is a small in-memory LRU (least recently used) dictionary.
+    Second tier is a SQLite file that survives app restarts.
+    Both tiers have a size limit and entries expire after a TTL.
+    """
+
+    def __init__(self, db_path=CACHE_DB_PATH, memory_size=CACHE_MEMORY_SIZE,
+                 disk_size=CACHE_DISK_SIZE, ttl=CACHE_TTL_SECONDS):
+        """
+        Creates the cache and opens the SQLite file
+
+        Args:
+            db_path (str): SQLite file path, None keeps the cache in memory only
+            memory_size (int): Maximum number of entries kept in memory
+            disk_size (int): Maximum number of entries kept on disk
+            ttl (float): Seconds an entry stays valid
+        """
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.memory = OrderedDict()  # key -> (expires_at, text)
+        self.lock = threading.Lock()
+
+        # Hit and miss counters
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # Open the on-disk tier
+        # If the file can't be created, the cache still works in memory
+        self.db = None
+        if db_path:
+            try:
+                folder = os.path.dirname(db_path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                # check_same_thread=False allows use from many threads, the lock keeps it safe
+                self.db = sqlite3.connect(db_path, check_same_thread=False)
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, text TEXT NOT NULL, "
+                    "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self.db.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)")
+                self.db.commit()
+            except (OSError, sqlite3.Error):
+                self.db = None
+
+    @staticmethod
+    def make_key(prompt, content_type, tone, length, model, temperature, variant=0):
+        """
+        Creates a cache key from everything that changes the result
+
+        Args:
+            prompt (str): Normalized user prompt
+            content_type (str): Content type description
+            tone (str): Tone description
+            length (tuple): Minimum and maximum word count
+            model (str): Model name
+            temperature (float): Sampling temperature
+            variant (int): Version number, so each version is cached separately
+
+        Returns:
+            str: SHA-256 hex string
+        """
+        parts = [prompt, content_type, tone, list(length), model, temperature, variant]
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Looks up a cached text
+
+        Args:
+            key (str): Cache key from make_key
+
+        Returns:
+            str: Cached text, or None if there's no valid entry
+        """
+        now = time.time()
+        with self.lock:
+            # First tier: memory
+            entry = self.memory.get(key)
+            if entry is not None:
+                expires_at, text = entry
+                if expires_at > now:
+                    self.memory.move_to_end(key)  # Mark as recently used
+                    self.memory_hits += 1
+                    return text
+                del self.memory[key]  # Expired
+
+            # Second tier: disk
+            if self.db is not None:
+                try:
+                    row = self.db.execute(
+                        "SELECT text, expires_at FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        text, expires_at = row
+                        if expires_at > now:
+                            self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                            self.db.commit()
+                            self._remember(key, expires_at, text)  # Copy into memory tier
+                            self.disk_hits += 1
+                            return text
+                        self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        self.db.commit()
+                except sqlite3.Error:
+                    pass
+
+            self.misses += 1
+            return None
+
+    def set(self, key, text):
+        """
+        Stores a text in both tiers
+
+        Only successful API results should be stored, never error messages.
+
+        Args:
+            key (str): Cache key from make_key
+            text (str): Generated text
+        """
+        now = time.time()
+        expires_at = now + self.ttl
+        with self.lock:
+            self._remember(key, expires_at, text)
+
+            if self.db is not None:
+                try:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO responses (key, text, expires_at, accessed_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, text, expires_at, now)
+                    )
+                    # Remove expired entries, then the least recently used ones over the limit
+                    self.db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                    self.db.execute(
+                        "DELETE FROM responses WHERE key IN ("
+                        "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                        (self.disk_size,)
+                    )
+                    self.db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def clear(self):
+        """Removes every entry from both tiers"""
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                try:
+                    self.db.execute("DELETE FROM responses")
+                    self.db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def stats(self):
+        """
+        Returns cache counters
+
+        Returns:
+            dict: Hits per tier, misses, hit ratio and number of entries in memory
+        """
+        with self.lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": hits / total if total else 0.0,
+                "memory_entries": len(self.memory)
+            }
+
+    def _remember(self, key, expires_at, text):
+        """Puts an entry into the memory tier and evicts the oldest ones over the limit"""
+        self.memory[key] = (expires_at, text)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)  # Oldest entry is at the beginning
@@ -0,0 +1,307 @@
+"""
+Near-duplicate detection for prompts and generated texts
+This file finds similar prompts with MinHash/LSH and compares text versions
+"""
+
+import re  # For finding numbers in prompts
+import threading  # For locking, many sessions share the index
+import zlib  # For fast, stable shingle hashes
+from collections import OrderedDict  # Keeps entries in insertion order for eviction
+from itertools import combinations  # For comparing every pair of versions
+from config.settings import (
+    SIMILARITY_NUM_PERM,
+    SIMILARITY_BANDS,
+    SIMILARITY_THRESHOLD,
+    SIMILARITY_INDEX_SIZE
+)
+from utils.text_processor import clean_text
+
+# Offset added to values copied into empty signature bins
+_PRIME = 4294967291
+
+# Characters removed around prompt words, "cats!" and "cats" are the same word
+_WORD_EDGES = "\"'()[]{}<>.,;:!?-–—*_“”‘’…"
+
+# Numbers inside words too, e.g. the 100 in "X100"
+_NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def shingles(text, size=4):
+    """
+    Splits normalized text into overlapping character pieces
+
+    Character pieces work well for short prompts, where a changed word or
+    an extra space only changes a few pieces.
+
+    Args:
+        text (str): Text to split, normalized with clean_text and lowercased
+        size (int): Characters per piece
+
+    Returns:
+        set: Distinct pieces, the whole text if it is shorter than size
+    """
+    normalized = clean_text(text).lower()
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def word_shingles(text, size=3):
+    """
+    Splits text into overlapping word groups
+
+    Args:
+        text (str): Text to split
+        size (int): Words per group
+
+    Returns:
+        set: Distinct word groups, lowercased
+    """
+    words = clean_text(text).lower().split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def prompt_words(text):
+    """
+    Splits a prompt into its distinct words, ignoring punctuation
+
+    Used to confirm near-duplicate prompts. Single words are compared, not
+    word groups, so one reworded adjective only changes one word.
+
+    Args:
+        text (str): Prompt to split
+
+    Returns:
+        set: Distinct words, lowercased
+    """
+    words = (word.strip(_WORD_EDGES) for word in clean_text(text).lower().split())
+    return {word for word in words if word}
+
+
+def numbers(text):
+    """
+    Finds all numbers in a text
+
+    Args:
+        text (str): Text to search
+
+    Returns:
+        list: Numbers as strings, in order, e.g. ["100", "2"] for "X100 in 2 colors"
+    """
+    return _NUMBER_PATTERN.findall(text)
+
+
+def jaccard(a, b):
+    """
+    Returns the exact Jaccard similarity of two sets
+
+    Args:
+        a (set): First set
+        b (set): Second set
+
+    Returns:
+        float: Shared items divided by all items, 1.0 for two empty sets
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def pairwise_similarity(texts, threshold=None):
+    """
+    Compares every pair of texts by their shared word groups
+
+    Args:
+        texts (list): Texts to compare, e.g. the versions of one request
+        threshold (float): Only return pairs at least this similar, None returns all
+
+    Returns:
+        list: (index a, index b, similarity 0-1) tuples, most similar first
+    """
+    sets = [word_shingles(text) for text in texts]
+    pairs = []
+    for i, j in combinations(range(len(texts)), 2):
+        score = jaccard(sets[i], sets[j])
+        if threshold is None or score >= threshold:
+            pairs.append((i, j, score))
+    pairs.sort(key=lambda pair: pair[2], reverse=True)
+    return pairs
+
+
+class MinHasher:
+    """
+    Turns a set of shingles into a short MinHash signature
+
+    The share of equal positions in two signatures estimates the Jaccard
+    similarity of the two sets, without keeping the sets themselves.
+
+    Uses one-permutation hashing: each shingle is hashed once and goes to
+    one of num_perm bins, and each bin keeps its smallest hash. This costs
+    one hash per shingle instead of num_perm. Empty bins copy the next
+    filled bin, so short texts still get a full signature.
+    """
+
+    def __init__(self, num_perm=SIMILARITY_NUM_PERM, seed=1):
+        """
+        Creates the hasher
+
+        Args:
+            num_perm (int): Signature length, more is more accurate
+            seed (int): Hash seed, must be the same for signatures that are compared
+        """
+        self.num_perm = num_perm
+        self.seed = seed
+
+    def signature(self, items):
+        """
+        Calculates the MinHash signature of a set
+
+        Args:
+            items (set): Shingles
+
+        Returns:
+            tuple: num_perm integers
+        """
+        bins = [None] * self.num_perm
+        for item in items:
+            # crc32 with a seed is fast and gives the same hash in every process
+            h = zlib.crc32(item.encode("utf-8"), self.seed)
+            index = h % self.num_perm
+            value = h // self.num_perm
+            if bins[index] is None or value < bins[index]:
+                bins[index] = value
+
+        # Fill empty bins from the next filled bin to the right
+        # The distance is mixed in so copied values don't collide with real ones
+        filled = [i for i, value in enumerate(bins) if value is not None]
+        if not filled:
+            return tuple([0] * self.num_perm)
+        signature = list(bins)
+        for i, value in enumerate(bins):
+            if value is None:
+                j = next((k for k in filled if k > i), filled[0] + self.num_perm)
+                signature[i] = bins[j % self.num_perm] + (j - i) * _PRIME
+        return tuple(signature)
+
+
+def estimate_similarity(signature_a, signature_b):
+    """Returns the share of equal positions in two MinHash signatures"""
+    equal = sum(1 for x, y in zip(signature_a, signature_b) if x == y)
+    return equal / len(signature_a)
+
+
+class NearDuplicateIndex:
+    """
+    Finds earlier prompts that are almost the same as a new one
+
+    Locality-sensitive hashing splits each signature into bands. Prompts
+    that share at least one whole band are candidates, so a lookup only
+    checks a handful of entries instead of every stored prompt.
+    Candidates are confirmed with the exact similarity of the words of the
+    two prompts, and must contain the same numbers: "Acme X100" and
+    "Acme X200" look almost the same but are about different products.
+
+    Entries live in memory and the oldest are dropped past max_entries.
+    A scope string keeps prompts apart that must never match, e.g. prompts
+    with a different tone or length.
+    """
+
+    def __init__(self, num_perm=SIMILARITY_NUM_PERM, bands=SIMILARITY_BANDS,
+                 threshold=SIMILARITY_THRESHOLD, max_entries=SIMILARITY_INDEX_SIZE):
+        """
+        Creates an empty index
+
+        Args:
+            num_perm (int): Signature length, must be divisible by bands
+            bands (int): Number of bands, more bands find less similar candidates
+            threshold (float): Minimum word similarity of a match
+            max_entries (int): Maximum number of stored prompts
+        """
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # value -> (scope, signature, normalized text)
+        self.buckets = {}  # (scope, band number, band values) -> set of values
+        self.lock = threading.Lock()
+
+    def _band_keys(self, scope, signature):
+        """Returns the bucket key of every band of a signature"""
+        return [
+            (scope, band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def add(self, text, value, scope=""):
+        """
+        Stores a prompt
+
+        Args:
+            text (str): Prompt to index
+            value (str): What a match returns, e.g. a cache key
+            scope (str): Only lookups with the same scope can match
+        """
+        signature = self.hasher.signature(shingles(text))
+        with self.lock:
+            if value in self.entries:
+                self._remove(value)
+            self.entries[value] = (scope, signature, clean_text(text).lower())
+            for key in self._band_keys(scope, signature):
+                self.buckets.setdefault(key, set()).add(value)
+
+            # Drop the oldest prompts past the size limit
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def find(self, text, scope="", threshold=None):
+        """
+        Finds the most similar stored prompt
+
+        Args:
+            text (str): New prompt
+            scope (str): Only entries added with this scope can match
+            threshold (float): Minimum similarity, None uses the index default
+
+        Returns:
+            tuple: (value, similarity), or None if nothing is similar enough
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature = self.hasher.signature(shingles(text))
+        best = None
+        with self.lock:
+            candidates = set()
+            for key in self._band_keys(scope, signature):
+                candidates.update(self.buckets.get(key, ()))
+            # Cheap signature estimate first, with some margin for its error
+            # The estimate compares characters, a changed word changes several of them
+            likely = [
+                (value, self.entries[value][2]) for value in candidates
+                if estimate_similarity(signature, self.entries[value][1]) >= threshold - 0.15
+            ]
+
+        # Confirm with the exact similarity of the prompts themselves
+        query = prompt_words(text)
+        query_numbers = numbers(clean_text(text).lower())
+        for value, stored_text in likely:
+            if numbers(stored_text) != query_numbers:
+                continue
+            score = jaccard(query, prompt_words(stored_text))
+            if score >= threshold and (best is None or score > best[1]):
+                best = (value, score)
+        return best
+
+    def _remove(self, value):
+        """Deletes one entry and its bucket references, the lock must be held"""
+        scope, signature, _ = self.entries.pop(value)
+        for key in self._band_keys(scope, signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(value)
+                if not bucket:
+                    del self.buckets[key]
+
+    def __len__(self):
+        return len(self.entries)
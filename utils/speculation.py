@@ -0,0 +1,113 @@
+"""
+Speculative generation while the user is still choosing
+This file starts a request in the background once the inputs stop changing
+"""
+
+import time  # For the debounce window
+from concurrent.futures import ThreadPoolExecutor  # For background requests
+from config.settings import SPECULATIVE_DEBOUNCE_SECONDS, SPECULATIVE_MAX_WORKERS
+
+# Background requests of all sessions share these threads
+# Few threads are enough, a speculative request only saves the user some waiting
+_executor = ThreadPoolExecutor(max_workers=SPECULATIVE_MAX_WORKERS, thread_name_prefix="speculative")
+
+
+class Speculator:
+    """
+    Generates a text before the user asks for it
+
+    Every rerun reports the current inputs with update(). Once they have
+    stayed the same for the debounce window, start() sends the request in
+    the background. When the user clicks generate, adopt() hands over the
+    running or finished request if it was made for the same inputs.
+
+    Changing the inputs cancels a request that is still queued. A request
+    that is already running can't be stopped, its result is dropped here
+    but still lands in the response cache.
+    """
+
+    IDLE = "idle"  # Nothing to generate
+    WAITING = "waiting"  # Inputs changed recently, debounce window still running
+    RUNNING = "running"  # Request sent, no answer yet
+    READY = "ready"  # Text is generated and waiting for the click
+    FAILED = "failed"  # Request failed, the click will try again normally
+    USED = "used"  # Request was adopted, nothing more to do for these inputs
+
+    def __init__(self, func, debounce=SPECULATIVE_DEBOUNCE_SECONDS):
+        """
+        Creates an idle speculator
+
+        Args:
+            func (callable): Generation function, called as func(*args) and returning a GenerationResult
+            debounce (float): Seconds the inputs must stay the same before a request is sent
+        """
+        self.func = func
+        self.debounce = debounce
+        self.args = None  # Arguments seen last, None when there is nothing to generate
+        self.changed_at = 0.0
+        self.future = None  # Background request for self.args
+        self.used = False  # True once the click took over these arguments
+
+    def update(self, args):
+        """
+        Reports the current inputs
+
+        Args:
+            args (tuple): Arguments for func, None when the inputs can't be generated early
+        """
+        if args == self.args:
+            return
+        self._drop()
+        self.args = args
+        self.changed_at = time.monotonic()
+        self.used = False
+
+    def ready(self):
+        """Returns True if the inputs have settled and no request was sent for them yet"""
+        return (
+            self.args is not None
+            and self.future is None
+            and not self.used
+            and time.monotonic() - self.changed_at >= self.debounce
+        )
+
+    def start(self):
+        """Sends the request for the current inputs in the background"""
+        self.future = _executor.submit(self.func, *self.args)
+
+    def adopt(self, args):
+        """
+        Hands over the background request when the user clicks generate
+
+        Afterwards these inputs count as done, so the same request isn't
+        sent again in the background.
+
+        Args:
+            args (tuple): Arguments of the request the user asked for
+
+        Returns:
+            Future: Running or finished request for args, None if there is none
+        """
+        future = self.future if args == self.args else None
+        if future is None:
+            self._drop()
+        self.future = None
+        self.args = args
+        self.used = True
+        return future
+
+    def state(self):
+        """Returns one of the state constants, for showing progress"""
+        if self.used:
+            return self.USED
+        if self.future is not None:
+            if not self.future.done():
+                return self.RUNNING
+            return self.READY if self.future.result().ok else self.FAILED
+        return self.IDLE if self.args is None else self.WAITING
+
+    def _drop(self):
+        """Forgets the background request, cancelling it if it hasn't started yet"""
+        if self.future is not None:
+            self.future.cancel()
+            self.future = None
@@ -3,6 +3,29 @@ Text processing and analysis functions
 This file processes and analyzes generated texts
 """
 
+import hashlib  # For memoizing results by text hash
+import os
+import re  # For splitting text into tokens
+import threading  # For locking the shared result cache
+from collections import Counter, OrderedDict, deque  # For n-gram counts and the result cache
+from concurrent.futures import ProcessPoolExecutor  # For batch analysis on every CPU core
+from itertools import repeat
+from config.settings import ANALYSIS_CACHE_SIZE, ANALYSIS_PARALLEL_THRESHOLD
+
+# A token is either a run of non-space characters (a word) or a blank line
+_TOKEN_PATTERN = re.compile(r"\S+|\n[^\S\n]*\n")
+
+# Last word of a piece and the spaces before it
+_TRAILING_PATTERN = re.compile(r"\s*\S*\Z")
+
+_VOWEL_GROUPS = re.compile(r"[aeiouy]+")
+_PUNCTUATION = "\"'()[]{}<>.,;:!?-–—*_“”‘’…"
+_CLOSING = "\"')]}”’*_"
+
+# Recent analysis results, keyed by text hash
+_analysis_cache = OrderedDict()
+_analysis_lock = threading.Lock()
+
 
 def count_words(text):
     """
@@ -60,4 +83,257 @@ def truncate_text(text, max_words):
     truncated = ' '.join(words[:max_words])
 
     # Add three dots at the end so user knows it's truncated
-    return truncated + "..."
\ No newline at end of file
+    return truncated + "..."
+
+
+def trim_to_words(text, max_words):
+    """
+    Shortens text to at most max_words words, ending at a full sentence
+
+    Unlike truncate_text, line breaks are kept and no dots are added, so
+    the result can be used as finished text.
+
+    Args:
+        text (str): Text to be shortened
+        max_words (int): Maximum word count
+
+    Returns:
+        str: Shortened text, unchanged if it is already short enough
+    """
+    # Positions of every word, so the cut keeps the original spacing
+    words = list(re.finditer(r"\S+", text))
+    if len(words) <= max_words:
+        return text
+
+    kept = words[:max_words]
+    # Go back to the last word that ends a sentence
+    for word in reversed(kept):
+        if word.group().rstrip(_CLOSING).endswith((".", "!", "?")):
+            return text[:word.end()]
+    # No sentence end at all, cut after the last allowed word
+    return text[:kept[-1].end()]
+
+
+class TextAnalyzer:
+    """
+    Computes all text statistics in a single pass
+
+    Text can be given all at once or piece by piece with feed(), for example
+    while a streamed answer is arriving. A word cut in half between two
+    pieces is held back until the next piece completes it.
+    """
+
+    def __init__(self, ngram_size=2, top_k=5):
+        """
+        Creates an empty analyzer
+
+        Args:
+            ngram_size (int): Number of words in each n-gram (2 = word pairs)
+            top_k (int): How many of the most common n-grams to report
+        """
+        self.ngram_size = ngram_size
+        self.top_k = top_k
+        self.carry = ""  # Unfinished end of the last piece
+
+        self.words = 0
+        self.sentences = 0
+        self.paragraphs = 0
+        self.letters = 0
+        self.syllables = 0
+        self.in_sentence = False  # True if words were seen since the last sentence end
+        self.in_paragraph = False  # True if words were seen since the last blank line
+        self.recent = deque(maxlen=ngram_size)  # Last few normalized words for n-grams
+        self.ngrams = Counter()
+
+    def feed(self, chunk):
+        """
+        Adds the next piece of text
+
+        Args:
+            chunk (str): Next piece of text
+        """
+        text = self.carry + chunk
+
+        # Hold back the last word and the spaces before it, they may continue in the next piece
+        cut = _TRAILING_PATTERN.search(text).start()
+        self.carry = text[cut:]
+        self._scan(text[:cut])
+
+    def fed_words(self):
+        """Returns the number of words fed so far, the held back word included"""
+        return self.words + (1 if self.carry.strip() else 0)
+
+    def at_sentence_end(self):
+        """
+        Tells whether the text fed so far ends with a finished sentence
+
+        The held back word counts too: after "Four. Five" the text is in a
+        new sentence, even though "Five" wasn't counted yet.
+
+        Returns:
+            bool: True if the last word fed ends with . ! or ?
+        """
+        last_word = self.carry.strip()
+        if last_word:
+            return last_word.rstrip(_CLOSING).endswith((".", "!", "?"))
+        return not self.in_sentence
+
+    def result(self):
+        """
+        Finishes the analysis and returns the statistics
+
+        Returns:
+            dict: words, sentences, paragraphs, average_word_length,
+                  readability (Flesch reading ease) and top_ngrams
+        """
+        self._scan(self.carry)
+        self.carry = ""
+
+        # Text that doesn't end with punctuation still has a last sentence
+        sentences = self.sentences + (1 if self.in_sentence else 0)
+        paragraphs = self.paragraphs + (1 if self.in_paragraph else 0)
+
+        if self.words:
+            average_word_length = self.letters / self.words
+            # Flesch reading ease: higher is easier, 60-70 is plain English
+            readability = (206.835 - 1.015 * (self.words / sentences)
+                           - 84.6 * (self.syllables / self.words))
+        else:
+            average_word_length = 0.0
+            readability = 0.0
+
+        return {
+            "words": self.words,
+            "sentences": sentences,
+            "paragraphs": paragraphs,
+            "average_word_length": round(average_word_length, 2),
+            "readability": round(readability, 1),
+            "top_ngrams": [(" ".join(gram), count) for gram, count in self.ngrams.most_common(self.top_k)]
+        }
+
+    def _scan(self, text):
+        """Counts every word and paragraph break in text"""
+        for match in _TOKEN_PATTERN.finditer(text):
+            token = match.group()
+
+            # Blank line ends the paragraph and the sentence
+            if token.isspace():
+                if self.in_paragraph:
+                    self.paragraphs += 1
+                    self.in_paragraph = False
+                if self.in_sentence:
+                    self.sentences += 1
+                    self.in_sentence = False
+                self.recent.clear()
+                continue
+
+            # Every other token is a word, same rule as count_words
+            self.words += 1
+            self.in_sentence = True
+            self.in_paragraph = True
+
+            word = token.strip(_PUNCTUATION).lower()
+            if word:
+                self.letters += len(word)
+                self.syllables += _count_syllables(word)
+                self.recent.append(word)
+                if len(self.recent) == self.ngram_size:
+                    self.ngrams[tuple(self.recent)] += 1
+
+            # Word ending with . ! or ? (maybe followed by a quote or bracket) ends a sentence
+            if token.rstrip(_CLOSING).endswith((".", "!", "?")):
+                self.sentences += 1
+                self.in_sentence = False
+
+
+def analyze_text(text, ngram_size=2, top_k=5):
+    """
+    Returns all statistics of a text, remembering recent results
+
+    The same text is analyzed only once; later calls (for example on every
+    Streamlit rerun) return the saved result.
+
+    Args:
+        text (str): Text to analyze
+        ngram_size (int): Number of words in each n-gram
+        top_k (int): How many of the most common n-grams to report
+
+    Returns:
+        dict: Statistics from TextAnalyzer.result(), shared between callers so don't modify it
+    """
+    key = (hashlib.sha1(text.encode("utf-8")).hexdigest(), ngram_size, top_k)
+
+    with _analysis_lock:
+        stats = _analysis_cache.get(key)
+        if stats is not None:
+            _analysis_cache.move_to_end(key)  # Mark as recently used
+            return stats
+
+    stats = _analyze_uncached(text, ngram_size, top_k)
+
+    with _analysis_lock:
+        _analysis_cache[key] = stats
+        while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)  # Forget the oldest result
+    return stats
+
+
+def analyze_batch(texts, ngram_size=2, top_k=5, workers=None):
+    """
+    Analyzes many texts at once
+
+    Identical texts are analyzed only once. Large batches are split across
+    CPU cores with a process pool, so thousands of texts don't run one by
+    one in a single Python loop.
+
+    Args:
+        texts (list): Texts to analyze
+        ngram_size (int): Number of words in each n-gram
+        top_k (int): How many of the most common n-grams to report
+        workers (int): Number of processes, None uses every CPU core
+
+    Returns:
+        list: One statistics dict per text, in the same order as texts
+    """
+    # Remove duplicates but remember where every text goes back
+    unique_texts = list(dict.fromkeys(texts))
+
+    if len(unique_texts) < ANALYSIS_PARALLEL_THRESHOLD:
+        # Small batch, starting processes would cost more than it saves
+        results = [analyze_text(text, ngram_size, top_k) for text in unique_texts]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # chunksize sends texts in groups, so each process gets fewer, larger jobs
+            chunksize = max(1, len(unique_texts) // ((workers or os.cpu_count() or 1) * 4))
+            results = list(executor.map(
+                _analyze_uncached, unique_texts,
+                repeat(ngram_size), repeat(top_k),
+                chunksize=chunksize
+            ))
+
+    by_text = dict(zip(unique_texts, results))
+    return [by_text[text] for text in texts]
+
+
+def _analyze_uncached(text, ngram_size, top_k):
+    """Runs a fresh TextAnalyzer over the whole text"""
+    analyzer = TextAnalyzer(ngram_size, top_k)
+    analyzer.feed(text)
+    return analyzer.result()
+
+
+def _count_syllables(word):
+    """
+    Estimates syllables in a lowercase word by counting vowel groups
+
+    Args:
+        word (str): Lowercase word
+
+    Returns:
+        int: Syllable count, at least 1
+    """
+    count = len(_VOWEL_GROUPS.findall(word))
+    # Silent e at the end ("make") isn't a syllable, but "le" ("table") is
+    if word.endswith("e") and not word.endswith("le") and count > 1:
+        count -= 1
+    return max(1, count)
@@ -0,0 +1,144 @@
+"""
+Token budget planning for generation requests
+This file sizes max_tokens from the selected length and tracks length drift
+"""
+
+import math
+import threading  # For locking the shared drift counters
+from config.settings import TOKENS_PER_WORD, TOKEN_BUDGET_HEADROOM, TOKEN_BUDGET_SLACK, LENGTH_OVERRUN_FACTOR
+from utils.text_processor import TextAnalyzer
+
+
+def estimate_tokens(text):
+    """
+    Estimates how many tokens a text uses, without calling the API
+
+    English text averages about 4 characters or 0.75 words per token.
+    The larger of the two estimates is used, so short words with lots of
+    punctuation aren't underestimated.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    by_characters = len(text) / 4
+    by_words = len(text.split()) * TOKENS_PER_WORD
+    return math.ceil(max(by_characters, by_words))
+
+
+def plan_max_tokens(length):
+    """
+    Calculates max_tokens for a length option
+
+    The budget covers the maximum word count plus some headroom, so the
+    model can finish its last sentence but can't run far past the target.
+
+    Args:
+        length (tuple): Minimum and maximum word count
+
+    Returns:
+        int: max_tokens value for the request
+    """
+    return math.ceil(length[1] * TOKENS_PER_WORD * TOKEN_BUDGET_HEADROOM) + TOKEN_BUDGET_SLACK
+
+
+class LengthGuard:
+    """
+    Watches a streamed text and tells when it is clearly too long
+
+    Once the word count passes the maximum by LENGTH_OVERRUN_FACTOR, the
+    stream is stopped at the next sentence end.
+    """
+
+    def __init__(self, length, overrun_factor=LENGTH_OVERRUN_FACTOR):
+        """
+        Creates the guard
+
+        Args:
+            length (tuple): Minimum and maximum word count
+            overrun_factor (float): How far past the maximum the text may go
+        """
+        self.word_limit = length[1] * overrun_factor
+        self.analyzer = TextAnalyzer()  # Counts words piece by piece
+
+    def should_stop(self, delta):
+        """
+        Adds the next piece of text and checks the length
+
+        Args:
+            delta (str): Next piece of streamed text
+
+        Returns:
+            bool: True if generation should stop after this piece
+        """
+        self.analyzer.feed(delta)
+        # Stop only between sentences, so the text doesn't end mid-sentence
+        # The analyzer holds back the last word, so it is checked as well
+        return self.analyzer.fed_words() > self.word_limit and self.analyzer.at_sentence_end()
+
+
+class DriftTracker:
+    """
+    Collects actual versus target length for every length option
+
+    Word drift is how many words a text is outside its target range
+    (negative = too short, positive = too long, 0 = inside the range).
+    Budget use is completion tokens reported by the API divided by max_tokens.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}  # (min, max) -> counters
+
+    def record(self, length, word_count, usage, max_tokens):
+        """
+        Records one finished generation
+
+        Args:
+            length (tuple): Minimum and maximum word count
+            word_count (int): Words in the generated text
+            usage (dict): "usage" block from the API response, may be None
+            max_tokens (int): Budget that was sent with the request
+        """
+        low, high = length
+        drift = word_count - min(max(word_count, low), high)
+
+        with self.lock:
+            totals = self.totals.setdefault(tuple(length), {
+                "calls": 0, "in_range": 0, "drift_sum": 0,
+                "usage_calls": 0, "completion_tokens": 0, "budget_use_sum": 0.0
+            })
+            totals["calls"] += 1
+            totals["drift_sum"] += drift
+            if drift == 0:
+                totals["in_range"] += 1
+
+            completion_tokens = (usage or {}).get("completion_tokens")
+            if completion_tokens is not None:
+                totals["usage_calls"] += 1
+                totals["completion_tokens"] += completion_tokens
+                totals["budget_use_sum"] += completion_tokens / max_tokens
+
+    def stats(self):
+        """
+        Returns average drift per length option
+
+        Returns:
+            dict: "min-max" label -> calls, share in range, average word drift,
+                  average completion tokens and average budget use
+        """
+        report = {}
+        with self.lock:
+            for (low, high), totals in self.totals.items():
+                calls = totals["calls"]
+                usage_calls = totals["usage_calls"]
+                report[f"{low}-{high}"] = {
+                    "calls": calls,
+                    "in_range_ratio": totals["in_range"] / calls,
+                    "average_word_drift": totals["drift_sum"] / calls,
+                    "average_completion_tokens": totals["completion_tokens"] / usage_calls if usage_calls else None,
+                    "average_budget_use": totals["budget_use_sum"] / usage_calls if usage_calls else None
+                }
+        return report